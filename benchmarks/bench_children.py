@@ -0,0 +1,84 @@
+"""
+Measures the lookup of the element under the cursor in the starlark model behind go to definition:
+
+    python benchmarks/bench_children.py
+
+- binary search in Children compared with a linear scan of the children, in a list with 'elements' entries
+"""
+
+import argparse
+import ast
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plugin")
+)
+
+import starlark
+from label import Label
+
+
+def measure(name, function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:40} {best * 1e6:12.1f} us")
+
+
+def linear_find(children, cursor):
+    for child in children.children:
+        if child.covers(cursor):
+            return child
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = (
+        "filegroup(\n"
+        '    name = "big",\n'
+        "    srcs = [\n"
+        + "".join(f'        "file{i}.txt",\n' for i in range(args.elements))
+        + "    ],\n)\n"
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, _ = starlark.parse_module(
+            ast.parse(text), Label(package="pkg", target="BUILD"), "/nonexistent"
+        )
+    cursor = starlark.Cursor(row=args.elements // 2 + 4, col=10)
+    children = None
+    # the list expression is the deepest node with more than one child
+    stack = [model]
+    while stack:
+        node = stack.pop()
+        found = getattr(node, "children", None)
+        if isinstance(found, starlark.Children) and len(found.children) > 1:
+            children = found
+        for child in vars(node).values():
+            if hasattr(child, "covers") and child.covers(cursor):
+                stack.append(child)
+            elif isinstance(child, list):
+                stack.extend(
+                    c for c in child if hasattr(c, "covers") and c.covers(cursor)
+                )
+    print(f"list with {len(children.children)} elements, cursor at row {cursor.row}")
+    measure("Children.find (bisect)", lambda: children.find(cursor), args.repeat)
+    measure(
+        "linear scan of the children",
+        lambda: linear_find(children, cursor),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures the label completion index on a workspace (see generate_workspace.py):
+
+    python benchmarks/bench_completion.py /tmp/bench_ws
+
+- building the index, which evaluates all BUILD files
+- completions: packages, subpackages, all targets and targets with a prefix
+- updating a changed BUILD file and the first completion after it
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plugin")
+)
+
+from completion import LabelIndex
+
+
+def measure(name, function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    count = len(result) if isinstance(result, list) else ""
+    print(f"{name:40} {best * 1000:10.2f} ms {count:>6}")
+
+
+def touch(path):
+    with open(path, "a") as f:
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    root = os.path.abspath(args.root)
+
+    start = time.perf_counter()
+    index = LabelIndex(root)
+    index.build()
+    seconds = time.perf_counter() - start
+    print(f"label index: {len(index.files)} BUILD files in {seconds * 1000:.0f} ms")
+    for prefix, package in [
+        ("//", None),
+        ("//proj1/m", None),
+        ("//proj1/mod2/pkg1", None),
+        ("//proj1/mod2/pkg3:", None),
+        ("//proj1/mod2/pkg3:pkg3_lib1", None),
+        (":pkg3_l", "proj1/mod2/pkg3"),
+    ]:
+        measure(
+            f"complete {prefix!r}",
+            lambda: index.complete(prefix, package),
+            args.repeat,
+        )
+
+    path = next(iter(index.files))
+    touch(path)
+    measure("update_file", lambda: index.update_file(path), 1)
+    measure("first completion after it", lambda: index.complete("//"), 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares the crawler with os.walk on a workspace (see generate_workspace.py):
+
+    python benchmarks/bench_crawler.py /tmp/bench_ws
+
+Run it once before measuring to warm the file system cache, or drop the caches for cold numbers.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plugin")
+)
+
+import crawler
+from workspace import is_starlark_file
+
+
+def walk_following_symlinks(root):
+    for directory, _, files in os.walk(root, followlinks=True):
+        for name in files:
+            if is_starlark_file(name):
+                yield os.path.join(directory, name)
+
+
+def walk_pruned(root):
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = [
+            name for name in subdirectories if not name.startswith(("bazel-", "."))
+        ]
+        for name in files:
+            if is_starlark_file(name):
+                yield os.path.join(directory, name)
+
+
+def measure(name, function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in function())
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:24} {best * 1000:8.1f} ms {count:8} files")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    root = os.path.abspath(args.root)
+
+    measure("os.walk followlinks", lambda: walk_following_symlinks(root), args.repeat)
+    measure("os.walk pruned", lambda: walk_pruned(root), args.repeat)
+    for jobs in (1, 2, 4, 8, 16, None):
+        measure(
+            f"crawler jobs={jobs or crawler.DEFAULT_JOBS}",
+            lambda: crawler.find_starlark_files(root, jobs),
+            args.repeat,
+        )
+    start = time.perf_counter()
+    packages = crawler.find_packages(root)
+    next(packages)
+    print(f"first package after {(time.perf_counter() - start) * 1000:.1f} ms")
+    packages.close()
+    print(f"{os.cpu_count()} cores")
+
+
+if __name__ == "__main__":
+    main()
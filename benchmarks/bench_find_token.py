@@ -0,0 +1,71 @@
+"""
+Measures the lookup of the token under the cursor behind go to definition and get label on a large generated BUILD
+file:
+
+    python benchmarks/bench_find_token.py
+
+- the token under the cursor from its statement (find_token_at) compared with parsing the whole buffer (find_node),
+  on a BUILD file with 'targets' genrules with multi-line commands
+"""
+
+import argparse
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plugin")
+)
+
+from bazel import find_node, find_token_at
+
+
+def measure(name, function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:40} {best * 1e6:12.1f} us")
+
+
+def genrules(count):
+    return "".join(f'''genrule(
+    name = "gen{i}",
+    srcs = ["in{i}.txt"],
+    outs = ["out{i}.txt"],
+    cmd = """
+cat $< > $@
+echo done >> $@
+""",
+)
+
+''' for i in range(count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--targets", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = genrules(args.targets)
+    # the srcs of the target in the middle of the file
+    row = text.count("\n") // 2
+    row -= (row - 1) % 11 - 2
+    col = 12
+    print(f"BUILD file with {text.count(chr(10))} lines, cursor at {row}:{col}")
+    assert find_token_at(text, row, col) is not None
+    measure(
+        "find_token_at (statement)", lambda: find_token_at(text, row, col), args.repeat
+    )
+    measure(
+        "find_node (whole file)",
+        lambda: find_node(ast.parse(text), row, col),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures the symbol index on a workspace (see generate_workspace.py):
+
+    python benchmarks/bench_symbols.py /tmp/bench_ws
+
+- building the index and preparing its search structures
+- searches: prefix, substring, fuzzy and without any match
+- updating a changed file, the first search after it (without waiting for the search structures like the editor and
+  waiting for them like the command line interface)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plugin")
+)
+
+from symbols import SymbolIndex
+
+
+def measure(name, function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    count = len(result) if isinstance(result, list) else ""
+    print(f"{name:40} {best * 1000:10.2f} ms {count:>6}")
+
+
+def touch(path):
+    with open(path, "a") as f:
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    root = os.path.abspath(args.root)
+
+    start = time.perf_counter()
+    index = SymbolIndex(root)
+    index.build()
+    seconds = time.perf_counter() - start
+    print(f"symbol index: {len(index.files)} files in {seconds * 1000:.0f} ms")
+    measure("prepare", index.prepare, 1)
+    for query in ["sym", "sym_1_", "sym_500_3", "info", "s5003", "no_such_symbol"]:
+        measure(f"search {query!r}", lambda: index.search(query), args.repeat)
+
+    path = next(path for path in index.files if path.startswith(root))
+    touch(path)
+    measure("update_file", lambda: index.update_file(path), 1)
+    measure(
+        "first search after it without wait",
+        lambda: index.search("sym", wait=False),
+        1,
+    )
+    index.preparing.join()
+    touch(path)
+    index.update_file(path)
+    measure("first search after it with wait", lambda: index.search("sym"), 1)
+
+
+if __name__ == "__main__":
+    main()
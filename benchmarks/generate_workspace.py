@@ -0,0 +1,100 @@
+"""
+Generates the synthetic monorepo the benchmarks run on:
+
+    python benchmarks/generate_workspace.py /tmp/bench_ws --packages 20000
+
+proj*/mod*/pkg* packages with cc_library targets, .bzl files with macros, rules and providers in tools/, and the
+noise the crawler has to skip: a bazel-<name> and an out-bin symlink into a fake output base, node_modules, .git, a
+symlink cycle, a .bazelignore'd and a deleted package.
+"""
+
+import argparse
+import os
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def generate(root, packages, targets, bzl_files, symbols):
+    write(os.path.join(root, "WORKSPACE"), "")
+    modules_per_project = 50
+    packages_per_module = 20
+    for i in range(packages):
+        project = i // (modules_per_project * packages_per_module)
+        module = i // packages_per_module % modules_per_project
+        package = f"proj{project}/mod{module}/pkg{i % packages_per_module}"
+        name = os.path.basename(package)
+        lines = [
+            f'cc_library(name="{name}_lib{j}", srcs=["a{j}.cc"])'
+            for j in range(targets)
+        ]
+        lines.append(f'cc_library(name="{name}", deps=[":{name}_lib0"])')
+        write(os.path.join(root, package, "BUILD"), "\n".join(lines) + "\n")
+        for j in range(targets):
+            write(os.path.join(root, package, f"a{j}.cc"), "")
+    for i in range(bzl_files):
+        lines = []
+        for j in range(symbols):
+            kind = j % 4
+            name = f"sym_{i}_{j}"
+            if kind == 0:
+                lines.append(
+                    f"def {name}(name, **kwargs):\n    native.filegroup(name = name)\n"
+                )
+            elif kind == 1:
+                lines.append(f"{name} = rule(implementation = _impl)\n")
+            elif kind == 2:
+                lines.append(f'{name.title()}Info = provider(fields = ["value"])\n')
+            else:
+                lines.append(f'{name.upper()} = "{j}"\n')
+        write(
+            os.path.join(root, "tools", f"d{i // 100}", f"f{i % 100}.bzl"),
+            "def _impl(ctx):\n    pass\n\n" + "\n".join(lines),
+        )
+    write(os.path.join(root, "tools", "BUILD"), "")
+
+    # noise
+    output_base = root.rstrip("/") + "_output_base"
+    execroot = os.path.join(output_base, "execroot", "_main")
+    write(os.path.join(execroot, "DO_NOT_BUILD_HERE"), "")
+    write(os.path.join(execroot, "bazel-out", "k8", "bin", "pkg", "BUILD"), "")
+    os.symlink(execroot, os.path.join(root, "bazel-" + os.path.basename(root)))
+    os.symlink(
+        os.path.join(execroot, "bazel-out", "k8", "bin"), os.path.join(root, "out-bin")
+    )
+    for i in range(200):
+        write(os.path.join(root, "node_modules", f"dep{i}", "BUILD"), "")
+        write(os.path.join(root, ".git", "objects", f"{i:02x}", "BUILD"), "")
+    write(os.path.join(root, "proj0", "link", "BUILD"), "")
+    os.symlink("..", os.path.join(root, "proj0", "link", "up"))
+    write(os.path.join(root, ".bazelignore"), "proj0/mod1/\n")
+    write(
+        os.path.join(root, ".bazelrc"),
+        "build --deleted_packages=proj0/mod0/pkg0,//proj0/mod0/pkg1\n",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root")
+    parser.add_argument("--packages", type=int, default=20000)
+    parser.add_argument("--targets", type=int, default=10)
+    parser.add_argument("--bzl-files", type=int, default=1000)
+    parser.add_argument("--symbols", type=int, default=100)
+    args = parser.parse_args()
+    if os.path.exists(args.root):
+        parser.error(f"{args.root} exists")
+    generate(
+        os.path.abspath(args.root),
+        args.packages,
+        args.targets,
+        args.bzl_files,
+        args.symbols,
+    )
+
+
+if __name__ == "__main__":
+    main()
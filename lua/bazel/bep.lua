@@ -0,0 +1,247 @@
+-- Incremental reader of the build event protocol file written by --build_event_json_file.
+local M = {}
+
+local uv = vim.loop
+
+local function file_path(uri)
+	if uri == nil then
+		return nil
+	end
+	return uri:match("^file://(.*)$")
+end
+
+local function strip_ansi(text)
+	return (text:gsub("\27%[[%d;]*[mK]", ""))
+end
+
+local function add_diagnostic(result, workspace, line)
+	line = strip_ansi(line):gsub("\r", "")
+	local fname, lnum, col, kind, text = line:match("^([^:%s][^:]*):(%d+):(%d+): (%a[%a ]*): (.*)$")
+	if fname == nil then
+		fname, lnum, kind, text = line:match("^([^:%s][^:]*):(%d+): (%a[%a ]*): (.*)$")
+	end
+	if fname == nil or not (kind:find("error$") or kind == "warning") then
+		return
+	end
+	if fname:sub(1, 1) ~= "/" and workspace ~= nil then
+		fname = workspace .. "/" .. fname
+	end
+	-- diagnostics of failed actions are usually part of the progress events and of the stderr file of the action
+	local key = table.concat({ fname, lnum, col or "", text }, ":")
+	if result.seen_diagnostics[key] then
+		return
+	end
+	result.seen_diagnostics[key] = true
+	table.insert(result.diagnostics, {
+		filename = fname,
+		lnum = tonumber(lnum),
+		col = tonumber(col) or 0,
+		type = kind == "warning" and "W" or "E",
+		text = text,
+	})
+end
+
+-- Calls on_line for every complete line of text, the incomplete rest is kept in stream.partial.
+local function split_lines(stream, text, on_line)
+	stream.partial = stream.partial .. text
+	while true do
+		local newline = stream.partial:find("\n", 1, true)
+		if newline == nil then
+			return
+		end
+		on_line(stream.partial:sub(1, newline - 1))
+		stream.partial = stream.partial:sub(newline + 1)
+	end
+end
+
+local function read_file(path)
+	local f = io.open(path, "r")
+	if f == nil then
+		return nil
+	end
+	local content = f:read("*a")
+	f:close()
+	return content
+end
+
+local handlers = {}
+
+function handlers.progress(result, event)
+	local progress = event.progress or {}
+	if progress.stderr ~= nil then
+		split_lines(result.stderr, progress.stderr, function(line)
+			add_diagnostic(result, result.workspace, line)
+		end)
+	end
+end
+
+function handlers.actionCompleted(result, event)
+	local action = event.action or {}
+	if action.success then
+		return
+	end
+	-- the progress events may not contain the output of every failed action (e.g. it was truncated), the
+	-- diagnostics already found there are skipped
+	local stderr = file_path(action.stderr and action.stderr.uri)
+	local content = stderr and read_file(stderr)
+	if content ~= nil then
+		for line in content:gmatch("[^\n]+") do
+			add_diagnostic(result, result.workspace, line)
+		end
+	end
+end
+
+function handlers.targetCompleted(result, event)
+	local label = event.id.targetCompleted.label
+	if event.completed == nil or not event.completed.success then
+		result.failed_targets[label] = true
+	end
+end
+
+function handlers.testResult(result, event)
+	local id = event.id.testResult
+	local test_result = event.testResult or {}
+	local log = nil
+	for _, output in ipairs(test_result.testActionOutput or {}) do
+		if output.name == "test.log" then
+			log = file_path(output.uri)
+		end
+	end
+	table.insert(result.test_results, {
+		label = id.label,
+		run = id.run,
+		shard = id.shard,
+		attempt = id.attempt,
+		status = test_result.status or "NO_STATUS",
+		log = log,
+	})
+end
+
+function handlers.testSummary(result, event)
+	local summary = event.testSummary or {}
+	result.test_summaries[event.id.testSummary.label] = summary.overallStatus
+end
+
+function handlers.buildFinished(result, event)
+	local finished = event.finished or {}
+	result.finished = true
+	result.success = finished.overallSuccess == true
+	result.exit_code = finished.exitCode and finished.exitCode.code or 0
+end
+
+function M.new_result(workspace)
+	return {
+		workspace = workspace,
+		failed_targets = {},
+		test_results = {},
+		test_summaries = {},
+		diagnostics = {},
+		seen_diagnostics = {},
+		finished = false,
+		stderr = { partial = "" },
+		events = { partial = "" },
+	}
+end
+
+-- Feeds a chunk of the json file to result, returns true if the chunk contained at least one event.
+function M.feed(result, chunk)
+	local changed = false
+	split_lines(result.events, chunk, function(line)
+		local ok, event = pcall(vim.json.decode, line, { luanil = { object = true, array = true } })
+		if not ok or type(event) ~= "table" or event.id == nil then
+			return
+		end
+		for kind, _ in pairs(event.id) do
+			if handlers[kind] ~= nil then
+				handlers[kind](result, event)
+				changed = true
+			end
+		end
+	end)
+	return changed
+end
+
+-- Parses a complete (e.g. recorded) build event json file.
+function M.parse_file(path, workspace)
+	local result = M.new_result(workspace)
+	local content = read_file(path)
+	if content ~= nil then
+		M.feed(result, content)
+	end
+	return result
+end
+
+function M.get_qflist_items(result)
+	local items = vim.deepcopy(result.diagnostics)
+	local labels = vim.tbl_keys(result.failed_targets)
+	table.sort(labels)
+	for _, label in ipairs(labels) do
+		table.insert(items, { text = label .. ": build failed", type = "E" })
+	end
+	for _, test in ipairs(result.test_results) do
+		if test.status ~= "PASSED" then
+			local item = { text = ("%s: %s"):format(test.label, test.status), type = "E" }
+			if test.log ~= nil then
+				item.filename = test.log
+				item.lnum = 1
+			end
+			table.insert(items, item)
+		end
+	end
+	return items
+end
+
+-- Polls path while bazel writes it and calls on_update(result) whenever new events arrived.
+-- Returns a handle whose stop() reads the remaining events and stops polling.
+function M.tail(path, workspace, on_update)
+	local result = M.new_result(workspace)
+	local offset = 0
+	local timer = uv.new_timer()
+
+	local function poll()
+		local fd = uv.fs_open(path, "r", 438)
+		if fd == nil then
+			return
+		end
+		local stat = uv.fs_fstat(fd)
+		local changed = false
+		if stat ~= nil and stat.size > offset then
+			local chunk = uv.fs_read(fd, stat.size - offset, offset)
+			if chunk ~= nil then
+				offset = offset + #chunk
+				changed = M.feed(result, chunk)
+			end
+		end
+		uv.fs_close(fd)
+		if changed then
+			on_update(result)
+		end
+	end
+
+	timer:start(100, 200, vim.schedule_wrap(poll))
+	return {
+		result = result,
+		stop = function()
+			if timer:is_closing() then
+				return
+			end
+			timer:stop()
+			timer:close()
+			poll()
+			os.remove(path)
+		end,
+	}
+end
+
+-- Fills the quickfix list with failures, only replacing the list once there is something to show.
+function M.set_qflist(result)
+	local items = M.get_qflist_items(result)
+	if #items == 0 and not result.qflist_set then
+		return
+	end
+	local action = result.qflist_set and "r" or " "
+	vim.fn.setqflist({}, action, { title = "bazel", items = items })
+	result.qflist_set = true
+end
+
+return M
@@ -0,0 +1,180 @@
+-- Runs an already built executable directly from bazel-bin when it is newer than the sources of its package.
+local M = {}
+
+local uv = vim.loop
+
+local max_files = 5000
+
+-- bazel flags that don't change what is built and can be dropped when running the binary directly
+local ignored_flags = {
+	"--test_output",
+	"--test_summary",
+	"--test_timeout",
+	"--cache_test_results",
+	"--nocache_test_results",
+	"--color",
+	"--curses",
+	"--noshow_progress",
+	"--show_progress",
+	"--ui_event_filters",
+}
+
+local function is_directory(path)
+	local stat = uv.fs_stat(path)
+	return stat ~= nil and stat.type == "directory"
+end
+
+local function newer(a, b)
+	return a.sec > b.sec or (a.sec == b.sec and a.nsec > b.nsec)
+end
+
+-- bzlmod names the main repository "_main" in the runfiles tree.
+function M.get_test_workspace(bazel_info)
+	if bazel_info.workspace_name ~= nil and is_directory(bazel_info.runfiles .. "/" .. bazel_info.workspace_name) then
+		return bazel_info.workspace_name
+	end
+	return "_main"
+end
+
+-- Returns the directory bazel runs the executable in.
+function M.get_cwd(bazel_info)
+	local cwd = bazel_info.runfiles .. "/" .. M.get_test_workspace(bazel_info)
+	if is_directory(cwd) then
+		return cwd
+	end
+	return bazel_info.workspace
+end
+
+-- Returns the runfiles environment bazel sets up for tests and bazel run.
+function M.get_env(bazel_info)
+	return {
+		RUNFILES_DIR = bazel_info.runfiles,
+		TEST_SRCDIR = bazel_info.runfiles,
+		TEST_WORKSPACE = M.get_test_workspace(bazel_info),
+		BUILD_WORKSPACE_DIRECTORY = bazel_info.workspace,
+		BUILD_WORKING_DIRECTORY = vim.fn.getcwd(),
+	}
+end
+
+local function is_build_file(name)
+	return name == "BUILD" or name == "BUILD.bazel"
+end
+
+local function has_build_file(dir)
+	return uv.fs_stat(dir .. "/BUILD") ~= nil or uv.fs_stat(dir .. "/BUILD.bazel") ~= nil
+end
+
+-- Calls on_file for the files of the package in dir, not descending into subpackages.
+-- Returns false if the package has more than max_files files.
+local function walk_package(dir, on_file, count)
+	local handle = uv.fs_scandir(dir)
+	if handle == nil then
+		return true
+	end
+	while true do
+		local name, kind = uv.fs_scandir_next(handle)
+		if name == nil then
+			return true
+		end
+		local path = dir .. "/" .. name
+		if kind == "directory" then
+			if name:sub(1, 1) ~= "." and not has_build_file(path) and not walk_package(path, on_file, count) then
+				return false
+			end
+		elseif name:sub(1, 1) ~= "." then
+			count.files = count.files + 1
+			if count.files > max_files then
+				return false
+			end
+			on_file(path, name)
+		end
+	end
+end
+
+-- Returns true if the executable of target exists and is newer than the BUILD file and all files in the target's
+-- package. Sources of other packages the target depends on are not checked.
+function M.is_up_to_date(workspace, target, executable)
+	local package = target:match("^//(.-):")
+	if package == nil then
+		return false
+	end
+	local executable_stat = uv.fs_stat(executable)
+	if executable_stat == nil or executable_stat.type == "directory" then
+		return false
+	end
+	local dir = package == "" and workspace or workspace .. "/" .. package
+	local found_build_file = false
+	local up_to_date = true
+	local complete = walk_package(dir, function(path, name)
+		found_build_file = found_build_file or is_build_file(name)
+		local stat = uv.fs_stat(path)
+		if stat ~= nil and newer(stat.mtime, executable_stat.mtime) then
+			up_to_date = false
+		end
+	end, { files = 0 })
+	return complete and found_build_file and up_to_date
+end
+
+-- Splits shell words, supporting the single quotes of shellescape(). Returns nil for other quoting.
+local function split_args(args)
+	local result = {}
+	local i = 1
+	while true do
+		i = args:find("%S", i)
+		if i == nil then
+			return result
+		end
+		local word = ""
+		while i <= #args and not args:sub(i, i):match("%s") do
+			local c = args:sub(i, i)
+			if c == "'" then
+				local j = args:find("'", i + 1, true)
+				if j == nil then
+					return nil
+				end
+				word = word .. args:sub(i + 1, j - 1)
+				i = j + 1
+			elseif c == '"' or c == "\\" or c == "$" or c == "`" then
+				return nil
+			else
+				word = word .. c
+				i = i + 1
+			end
+		end
+		table.insert(result, word)
+	end
+end
+
+local function is_ignored(arg)
+	for _, flag in ipairs(ignored_flags) do
+		if arg == flag or arg:sub(1, #flag + 1) == flag .. "=" then
+			return true
+		end
+	end
+	return false
+end
+
+-- Translates the bazel args of a test/run command to the args and environment of the executable.
+-- Returns nil if args contain flags that could change what bazel builds or quoting that can't be translated.
+function M.get_args(command, args)
+	local words = split_args(args)
+	if words == nil then
+		return nil
+	end
+	local result = {}
+	local env = {}
+	for _, arg in ipairs(words) do
+		local test_arg = arg:match("^%-%-test_arg=(.*)$")
+		local test_filter = arg:match("^%-%-test_filter=(.*)$")
+		if command == "test" and test_arg ~= nil then
+			table.insert(result, test_arg)
+		elseif command == "test" and test_filter ~= nil then
+			env.TESTBRIDGE_TEST_ONLY = test_filter
+		elseif not is_ignored(arg) then
+			return nil
+		end
+	end
+	return result, env
+end
+
+return M
@@ -13,8 +13,7 @@ local function get_gtest_info()
 	}
 end
 
-local function get_gtest_filter()
-	local test_info = get_gtest_info()
+local function get_filter(test_info)
 	local test_filter = test_info.suite .. "." .. test_info.name
 	if test_info.type == "TEST_P" then
 		test_filter = "*" .. test_filter .. "*"
@@ -26,7 +25,58 @@ local function get_gtest_filter()
 end
 
 function M.get_gtest_filter_args()
-	return { "--gtest_filter=" .. get_gtest_filter() }
+	return { "--gtest_filter=" .. get_filter(get_gtest_info()) }
+end
+
+-- Combines filters like "Suite.Name" into one --gtest_filter.
+function M.combine_filter_args(filters)
+	return { "--gtest_filter=" .. table.concat(filters, ":") }
+end
+
+local function get_filter_args_for_definitions(definitions)
+	if #definitions == 0 then
+		error("No tests found")
+	end
+	local filters = {}
+	local seen = {}
+	for _, definition in ipairs(definitions) do
+		local filter = get_filter(definition)
+		if not seen[filter] then
+			seen[filter] = true
+			table.insert(filters, filter)
+		end
+	end
+	return M.combine_filter_args(filters)
+end
+
+-- Returns one filter for all tests between the (1-based) lines first_line and last_line, e.g. of a visual selection.
+function M.get_gtest_filter_args_for_range(first_line, last_line)
+	local bufnr = vim.fn.bufnr()
+	local query = vim.treesitter.query.get("cpp", "bazel")
+	return get_filter_args_for_definitions(
+		test_parser.get_test_definitions_in_range(bufnr, query, first_line - 1, last_line - 1)
+	)
+end
+
+-- Returns one filter for all tests of the current buffer.
+function M.get_gtest_filter_args_for_buffer()
+	local bufnr = vim.fn.bufnr()
+	local query = vim.treesitter.query.get("cpp", "bazel")
+	return get_filter_args_for_definitions(test_parser.get_test_definitions(bufnr, query))
+end
+
+-- Returns one filter for all tests containing an entry of the quickfix list.
+function M.get_gtest_filter_args_for_qflist()
+	return get_filter_args_for_definitions(test_parser.get_test_definitions_in_qflist("cpp"))
+end
+
+-- Returns the filter args for test cases read from test.xml (classname and name are the full gtest names).
+function M.get_filter_args_for_cases(cases)
+	local filters = {}
+	for _, case in ipairs(cases) do
+		table.insert(filters, case.classname .. "." .. case.name)
+	end
+	return M.combine_filter_args(filters)
 end
 
 return M
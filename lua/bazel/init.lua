@@ -1,36 +1,28 @@
 local Path = require("plenary.path")
+local query_cache = require("bazel.query_cache")
+local query_batch = require("bazel.query_batch")
+local bazel_workspace = require("bazel.workspace")
+local bep = require("bazel.bep")
+local testlogs = require("bazel.testlogs")
+local jobs = require("bazel.jobs")
+local stream = require("bazel.stream")
+local shards = require("bazel.shards")
+local direct = require("bazel.direct")
+local telemetry = require("bazel.telemetry")
 
 local M = {}
 
-local function find_file(path, file)
+local function get_initial_path(path)
 	local initial_path = path or vim.fn.expand(("#%d:p:h"):format(vim.fn.bufnr()))
 	if initial_path == "" then
 		return nil
 	end
-	local workspace = initial_path
-	while 1 do
-		local canditate = workspace .. "/" .. file
-		if vim.fn.filereadable(canditate) == 1 then
-			return canditate
-		end
-		if workspace == "/" or workspace == "." then
-			break
-		end
-		workspace = vim.fn.fnamemodify(workspace, ":h")
-	end
-end
-
-local function find_any_file(path, files)
-	for _, file in ipairs(files) do
-		local result = find_file(path, file)
-		if result then
-			return result
-		end
-	end
+	return initial_path
 end
 
 local function get_workspace_file(path)
-	return find_any_file(path, { "WORKSPACE", "WORKSPACE.bazel" })
+	local initial_path = get_initial_path(path)
+	return initial_path and bazel_workspace.find_workspace_file(initial_path)
 end
 
 function M.get_workspace(path)
@@ -39,24 +31,27 @@ end
 
 function M.get_workspace_name(path)
 	local workspace_file = get_workspace_file(path)
-	local workspace_content = vim.fn.system("cat " .. workspace_file)
-	return workspace_content:match('workspace%(name = "(.-)"%)')
+	return workspace_file and bazel_workspace.get_name(workspace_file)
 end
 
-function M.is_bazel_workspace(path)
-	return get_workspace_file(path) ~= nil
+-- Returns "module" for bzlmod workspaces (MODULE.bazel) and "workspace" otherwise.
+function M.get_workspace_flavor(path)
+	local workspace_file = get_workspace_file(path)
+	return workspace_file and bazel_workspace.get_flavor(vim.fn.fnamemodify(workspace_file, ":h"))
 end
 
-local function get_cache_file(path)
-	return find_file(path, "DO_NOT_BUILD_HERE")
+function M.is_bazel_workspace(path)
+	return get_workspace_file(path) ~= nil
 end
 
 function M.is_bazel_cache(path)
-	return find_file(path, "DO_NOT_BUILD_HERE") ~= nil
+	local initial_path = get_initial_path(path)
+	return initial_path ~= nil and bazel_workspace.find_cache_file(initial_path) ~= nil
 end
 
 function M.get_workspace_from_cache(path)
-	return vim.fn.system("cat " .. get_cache_file(path))
+	local initial_path = get_initial_path(path)
+	return initial_path and bazel_workspace.get_workspace_from_cache(initial_path)
 end
 
 local function get_executable(target, workspace)
@@ -64,6 +59,20 @@ local function get_executable(target, workspace)
 	return workspace .. "/" .. executable:gsub("//", "bazel-bin/")
 end
 
+-- Finds the targets owning fname by evaluating the BUILD file of its package (including glob()), returns nil if that
+-- can't be decided locally.
+local function find_owning_targets(fname)
+	if vim.fn.exists("*GetBazelOwningTargets") == 0 then
+		return nil
+	end
+	local ok, targets = pcall(vim.fn.GetBazelOwningTargets, fname)
+	-- an empty list means no target owns the file, v:null that it can't be decided without bazel
+	if not ok or type(targets) ~= "table" then
+		return nil
+	end
+	return targets
+end
+
 local function call_with_bazel_targets(callback)
 	local fname = vim.fn.expand("%:p")
 	local workspace = M.get_workspace(fname)
@@ -71,6 +80,11 @@ local function call_with_bazel_targets(callback)
 		print("Not in a bazel workspace.")
 		return
 	end
+	local targets = find_owning_targets(fname)
+	if targets ~= nil then
+		callback(targets)
+		return
+	end
 	local fname_rel = Path:new(fname):make_relative(workspace)
 	local function query_targets(bazel_info)
 		local file_label = bazel_info.stdout[1]
@@ -129,7 +143,9 @@ local function create_window()
 end
 
 local function close_window()
-	vim.api.nvim_win_close(vim.g.bazel_win, true)
+	if vim.g.bazel_win ~= nil and vim.api.nvim_win_is_valid(vim.g.bazel_win) then
+		vim.api.nvim_win_close(vim.g.bazel_win, true)
+	end
 end
 
 local function store_for_run_last(command, args, target, workspace, opts)
@@ -156,17 +172,30 @@ local function get_options(command, workspace, opts, bazel_info)
 	local result = {
 		cwd = workspace,
 		on_exit = function(_, success)
-			if success ~= 0 then
+			if success ~= 0 and not bazel_info.truncated then
 				return
 			end
 			if opts.on_success ~= nil then
-				close_window()
+				if not opts.background then
+					close_window()
+				end
 				opts.on_success(bazel_info)
 			end
 		end,
 	}
 	if command == "cquery" or command == "query" then
 		bazel_info.stdout = {}
+		if opts.on_result ~= nil then
+			-- streaming: results are passed on as they arrive and are not collected in bazel_info.stdout
+			local read = stream.result_reader(bazel_info, opts.on_result, opts.limit)
+			result.on_stdout = function(job_id, data)
+				read(data)
+				if bazel_info.truncated then
+					vim.fn.jobstop(job_id)
+				end
+			end
+			return result
+		end
 		result.stdout_buffered = true
 		result.on_stdout = function(_, stdout)
 			for _, line in pairs(stdout) do
@@ -180,11 +209,56 @@ local function get_options(command, workspace, opts, bazel_info)
 	return result
 end
 
+local function use_direct(command, opts)
+	local enabled = opts.direct
+	if enabled == nil then
+		enabled = vim.g.bazel_direct
+	end
+	return enabled and (command == "test" or command == "run")
+end
+
+-- Runs the executable of opts.target without bazel if it is newer than the sources of its package and args can be
+-- passed to it, returns false otherwise.
+local function execute_direct(command, args, opts)
+	local workspace = opts.workspace or M.get_workspace()
+	local bazel_info = get_bazel_info(workspace, { target = opts.target })
+	local executable_args, env = direct.get_args(command, args)
+	if executable_args == nil or not direct.is_up_to_date(workspace, opts.target, bazel_info.executable) then
+		return false
+	end
+	local options = get_options(command, workspace, opts, bazel_info)
+	options.cwd = direct.get_cwd(bazel_info)
+	options.env = vim.tbl_extend("force", direct.get_env(bazel_info), env)
+	telemetry.track(options, { kind = command, target = opts.target, direct = true })
+	local cmd = vim.fn.shellescape(bazel_info.executable)
+	for _, arg in ipairs(executable_args) do
+		cmd = cmd .. " " .. vim.fn.shellescape(arg)
+	end
+	bazel_info.job = jobs.submit({
+		cmd = cmd,
+		command = command,
+		workspace = workspace,
+		options = options,
+		background = opts.background,
+		direct = true,
+		open_terminal = create_window,
+		after_start = function()
+			vim.fn.feedkeys("G")
+		end,
+	})
+	return true
+end
+
+-- opts: direct boolean -- run the built executable without bazel if it is newer than the files of the target's
+--       package (default: vim.g.bazel_direct), other opts see M.execute
 function M.run(command, args, target, workspace, opts)
 	opts = opts or {}
 	opts.target = target
 	opts.workspace = workspace
 	store_for_run_last(command, args, target, workspace, opts)
+	if use_direct(command, opts) and execute_direct(command, args, opts) then
+		return
+	end
 	M.execute(command, args .. " " .. target, opts)
 end
 
@@ -202,6 +276,56 @@ function M.run_last()
 	)
 end
 
+local function is_gtest_case(case)
+	-- gtest writes status and result attributes, pytest doesn't
+	return case.status ~= nil or case.result ~= nil
+end
+
+-- Removes test filters of a previous run from args.
+local function strip_test_filters(args)
+	return (
+		args:gsub("%-%-test_arg=['\"]?%-%-gtest_filter=%S+", "")
+			:gsub("%-%-test_filter=%S+", "")
+			:gsub("%-%-test_arg=%-k%s+%-%-test_arg=(['\"]).-%1", "")
+			:gsub("%-%-test_arg=%-k%s+%-%-test_arg=%S+", "")
+	)
+end
+
+local function to_test_args(filter_args)
+	local result = {}
+	for _, arg in ipairs(filter_args) do
+		table.insert(result, "--test_arg=" .. vim.fn.shellescape(arg))
+	end
+	return table.concat(result, " ")
+end
+
+-- Runs only the test cases that failed in the last run of the last command (read from bazel-testlogs test.xml).
+function M.run_last_failed()
+	if vim.g.bazel_last_command ~= "test" then
+		print("Last bazel command is not a test.")
+		return
+	end
+	local target = vim.g.bazel_last_target
+	local workspace = vim.g.bazel_last_workspace
+	testlogs.update(workspace, target)
+	local failed = testlogs.get_failed_cases(workspace, target)
+	if #failed == 0 then
+		print("No failed test cases in the last run of " .. target .. ".")
+		return
+	end
+	local filter_args
+	if is_gtest_case(failed[1]) then
+		filter_args = require("bazel.gtest").get_filter_args_for_cases(failed)
+	else
+		filter_args = require("bazel.pytest").get_filter_args_for_cases(failed)
+	end
+	local opts = vim.deepcopy(vim.g.bazel_last_opts or {})
+	opts.target = target
+	opts.workspace = workspace
+	-- don't store for run_last: run_last still runs the whole suite
+	M.execute("test", strip_test_filters(vim.g.bazel_last_args) .. " " .. to_test_args(filter_args) .. " " .. target, opts)
+end
+
 -- opts: on_success function(bazel_info) -- bazel_info has the following fields: workspace, workspace_name, executable, runfiles
 function M.run_here(command, args, opts)
 	M.call_with_bazel_target(function(target)
@@ -209,28 +333,243 @@ function M.run_here(command, args, opts)
 	end)
 end
 
--- opts: on_success function(bazel_info) -- bazel_info has the following fields: workspace, workspace_name, optional(stdout, executable, runfiles)
+-- Builds the gtest target of the current buffer and runs its binary directly in parallel shards (see bazel.shards).
+-- args: bazel build args, test_args: list of args passed to the binary (e.g. a --gtest_filter)
+-- opts: shards number -- number of parallel shards (default: vim.g.bazel_shards or the number of cores)
+function M.run_here_sharded(args, test_args, opts)
+	opts = opts or {}
+	M.call_with_bazel_target(function(target)
+		M.execute("build", args .. " " .. target, {
+			target = target,
+			workspace = M.get_workspace(),
+			on_success = function(bazel_info)
+				shards.run(bazel_info, { args = test_args, shards = opts.shards, on_exit = opts.on_exit })
+			end,
+		})
+	end)
+end
+
+local function use_bep(command, opts)
+	local enabled = opts.bep
+	if enabled == nil then
+		enabled = vim.g.bazel_bep
+	end
+	return enabled and (command == "build" or command == "test" or command == "run" or command == "coverage")
+end
+
+-- Tails the build event protocol file while bazel runs and keeps bazel_info.bep and the quickfix list up to date.
+local function with_bep(args, workspace, options, bazel_info)
+	local bep_file = vim.fn.tempname() .. ".json"
+	local tail = bep.tail(bep_file, workspace, bep.set_qflist)
+	bazel_info.bep = tail.result
+	local on_exit = options.on_exit
+	options.on_exit = function(...)
+		-- the rest of the file is read before the callbacks use the result
+		tail.stop()
+		on_exit(...)
+	end
+	local on_finish = options.on_finish
+	options.on_finish = function(job)
+		-- also jobs that are cancelled in the queue or fail to start
+		tail.stop()
+		if on_finish ~= nil then
+			on_finish(job)
+		end
+	end
+	return "--build_event_json_file=" .. bep_file .. " " .. args
+end
+
+-- opts: on_success function(bazel_info) -- bazel_info has the following fields: workspace, workspace_name, job, optional(stdout, executable, runfiles, bep)
+--       bep boolean -- collect failures, diagnostics and test results from the build event protocol (default: vim.g.bazel_bep)
+--       background boolean -- run without terminal window
+--       supersede boolean -- cancel queued and running invocations of the same command (default: vim.g.bazel_supersede)
+-- Invocations are queued per workspace, identical in-flight invocations are only run once.
+-- Their latencies are recorded, see :BazelStats.
 function M.execute(command, args, opts)
 	opts = opts or {}
 	local workspace = opts.workspace or M.get_workspace()
-	create_window()
+	local bazel_info = get_bazel_info(workspace, { target = opts.target })
+	local options = get_options(command, workspace, opts, bazel_info)
 	local bazel_cmd = vim.g.bazel_cmd or "bazel"
-	vim.fn.termopen(
-		bazel_cmd .. " " .. command .. " " .. args,
-		get_options(command, workspace, opts, get_bazel_info(workspace, { target = opts.target }))
+	-- streamed results can't be shared with a second subscriber that joins late
+	local key = opts.on_result == nil and table.concat({ bazel_cmd, command, args, workspace }, "\0") or nil
+	if use_bep(command, opts) then
+		local leader = jobs.find_active(key)
+		if leader == nil then
+			args = with_bep(args, workspace, options, bazel_info)
+		else
+			-- only the job that runs writes a build event protocol file, share its result
+			bazel_info.bep = leader.bep
+		end
+	end
+	if command == "test" and opts.target and vim.g.bazel_test_diagnostics ~= false then
+		local on_exit = options.on_exit
+		options.on_exit = function(...)
+			testlogs.update(workspace, opts.target)
+			testlogs.publish()
+			on_exit(...)
+		end
+	end
+	telemetry.track(options, { kind = command, target = opts.target })
+	local supersede = opts.supersede
+	if supersede == nil then
+		supersede = vim.g.bazel_supersede
+	end
+	bazel_info.job = jobs.submit({
+		cmd = bazel_cmd .. " " .. command .. " " .. args,
+		command = command,
+		workspace = workspace,
+		options = options,
+		key = key,
+		bep = bazel_info.bep,
+		background = opts.background,
+		supersede = supersede,
+		open_terminal = create_window,
+		after_start = function()
+			vim.fn.feedkeys("G")
+		end,
+	})
+end
+
+function M.cancel(id)
+	if id == nil then
+		jobs.cancel_all()
+		return
+	end
+	jobs.cancel(id)
+end
+
+function M.jobs()
+	return jobs.list()
+end
+
+-- Results of queries with on_success are cached until the BUILD/.bzl files they depend on change.
+local function execute_query(command, args, opts)
+	opts = opts or {}
+	args = args .. " --color no --curses no --noshow_progress --ui_event_filters=stdout"
+	if opts.on_success == nil or opts.on_result ~= nil then
+		M.execute(command, args, opts)
+		return
+	end
+	local workspace = opts.workspace or M.get_workspace()
+	if opts.background == nil then
+		-- results are consumed by on_success, don't take over the terminal window
+		opts = vim.tbl_extend("force", opts, { background = true })
+	end
+	local key = query_cache.key(command, args, workspace)
+	if not opts.refresh then
+		local stdout = query_cache.get(key, workspace, command, args)
+		if stdout ~= nil then
+			local bazel_info = get_bazel_info(workspace, {})
+			bazel_info.stdout = stdout
+			opts.on_success(bazel_info)
+			return
+		end
+	end
+	local fingerprint = query_cache.fingerprint(workspace, command, args)
+	M.execute(
+		command,
+		args,
+		vim.tbl_extend("force", opts, {
+			workspace = workspace,
+			on_success = function(bazel_info)
+				query_cache.set(key, fingerprint, bazel_info.stdout)
+				opts.on_success(bazel_info)
+			end,
+		})
 	)
-	vim.fn.feedkeys("G")
 end
 
--- opts: on_success function(bazel_info) -- bazel_info has the following fields: workspace, workspace_name, stdout
+-- opts: on_success function(bazel_info) -- bazel_info has the following fields: workspace, workspace_name, stdout, truncated
+--       refresh boolean -- ignore cached results
+--       on_result function(line) -- stream results as they arrive instead of collecting them in bazel_info.stdout
+--       limit number -- stop the query after this many streamed results
 function M.query(args, opts)
-	args = args .. " --color no --curses no --noshow_progress --ui_event_filters=stdout"
-	M.execute("query", args, opts)
+	execute_query("query", args, opts)
 end
 
--- opts: on_success function(bazel_info) -- bazel_info has the following fields: workspace, workspace_name, stdout
+-- opts: on_success function(bazel_info) -- bazel_info has the following fields: workspace, workspace_name, stdout, truncated
+--       refresh boolean -- ignore cached results
+--       on_result function(line) -- stream results as they arrive instead of collecting them in bazel_info.stdout
+--       limit number -- stop the query after this many streamed results
 function M.cquery(args, opts)
-	args = args .. " --color no --curses no --noshow_progress --ui_event_filters=stdout"
-	M.execute("cquery", args, opts)
+	execute_query("cquery", args, opts)
+end
+
+-- Runs many queries with as few bazel invocations as possible: target patterns and kind(regex, pattern) expressions are
+-- combined into one union query and its results are partitioned locally, all other expressions are queried one by one.
+-- queries: list of { expression = string, on_success = function(targets) }
+-- opts: workspace, refresh
+function M.query_batch(queries, opts)
+	opts = opts or {}
+	local plan = query_batch.plan(queries)
+	if plan.union ~= nil then
+		M.query(plan.union, {
+			workspace = opts.workspace,
+			refresh = opts.refresh,
+			on_success = function(bazel_info)
+				query_batch.demultiplex(bazel_info.stdout, plan.batched)
+			end,
+		})
+	end
+	for _, query in ipairs(plan.single) do
+		M.query("'" .. query.expression:gsub("'", '"') .. "'", {
+			workspace = opts.workspace,
+			refresh = opts.refresh,
+			on_success = function(bazel_info)
+				query.on_success(bazel_info.stdout)
+			end,
+		})
+	end
+end
+
+function M.clear_query_cache()
+	query_cache.clear()
+end
+
+-- Returns the labels of packages and targets of the workspace starting with prefix ("//pkg/pre", "//pkg:tar" or
+-- ":tar" in the package of the current buffer), best matches first, without invoking bazel
+function M.complete_label(prefix)
+	return vim.fn.CompleteBazelLabel(prefix)
+end
+
+-- Returns the macros, rules, providers and variables of the .bzl files of the workspace and its external repositories
+-- whose names match query (substring or fuzzy): list of { name, kind, label, filename, lnum }, vim.NIL while the
+-- workspace is indexed in the background
+function M.find_workspace_symbols(query)
+	return vim.fn.FindBazelWorkspaceSymbols(query)
+end
+
+-- Lets the user choose one of the symbols matching query with vim.ui.select (e.g. telescope-ui-select) and jumps to it.
+-- Asks for the query if it is nil.
+function M.select_workspace_symbol(query)
+	if query == nil then
+		vim.ui.input({ prompt = "Bazel symbol: " }, function(input)
+			if input ~= nil and input ~= "" then
+				M.select_workspace_symbol(input)
+			end
+		end)
+		return
+	end
+	local symbols = M.find_workspace_symbols(query)
+	if symbols == vim.NIL then
+		print("Indexing the workspace, try again in a moment")
+		return
+	end
+	if vim.tbl_isempty(symbols) then
+		print("No bazel symbols found for " .. query)
+		return
+	end
+	vim.ui.select(symbols, {
+		prompt = "Bazel symbols:",
+		format_item = function(symbol)
+			return ("%s [%s] %s"):format(symbol.name, symbol.kind, symbol.label)
+		end,
+	}, function(symbol)
+		if symbol ~= nil then
+			vim.cmd("edit " .. vim.fn.fnameescape(symbol.filename))
+			vim.api.nvim_win_set_cursor(0, { symbol.lnum, 0 })
+		end
+	end)
 end
 return M
@@ -0,0 +1,280 @@
+-- Queues bazel invocations per workspace, de-duplicates identical in-flight commands and supports cancelling them.
+local M = {}
+
+local uv = vim.loop
+
+local next_id = 1
+local jobs = {}
+local queues = {}
+local running = {}
+local max_history = 50
+
+local function ms(from, to)
+	if from == nil or to == nil then
+		return nil
+	end
+	return (to - from) / 1e6
+end
+
+local function is_active(job)
+	return job.state == "queued" or job.state == "running"
+end
+
+local function fan_out(job, callback_name)
+	return function(...)
+		for _, subscriber in ipairs(job.subscribers) do
+			if subscriber[callback_name] ~= nil then
+				subscriber[callback_name](...)
+			end
+		end
+	end
+end
+
+local function forget_old_jobs()
+	local ids = vim.tbl_keys(jobs)
+	if #ids <= max_history then
+		return
+	end
+	table.sort(ids)
+	for i = 1, #ids - max_history do
+		if not is_active(jobs[ids[i]]) then
+			jobs[ids[i]] = nil
+		end
+	end
+end
+
+local start_next
+
+-- Lets the next queued job of the workspace start while job is still running.
+local function release(job)
+	if running[job.workspace] == job then
+		running[job.workspace] = nil
+		vim.schedule(function()
+			start_next(job.workspace)
+		end)
+	end
+end
+
+-- bazel run holds the server lock while it loads, analyses and builds, it prints this line once the build finished
+-- and the client runs the binary
+local run_started = "Running command line:"
+
+local function watch_run_output(job, data)
+	if job.command ~= "run" or job.binary_started then
+		return
+	end
+	-- the first line of data continues the last line of the previous chunk
+	local lines = vim.list_extend({ (job.output_tail or "") .. (data[1] or "") }, data, 2)
+	job.output_tail = lines[#lines]
+	for _, line in ipairs(lines) do
+		if line:find(run_started, 1, true) then
+			job.binary_started = true
+			release(job)
+			return
+		end
+	end
+end
+
+local function finish(job, state)
+	if not is_active(job) then
+		return
+	end
+	job.state = state
+	job.finished_at = uv.hrtime()
+	if running[job.workspace] == job then
+		running[job.workspace] = nil
+	end
+	forget_old_jobs()
+	vim.schedule(function()
+		start_next(job.workspace)
+	end)
+end
+
+local function start(job)
+	job.state = "running"
+	job.started_at = uv.hrtime()
+	local stderr = {}
+	local options = vim.tbl_extend("force", job.subscribers[1], {
+		on_stdout = function(...)
+			local _, data = ...
+			-- terminals merge stderr into stdout
+			watch_run_output(job, data)
+			fan_out(job, "on_stdout")(...)
+		end,
+		on_stderr = function(...)
+			local _, data = ...
+			watch_run_output(job, data)
+			if job.background then
+				vim.list_extend(stderr, data)
+				while #stderr > 20 do
+					table.remove(stderr, 1)
+				end
+			end
+			fan_out(job, "on_stderr")(...)
+		end,
+		on_exit = function(job_id, code, event)
+			job.exit_code = code
+			finish(job, job.cancelled and "cancelled" or "done")
+			if job.background and code ~= 0 and not job.cancelled then
+				vim.notify(job.cmd .. " failed:\n" .. table.concat(stderr, "\n"), vim.log.levels.ERROR)
+			end
+			fan_out(job, "on_exit")(job_id, code, event)
+			fan_out(job, "on_finish")(job)
+		end,
+	})
+	-- not jobstart/termopen options
+	options.on_start = nil
+	options.on_finish = nil
+	if job.background then
+		job.job_id = vim.fn.jobstart(job.cmd, options)
+	else
+		if job.open_terminal ~= nil then
+			job.open_terminal()
+		end
+		job.job_id = vim.fn.termopen(job.cmd, options)
+		if job.after_start ~= nil then
+			job.after_start()
+		end
+	end
+	if job.job_id <= 0 then
+		vim.notify("Failed to start " .. job.cmd, vim.log.levels.ERROR)
+		finish(job, "failed")
+		fan_out(job, "on_finish")(job)
+		return
+	end
+	fan_out(job, "on_start")(job)
+end
+
+start_next = function(workspace)
+	if running[workspace] ~= nil then
+		return
+	end
+	local queue = queues[workspace] or {}
+	while #queue > 0 do
+		local job = table.remove(queue, 1)
+		if job.state == "queued" then
+			running[workspace] = job
+			start(job)
+			return
+		end
+	end
+end
+
+-- Returns the queued or running job with the de-duplication key or nil.
+function M.find_active(key)
+	if key == nil then
+		return nil
+	end
+	for _, job in pairs(jobs) do
+		if job.key == key and is_active(job) then
+			return job
+		end
+	end
+	return nil
+end
+
+-- Cancels a queued or running job.
+function M.cancel(id)
+	local job = jobs[id]
+	if job == nil or not is_active(job) then
+		return false
+	end
+	if job.state == "running" then
+		job.cancelled = true
+		vim.fn.jobstop(job.job_id)
+	else
+		finish(job, "cancelled")
+		fan_out(job, "on_finish")(job)
+	end
+	return true
+end
+
+function M.cancel_all()
+	for id, job in pairs(jobs) do
+		if is_active(job) then
+			M.cancel(id)
+		end
+	end
+end
+
+-- spec: cmd string, command string (bazel command), cwd string, workspace string, options table (jobstart/termopen
+--       options, on_start function(job), called when the job starts or when joining a running job, and
+--       on_finish function(job), called once the job is done, cancelled or failed to start, also if it never ran and
+--       on_exit isn't called), key string
+--       (identical in-flight keys are de-duplicated, nil disables de-duplication),
+--       background boolean (jobstart instead of a terminal), supersede boolean (cancel active jobs of the same
+--       command in the workspace), direct boolean (runs an executable without bazel, starts without waiting for the
+--       queue), open_terminal function, after_start function
+--       bep table (result of the build event protocol file the job writes, shared with de-duplicated subscribers)
+-- Returns the job: { id, cmd, state, exit_code, queued_at, started_at, finished_at, bep }
+function M.submit(spec)
+	local leader = M.find_active(spec.key)
+	if leader ~= nil then
+		table.insert(leader.subscribers, spec.options)
+		leader.deduplicated = leader.deduplicated + 1
+		if leader.state == "running" and spec.options.on_start ~= nil then
+			spec.options.on_start(leader)
+		end
+		return leader
+	end
+	if spec.supersede then
+		for id, job in pairs(jobs) do
+			if job.workspace == spec.workspace and job.command == spec.command and is_active(job) then
+				M.cancel(id)
+			end
+		end
+	end
+	local job = {
+		id = next_id,
+		key = spec.key,
+		cmd = spec.cmd,
+		command = spec.command,
+		workspace = spec.workspace,
+		background = spec.background,
+		open_terminal = spec.open_terminal,
+		after_start = spec.after_start,
+		subscribers = { spec.options },
+		bep = spec.bep,
+		deduplicated = 0,
+		state = "queued",
+		queued_at = uv.hrtime(),
+	}
+	next_id = next_id + 1
+	jobs[job.id] = job
+	if spec.direct then
+		start(job)
+		return job
+	end
+	queues[job.workspace] = queues[job.workspace] or {}
+	table.insert(queues[job.workspace], job)
+	start_next(job.workspace)
+	return job
+end
+
+-- Returns the known jobs ordered by id with their queue and run times in milliseconds.
+function M.list()
+	local now = uv.hrtime()
+	local result = {}
+	for _, job in pairs(jobs) do
+		table.insert(result, {
+			id = job.id,
+			cmd = job.cmd,
+			state = job.state,
+			exit_code = job.exit_code,
+			background = job.background,
+			deduplicated = job.deduplicated,
+			queue_ms = ms(job.queued_at, job.started_at or now),
+			run_ms = job.started_at and ms(job.started_at, job.finished_at or now),
+		})
+	end
+	table.sort(result, function(a, b)
+		return a.id < b.id
+	end)
+	return result
+end
+
+function M.get(id)
+	return jobs[id]
+end
+
+return M
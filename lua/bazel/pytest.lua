@@ -4,7 +4,13 @@ local function get_test_info()
 	local bufnr = vim.fn.bufnr()
 	local query = vim.treesitter.query.get("python", "bazel")
 	local test_node = test_parser.get_treesitter_query(bufnr, query, "test.definition")
-	local namespace_node = test_parser.get_treesitter_query(bufnr, query, "namespace.definition", { optional = true })
+	-- the innermost class containing the test, like get_test_definitions
+	local namespace_node = test_parser.get_treesitter_query(
+		bufnr,
+		query,
+		"namespace.definition",
+		{ optional = true, containing = test_node }
+	)
 
 	local namespace = nil
 	if namespace_node then
@@ -18,13 +24,77 @@ end
 
 local M = {}
 
+local function get_filter(namespace, name)
+	if namespace then
+		return namespace .. " and " .. name
+	end
+	return name
+end
+
 function M.get_test_filter_args()
 	local test_info = get_test_info()
-	local filter = test_info.name
-	if test_info.namespace then
-		filter = test_info.namespace .. " and " .. test_info.name
+	return { "-k", get_filter(test_info.namespace, test_info.name) }
+end
+
+-- Combines filters like "Class and test_name" into one -k expression.
+function M.combine_filter_args(filters)
+	if #filters == 1 then
+		return { "-k", filters[1] }
+	end
+	return { "-k", "(" .. table.concat(filters, ") or (") .. ")" }
+end
+
+local function get_filter_args_for_definitions(definitions)
+	if #definitions == 0 then
+		error("No tests found")
+	end
+	local filters = {}
+	local seen = {}
+	for _, definition in ipairs(definitions) do
+		local filter = get_filter(definition.namespace, definition.name)
+		if not seen[filter] then
+			seen[filter] = true
+			table.insert(filters, filter)
+		end
+	end
+	return M.combine_filter_args(filters)
+end
+
+-- Returns one -k expression for all tests between the (1-based) lines first_line and last_line, e.g. of a visual selection.
+function M.get_test_filter_args_for_range(first_line, last_line)
+	local bufnr = vim.fn.bufnr()
+	local query = vim.treesitter.query.get("python", "bazel")
+	return get_filter_args_for_definitions(
+		test_parser.get_test_definitions_in_range(bufnr, query, first_line - 1, last_line - 1)
+	)
+end
+
+-- Returns one -k expression for all tests of the current buffer.
+function M.get_test_filter_args_for_buffer()
+	local bufnr = vim.fn.bufnr()
+	local query = vim.treesitter.query.get("python", "bazel")
+	return get_filter_args_for_definitions(test_parser.get_test_definitions(bufnr, query))
+end
+
+-- Returns one -k expression for all tests containing an entry of the quickfix list.
+function M.get_test_filter_args_for_qflist()
+	return get_filter_args_for_definitions(test_parser.get_test_definitions_in_qflist("python"))
+end
+
+-- Returns the filter args for test cases read from test.xml (classname is "package.module[.Class]").
+function M.get_filter_args_for_cases(cases)
+	local filters = {}
+	local seen = {}
+	for _, case in ipairs(cases) do
+		local class = (case.classname or ""):match("([^%.]+)$")
+		local namespace = class and class:match("^%u") and class or nil
+		local filter = get_filter(namespace, (case.name:gsub("%[.*%]$", "")))
+		if not seen[filter] then
+			seen[filter] = true
+			table.insert(filters, filter)
+		end
 	end
-	return { "-k", filter }
+	return M.combine_filter_args(filters)
 end
 
 return M
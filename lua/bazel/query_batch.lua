@@ -0,0 +1,125 @@
+local M = {}
+
+-- Returns a function(label, kind) that decides locally whether a target of `--output=label_kind` matches the target
+-- pattern or nil if pattern is not a pattern of the main repository that can be matched locally.
+local function pattern_matcher(pattern)
+	local package, target = pattern:match("^//([^:]*):?(.*)$")
+	if package == nil then
+		return nil
+	end
+	local recursive = false
+	if package == "..." then
+		package = ""
+		recursive = true
+	elseif package:sub(-4) == "/..." then
+		package = package:sub(1, -5)
+		recursive = true
+	end
+	if package:find("%.%.%.") or package:find("[%*@%s]") or (target:find("[%s%*]") and target ~= "*") then
+		return nil
+	end
+	if target == "" then
+		if recursive then
+			target = "all"
+		elseif package == "" then
+			return nil
+		else
+			target = package:match("[^/]*$")
+		end
+	end
+	local all = target == "all" or target == "*" or target == "all-targets"
+	if recursive and not all then
+		return nil
+	end
+	return function(label, kind)
+		local label_package, label_target = label:match("^@?//([^:]*):(.*)$")
+		if label_package == nil then
+			return false
+		end
+		if recursive then
+			if package ~= "" and label_package ~= package and label_package:sub(1, #package + 1) ~= package .. "/" then
+				return false
+			end
+		elseif label_package ~= package then
+			return false
+		end
+		if target == "all" then
+			return kind:find(" rule$") ~= nil
+		end
+		return all or label_target == target
+	end
+end
+
+-- Only plain words, optionally anchored, are translated from java regexes to lua patterns.
+local function kind_matcher(regex)
+	local anchor_start, word, anchor_end = regex:match("^(%^?)([%w_ ]+)(%$?)$")
+	if word == nil then
+		return nil
+	end
+	local lua_pattern = anchor_start .. word:gsub("%s", "%%s") .. anchor_end
+	return function(kind)
+		return kind:find(lua_pattern) ~= nil
+	end
+end
+
+-- Returns a matcher for expressions that can be partitioned locally: target patterns and kind(regex, target pattern).
+function M.matcher(expression)
+	expression = vim.trim(expression)
+	local regex, pattern = expression:match("^kind%(%s*[\"']?(.-)[\"']?%s*,%s*(.-)%s*%)$")
+	if regex ~= nil then
+		local match_kind = kind_matcher(regex)
+		local match_pattern = pattern_matcher(pattern)
+		if match_kind == nil or match_pattern == nil then
+			return nil
+		end
+		return function(label, kind)
+			return match_kind(kind) and match_pattern(label, kind)
+		end
+	end
+	return pattern_matcher(expression)
+end
+
+-- Splits queries into those that can be answered by a single union query and those that need their own invocation.
+-- queries: list of { expression = string, on_success = function(targets) }
+function M.plan(queries)
+	local batched = {}
+	local single = {}
+	local expressions = {}
+	for _, query in ipairs(queries) do
+		local matcher = M.matcher(query.expression)
+		if matcher ~= nil then
+			table.insert(batched, { query = query, matcher = matcher })
+			table.insert(expressions, (vim.trim(query.expression):gsub("'", '"')))
+		else
+			table.insert(single, query)
+		end
+	end
+	local union = nil
+	if #expressions > 0 then
+		union = "'" .. table.concat(expressions, " union ") .. "' --output=label_kind"
+	end
+	return { union = union, batched = batched, single = single }
+end
+
+-- Distributes the `--output=label_kind` lines of the union query to the callbacks of the batched queries.
+function M.demultiplex(lines, batched)
+	local results = {}
+	for i = 1, #batched do
+		results[i] = {}
+	end
+	for _, line in ipairs(lines) do
+		local kind, label = line:match("^(.-) (%S+)$")
+		if kind ~= nil then
+			for i, entry in ipairs(batched) do
+				if entry.matcher(label, kind) then
+					table.insert(results[i], label)
+				end
+			end
+		end
+	end
+	for i, entry in ipairs(batched) do
+		entry.query.on_success(results[i])
+	end
+end
+
+return M
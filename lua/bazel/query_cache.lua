@@ -0,0 +1,274 @@
+local M = {}
+
+local entries = {}
+local count = 0
+local clock = 0
+local loads_by_file = {}
+
+local function ttl()
+	return vim.g.bazel_query_cache_ttl or 300
+end
+
+local function max_entries()
+	return vim.g.bazel_query_cache_size or 100
+end
+
+local function stat(path)
+	return vim.loop.fs_stat(path)
+end
+
+local function find_build_file(dir)
+	for _, name in ipairs({ "BUILD", "BUILD.bazel" }) do
+		local candidate = dir .. "/" .. name
+		if stat(candidate) then
+			return candidate
+		end
+	end
+end
+
+-- Returns the BUILD file of the package of path and adds the directories up to the package to dirs: a BUILD file
+-- created in one of them changes the package of path.
+local function find_package_build_file(workspace, path, dirs)
+	local dir = path
+	local s = stat(dir)
+	if s and s.type ~= "directory" then
+		dir = vim.fn.fnamemodify(dir, ":h")
+	end
+	while #dir >= #workspace do
+		dirs[dir] = true
+		local build_file = find_build_file(dir)
+		if build_file then
+			return build_file
+		end
+		if dir == workspace then
+			break
+		end
+		dir = vim.fn.fnamemodify(dir, ":h")
+	end
+end
+
+local function read_file(path)
+	local f = io.open(path, "r")
+	if f == nil then
+		return nil
+	end
+	local content = f:read("*a")
+	f:close()
+	return content
+end
+
+-- Returns the paths of the .bzl files of the main repository loaded by path, memoized by mtime.
+local function get_loads(workspace, path, s)
+	local memo = loads_by_file[path]
+	if memo and memo.mtime == s.mtime.sec and memo.nsec == s.mtime.nsec then
+		return memo.loads
+	end
+	local loads = {}
+	local content = read_file(path) or ""
+	local package = vim.fn.fnamemodify(path, ":h")
+	for label in content:gmatch('load%(%s*["\']([^"\']+)["\']') do
+		if label:sub(1, 2) == "//" then
+			local pkg, file = label:match("^//(.-):(.+)$")
+			if pkg then
+				table.insert(loads, workspace .. "/" .. (pkg == "" and "" or pkg .. "/") .. file)
+			end
+		elseif label:sub(1, 1) == ":" then
+			table.insert(loads, package .. "/" .. label:sub(2))
+		end
+	end
+	loads_by_file[path] = { mtime = s.mtime.sec, nsec = s.mtime.nsec, loads = loads }
+	return loads
+end
+
+-- query functions whose results depend on the BUILD files of other packages than the ones named in the expression
+local transitive_functions = {
+	"allpaths",
+	"allrdeps",
+	"buildfiles",
+	"deps",
+	"loadfiles",
+	"rbuildfiles",
+	"rdeps",
+	"same_pkg_direct_rdeps",
+	"siblings",
+	"somepath",
+	"tests",
+	"visible",
+}
+
+local set_operators = { "except", "intersect", "union", "%+", "%^", "%-" }
+
+local function has_function(args, names)
+	for _, name in ipairs(names) do
+		if args:find("%f[%w_]" .. name .. "%s*%(") then
+			return true
+		end
+	end
+	return false
+end
+
+local function has_operator(args, words)
+	for _, word in ipairs(words) do
+		if (" " .. args .. " "):find("[%s%(%)]" .. word .. "[%s%(%)]") then
+			return true
+		end
+	end
+	return false
+end
+
+-- Returns the operands of the set operators (union, intersect, except, +, ^ and -) of the expression. The operators
+-- are only operators between whitespace or parentheses, otherwise they are part of a target name.
+function M.operands(args)
+	local separated = " " .. args .. " "
+	for _, operator in ipairs(set_operators) do
+		separated = separated:gsub("([%s%(%)])" .. operator .. "([%s%(%)])", "%1\0%2")
+	end
+	return vim.split(separated, "\0", { plain = true })
+end
+
+-- Returns whether the result of an operand only depends on the BUILD files of the packages it names.
+local function is_package_local(operand)
+	if operand:find("%.%.%.") or operand:find("@") then
+		-- recursive patterns and external repositories depend on too many files
+		return false
+	end
+	return not (has_function(operand, transitive_functions) or has_operator(operand, { "let", "in" }))
+end
+
+-- Returns whether the result of the query can be validated by the BUILD files of the packages named in args: the
+-- result of a set expression only depends on the packages of its operands if each of them is package local.
+function M.is_cacheable(command, args)
+	if command ~= "query" then
+		-- cquery results depend on the configured transitive closure
+		return false
+	end
+	for _, operand in ipairs(M.operands(args)) do
+		if not is_package_local(operand) then
+			return false
+		end
+	end
+	return true
+end
+
+-- Returns the BUILD files of all packages mentioned in args and the directories that determine them.
+local function get_build_files(workspace, args)
+	local build_files = {}
+	local dirs = {}
+	for word in args:gmatch("[^%s'\",()]+") do
+		if word:sub(1, 1) ~= "-" then
+			local path = nil
+			if word:sub(1, 2) == "//" then
+				local package, name = word:sub(3):match("^([^:]*):?(.*)$")
+				path = workspace .. "/" .. package
+				local dir = name:match("^(.+)/[^/]*$")
+				if dir then
+					-- files in subdirectories belong to another package once it has a BUILD file
+					path = path .. (package == "" and "" or "/") .. dir
+				end
+			elseif stat(workspace .. "/" .. word) then
+				path = workspace .. "/" .. word
+			end
+			local build_file = path and find_package_build_file(workspace, (path:gsub("/$", "")), dirs)
+			if build_file then
+				build_files[build_file] = true
+			end
+		end
+	end
+	return build_files, dirs
+end
+
+-- Fingerprint of the BUILD/.bzl files (and .bazelrc) a query depends on or nil if the query must not be cached. The
+-- packages of all operands of a set expression are fingerprinted together. The directories of the packages are
+-- included, their mtime changes when a subpackage is created in them.
+function M.fingerprint(workspace, command, args)
+	if not M.is_cacheable(command, args) then
+		return nil
+	end
+	local build_files, dirs = get_build_files(workspace, args)
+	if vim.tbl_isempty(build_files) then
+		return nil
+	end
+	local todo = vim.tbl_keys(build_files)
+	table.insert(todo, workspace .. "/.bazelrc")
+	local seen = {}
+	local parts = {}
+	for dir in pairs(dirs) do
+		local s = stat(dir)
+		table.insert(parts, s and ("%s/:%d.%d"):format(dir, s.mtime.sec, s.mtime.nsec) or dir .. "/:missing")
+	end
+	while #todo > 0 do
+		local path = table.remove(todo)
+		if not seen[path] then
+			seen[path] = true
+			local s = stat(path)
+			if s then
+				table.insert(parts, ("%s:%d.%d:%d"):format(path, s.mtime.sec, s.mtime.nsec, s.size))
+				if path:sub(-8) ~= ".bazelrc" then
+					vim.list_extend(todo, get_loads(workspace, path, s))
+				end
+			else
+				table.insert(parts, path .. ":missing")
+			end
+		end
+	end
+	table.sort(parts)
+	return table.concat(parts, "\n")
+end
+
+function M.key(command, args, workspace)
+	return table.concat({ command, args, workspace }, "\0")
+end
+
+local function evict()
+	local oldest_key = nil
+	local oldest = nil
+	for key, entry in pairs(entries) do
+		if oldest == nil or entry.used < oldest then
+			oldest_key = key
+			oldest = entry.used
+		end
+	end
+	if oldest_key ~= nil then
+		entries[oldest_key] = nil
+		count = count - 1
+	end
+end
+
+-- Returns a copy of the cached stdout of a query or nil if there is no valid entry.
+function M.get(key, workspace, command, args)
+	local entry = entries[key]
+	if entry == nil then
+		return nil
+	end
+	if os.time() - entry.time > ttl() or M.fingerprint(workspace, command, args) ~= entry.fingerprint then
+		entries[key] = nil
+		count = count - 1
+		return nil
+	end
+	clock = clock + 1
+	entry.used = clock
+	return vim.list_extend({}, entry.stdout)
+end
+
+-- fingerprint has to be computed before the query is started, otherwise changes made while the query runs are missed.
+function M.set(key, fingerprint, stdout)
+	if fingerprint == nil or ttl() <= 0 then
+		return
+	end
+	if entries[key] == nil then
+		count = count + 1
+	end
+	clock = clock + 1
+	entries[key] = { fingerprint = fingerprint, stdout = vim.list_extend({}, stdout), time = os.time(), used = clock }
+	while count > max_entries() do
+		evict()
+	end
+end
+
+function M.clear()
+	entries = {}
+	count = 0
+	loads_by_file = {}
+end
+
+return M
@@ -0,0 +1,164 @@
+-- Runs a built gtest binary directly in parallel shards (GTEST_TOTAL_SHARDS/GTEST_SHARD_INDEX) and merges the results.
+local testlogs = require("bazel.testlogs")
+local direct = require("bazel.direct")
+
+local M = {}
+
+local uv = vim.loop
+
+function M.get_shard_count()
+	if vim.g.bazel_shards ~= nil then
+		return vim.g.bazel_shards
+	end
+	if uv.available_parallelism ~= nil then
+		return uv.available_parallelism()
+	end
+	return math.max(#(uv.cpu_info() or {}), 1)
+end
+
+-- Returns the environment bazel test would set up for shard index of total.
+function M.get_env(bazel_info, index, total, xml_file)
+	return vim.tbl_extend("force", direct.get_env(bazel_info), {
+		TEST_TMPDIR = vim.fn.fnamemodify(xml_file, ":h"),
+		TEST_TOTAL_SHARDS = tostring(total),
+		TEST_SHARD_INDEX = tostring(index),
+		GTEST_TOTAL_SHARDS = tostring(total),
+		GTEST_SHARD_INDEX = tostring(index),
+		XML_OUTPUT_FILE = xml_file,
+		GTEST_OUTPUT = "xml:" .. xml_file,
+	})
+end
+
+local function open_report(title)
+	vim.cmd("new")
+	local bufnr = vim.api.nvim_get_current_buf()
+	vim.bo[bufnr].buftype = "nofile"
+	vim.bo[bufnr].bufhidden = "wipe"
+	vim.bo[bufnr].swapfile = false
+	pcall(vim.api.nvim_buf_set_name, bufnr, title)
+	return bufnr
+end
+
+local function append(bufnr, lines)
+	if not vim.api.nvim_buf_is_valid(bufnr) then
+		return
+	end
+	vim.api.nvim_buf_set_lines(bufnr, -1, -1, false, lines)
+end
+
+-- Returns an on_stdout/on_stderr callback appending the complete lines prefixed with prefix (:h channel-lines).
+local function line_appender(bufnr, prefix)
+	local partial = ""
+	return function(_, data)
+		local lines = {}
+		partial = partial .. data[1]
+		for i = 2, #data do
+			table.insert(lines, prefix .. (partial:gsub("\r", "")))
+			partial = data[i]
+		end
+		if #data == 1 and data[1] == "" and partial ~= "" then
+			-- EOF
+			table.insert(lines, prefix .. (partial:gsub("\r", "")))
+			partial = ""
+		end
+		if #lines > 0 then
+			append(bufnr, lines)
+		end
+	end
+end
+
+local function get_qflist_item(workspace, testcase, failure)
+	local text = vim.trim(failure.message ~= "" and failure.message or failure.text):gsub("\n", " ")
+	local item = { text = testcase.classname .. "." .. testcase.name .. ": " .. text, type = "E" }
+	local fname, lnum = (failure.message .. "\n" .. failure.text):match("([^%s:\"']+):(%d+)")
+	if fname ~= nil then
+		item.filename = fname:sub(1, 1) == "/" and fname or workspace .. "/" .. fname
+		item.lnum = tonumber(lnum)
+	end
+	return item
+end
+
+-- Returns the summary lines and quickfix items of the merged shard results.
+function M.merge(workspace, shards)
+	local tests, failed = 0, 0
+	local items = {}
+	for _, shard in ipairs(shards) do
+		testlogs.read_test_xml(shard.xml_file, function(testcase)
+			tests = tests + 1
+			if #testcase.failures > 0 then
+				failed = failed + 1
+				for _, failure in ipairs(testcase.failures) do
+					table.insert(items, get_qflist_item(workspace, testcase, failure))
+				end
+			end
+		end)
+	end
+	local lines = { "", ("%d tests in %d shards, %d failed"):format(tests, #shards, failed) }
+	for _, shard in ipairs(shards) do
+		if shard.exit_code ~= 0 then
+			table.insert(lines, ("shard %d/%d exited with %d"):format(shard.index + 1, #shards, shard.exit_code))
+		end
+	end
+	return lines, items
+end
+
+-- Runs bazel_info.executable in shards with the runfiles environment, streams the output prefixed with the shard
+-- index into a report buffer and puts the failing test cases into the quickfix list.
+-- opts: args list of strings -- passed to every shard (e.g. a --gtest_filter)
+--       shards number -- number of shards (default: vim.g.bazel_shards or the number of cores)
+--       on_exit function(success)
+function M.run(bazel_info, opts)
+	opts = opts or {}
+	local total = opts.shards or M.get_shard_count()
+	local tmpdir = vim.fn.tempname()
+	vim.fn.mkdir(tmpdir, "p")
+	local cmd = vim.list_extend({ bazel_info.executable }, opts.args or {})
+	local cwd = direct.get_cwd(bazel_info)
+	local bufnr = open_report("bazel shards " .. tmpdir)
+	local shards = {}
+	local remaining = total
+
+	local function finish()
+		local lines, items = M.merge(bazel_info.workspace, shards)
+		append(bufnr, lines)
+		vim.fn.setqflist({}, " ", { title = "bazel shards", items = items })
+		vim.fn.delete(tmpdir, "rf")
+		if opts.on_exit ~= nil then
+			local success = true
+			for _, shard in ipairs(shards) do
+				success = success and shard.exit_code == 0
+			end
+			opts.on_exit(success)
+		end
+	end
+
+	for index = 0, total - 1 do
+		local shard = { index = index, xml_file = ("%s/shard_%d_of_%d/test.xml"):format(tmpdir, index + 1, total) }
+		vim.fn.mkdir(vim.fn.fnamemodify(shard.xml_file, ":h"), "p")
+		table.insert(shards, shard)
+		local prefix = ("[%d/%d] "):format(index + 1, total)
+		local job_id = vim.fn.jobstart(cmd, {
+			cwd = cwd,
+			env = M.get_env(bazel_info, index, total, shard.xml_file),
+			on_stdout = line_appender(bufnr, prefix),
+			on_stderr = line_appender(bufnr, prefix),
+			on_exit = function(_, code)
+				shard.exit_code = code
+				remaining = remaining - 1
+				if remaining == 0 then
+					finish()
+				end
+			end,
+		})
+		if job_id <= 0 then
+			shard.exit_code = -1
+			remaining = remaining - 1
+			append(bufnr, { prefix .. "failed to start " .. bazel_info.executable })
+		end
+	end
+	if remaining == 0 then
+		finish()
+	end
+end
+
+return M
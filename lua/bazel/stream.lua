@@ -0,0 +1,41 @@
+-- Streaming of query output: the lines are passed on as the chunks of on_stdout arrive.
+local M = {}
+
+-- Returns a function that takes the chunks passed to on_stdout and calls on_line for every complete line (:h channel-lines).
+function M.line_reader(on_line)
+	local partial = ""
+	return function(data)
+		if #data == 1 and data[1] == "" then
+			-- EOF
+			if partial ~= "" then
+				on_line(partial)
+			end
+			partial = ""
+			return
+		end
+		partial = partial .. data[1]
+		for i = 2, #data do
+			on_line(partial)
+			partial = data[i]
+		end
+	end
+end
+
+-- Returns a function that takes the chunks passed to on_stdout and calls on_result for every non-empty line. After
+-- limit results (if not nil) bazel_info.truncated is set and the rest is ignored.
+function M.result_reader(bazel_info, on_result, limit)
+	local n = 0
+	return M.line_reader(function(line)
+		line = line:gsub("\r", "")
+		if line == "" or bazel_info.truncated then
+			return
+		end
+		n = n + 1
+		on_result(line)
+		if limit ~= nil and n >= limit then
+			bazel_info.truncated = true
+		end
+	end)
+end
+
+return M
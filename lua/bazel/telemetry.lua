@@ -0,0 +1,275 @@
+-- Records launch, first output and exit of bazel invocations in a bounded JSONL file and summarizes their latencies.
+local M = {}
+
+local uv = vim.loop
+
+local default_size = 2000
+local line_count = nil
+
+local function get_size()
+	return vim.g.bazel_telemetry_size or default_size
+end
+
+function M.get_path()
+	return vim.fn.stdpath("cache") .. "/bazel_telemetry.jsonl"
+end
+
+local function read_lines(path)
+	local f = io.open(path, "r")
+	if f == nil then
+		return {}
+	end
+	local lines = {}
+	for line in f:lines() do
+		if line ~= "" then
+			table.insert(lines, line)
+		end
+	end
+	f:close()
+	return lines
+end
+
+-- Drops the oldest records above vim.g.bazel_telemetry_size (default 2000).
+local function compact(path)
+	local size = get_size()
+	local lines = read_lines(path)
+	line_count = #lines
+	if #lines > size then
+		local f = io.open(path, "w")
+		if f == nil then
+			return
+		end
+		f:write(table.concat(lines, "\n", #lines - size + 1) .. "\n")
+		f:close()
+		line_count = size
+	end
+end
+
+function M.append(record)
+	local path = M.get_path()
+	if line_count == nil then
+		compact(path)
+	end
+	local f = io.open(path, "a")
+	if f == nil then
+		return
+	end
+	f:write(vim.json.encode(record) .. "\n")
+	f:close()
+	line_count = line_count + 1
+	-- rewrite the file only after it grew by a quarter over its size
+	if line_count > get_size() + math.floor(get_size() / 4) then
+		compact(path)
+	end
+end
+
+local function elapsed_ms(from)
+	return math.floor((uv.hrtime() - from) / 1e6 + 0.5)
+end
+
+-- Wraps the on_start/on_stdout/on_stderr/on_exit callbacks of job options to record the invocation when it exits.
+-- Latencies are measured from the start of the job, the time it waited in the queue is recorded as queue_ms.
+-- info: kind string (bazel command), target string, direct boolean
+function M.track(options, info)
+	if vim.g.bazel_telemetry == false then
+		return options
+	end
+	local submitted = uv.hrtime()
+	local started = nil
+	local record = {
+		time = os.time(),
+		kind = info.kind,
+		target = info.target,
+		direct = info.direct or nil,
+	}
+	local on_start = options.on_start
+	options.on_start = function(job)
+		started = job.started_at or uv.hrtime()
+		record.queue_ms = math.max(0, math.floor((started - submitted) / 1e6 + 0.5))
+		if on_start ~= nil then
+			on_start(job)
+		end
+	end
+	local function on_output(callback)
+		return function(...)
+			if record.first_output_ms == nil then
+				record.first_output_ms = elapsed_ms(started or submitted)
+			end
+			if callback ~= nil then
+				callback(...)
+			end
+		end
+	end
+	options.on_stdout = on_output(options.on_stdout)
+	options.on_stderr = on_output(options.on_stderr)
+	local on_exit = options.on_exit
+	options.on_exit = function(job_id, code, event)
+		record.exit_ms = elapsed_ms(started or submitted)
+		record.exit_code = code
+		pcall(M.append, record)
+		if on_exit ~= nil then
+			on_exit(job_id, code, event)
+		end
+	end
+	local on_finish = options.on_finish
+	options.on_finish = function(job)
+		if started == nil then
+			-- cancelled in the queue or failed to start: recorded without latencies
+			record.state = job.state
+			record.queue_ms = elapsed_ms(submitted)
+			pcall(M.append, record)
+		end
+		if on_finish ~= nil then
+			on_finish(job)
+		end
+	end
+	return options
+end
+
+-- Nearest-rank percentile of a sorted list.
+local function percentile(sorted, p)
+	if #sorted == 0 then
+		return nil
+	end
+	return sorted[math.max(1, math.ceil(p / 100 * #sorted))]
+end
+
+-- Returns the latency percentiles of the recorded invocations per kind, target and whether bazel was skipped, sorted by
+-- kind, target and bazel invocations first: list of { kind, target, direct, count, failed, cancelled,
+-- exit = { p50, p90, p99 }, first_output = { p50, p90, p99 }, queue = { p50, p90, p99 } }. Invocations that never
+-- started only count as failed or cancelled.
+function M.stats()
+	local groups = {}
+	local lines = read_lines(M.get_path())
+	for i = math.max(1, #lines - get_size() + 1), #lines do
+		local ok, record = pcall(vim.json.decode, lines[i])
+		if ok and type(record) == "table" and record.kind ~= nil and (record.exit_ms ~= nil or record.state ~= nil) then
+			local target = type(record.target) == "string" and record.target or ""
+			-- runs of the executable without bazel are summarized apart from the bazel invocations
+			local direct = record.direct == true
+			local key = record.kind .. "\0" .. target .. "\0" .. tostring(direct)
+			groups[key] = groups[key]
+				or {
+					kind = record.kind,
+					target = target,
+					direct = direct,
+					count = 0,
+					failed = 0,
+					cancelled = 0,
+					exit = {},
+					first_output = {},
+					queue = {},
+				}
+			local group = groups[key]
+			group.count = group.count + 1
+			if record.state == "cancelled" then
+				group.cancelled = group.cancelled + 1
+			elseif record.exit_code ~= 0 then
+				group.failed = group.failed + 1
+			end
+			if type(record.exit_ms) == "number" then
+				table.insert(group.exit, record.exit_ms)
+			end
+			if type(record.first_output_ms) == "number" then
+				table.insert(group.first_output, record.first_output_ms)
+			end
+			if type(record.queue_ms) == "number" then
+				table.insert(group.queue, record.queue_ms)
+			end
+		end
+	end
+	local result = {}
+	for _, group in pairs(groups) do
+		for _, name in ipairs({ "exit", "first_output", "queue" }) do
+			local values = group[name]
+			table.sort(values)
+			group[name] = { p50 = percentile(values, 50), p90 = percentile(values, 90), p99 = percentile(values, 99) }
+		end
+		table.insert(result, group)
+	end
+	table.sort(result, function(a, b)
+		if a.kind ~= b.kind then
+			return a.kind < b.kind
+		end
+		if a.target ~= b.target then
+			return a.target < b.target
+		end
+		return not a.direct and b.direct
+	end)
+	return result
+end
+
+local function format_ms(ms)
+	if ms == nil then
+		return "-"
+	end
+	if ms >= 10000 then
+		return ("%.0fs"):format(ms / 1000)
+	end
+	if ms >= 1000 then
+		return ("%.1fs"):format(ms / 1000)
+	end
+	return ("%dms"):format(ms)
+end
+
+function M.get_lines()
+	local lines = {
+		("%-8s %-6s %6s %6s %6s %8s %8s %8s %8s %8s %8s %8s %8s  %s"):format(
+			"kind",
+			"via",
+			"count",
+			"failed",
+			"cancel",
+			"p50",
+			"p90",
+			"p99",
+			"out p50",
+			"out p90",
+			"out p99",
+			"que p50",
+			"que p90",
+			"target"
+		),
+	}
+	for _, group in ipairs(M.stats()) do
+		table.insert(
+			lines,
+			("%-8s %-6s %6d %6d %6d %8s %8s %8s %8s %8s %8s %8s %8s  %s"):format(
+				group.kind,
+				group.direct and "direct" or "bazel",
+				group.count,
+				group.failed,
+				group.cancelled,
+				format_ms(group.exit.p50),
+				format_ms(group.exit.p90),
+				format_ms(group.exit.p99),
+				format_ms(group.first_output.p50),
+				format_ms(group.first_output.p90),
+				format_ms(group.first_output.p99),
+				format_ms(group.queue.p50),
+				format_ms(group.queue.p90),
+				group.target
+			)
+		)
+	end
+	return lines
+end
+
+-- Shows the latency percentiles (until exit and until the first output after the start, waiting in the queue) in a
+-- scratch buffer.
+function M.show()
+	vim.cmd("new")
+	local bufnr = vim.api.nvim_get_current_buf()
+	vim.bo[bufnr].buftype = "nofile"
+	vim.bo[bufnr].bufhidden = "wipe"
+	vim.bo[bufnr].swapfile = false
+	vim.api.nvim_buf_set_lines(bufnr, 0, -1, false, M.get_lines())
+	vim.bo[bufnr].modifiable = false
+end
+
+function M.clear()
+	os.remove(M.get_path())
+	line_count = 0
+end
+
+return M
@@ -1,28 +1,259 @@
 local M = {}
 
+-- Per buffer and changedtick: sorted interval tables of the definitions found so far and the texts of their captures
+-- per query.
+local cache = {}
+
+local function get_cache(bufnr)
+	local changedtick = vim.api.nvim_buf_get_changedtick(bufnr)
+	local entry = cache[bufnr]
+	if entry == nil or entry.changedtick ~= changedtick then
+		entry = { changedtick = changedtick, intervals = {}, texts = {}, definitions = {} }
+		cache[bufnr] = entry
+	end
+	return entry
+end
+
+local function get_intervals(bufnr, query, capture)
+	local entry = get_cache(bufnr)
+	entry.intervals[query] = entry.intervals[query] or {}
+	-- scanned: set of the rows whose captures were inserted
+	entry.intervals[query][capture] = entry.intervals[query][capture] or { scanned = {} }
+	return entry.intervals[query][capture]
+end
+
+local function before(row_a, col_a, row_b, col_b)
+	return row_a < row_b or (row_a == row_b and col_a <= col_b)
+end
+
+local function covers(interval, row, col)
+	return before(interval.start_row, interval.start_col, row, col)
+		and before(row, col, interval.end_row, interval.end_col)
+end
+
+-- Returns the index of the last interval starting at or before (row, col).
+local function upper_bound(intervals, row, col)
+	local low, high = 1, #intervals
+	local result = 0
+	while low <= high do
+		local mid = math.floor((low + high) / 2)
+		if before(intervals[mid].start_row, intervals[mid].start_col, row, col) then
+			result = mid
+			low = mid + 1
+		else
+			high = mid - 1
+		end
+	end
+	return result
+end
+
+-- Returns the outermost cached interval covering (row, col), or the innermost one covering (row, col) and
+-- (end_row, end_col) if they are given.
+local function find_interval(intervals, row, col, end_row, end_col)
+	local result = nil
+	for i = upper_bound(intervals, row, col), 1, -1 do
+		if covers(intervals[i], row, col) then
+			if end_row == nil then
+				result = intervals[i]
+			elseif covers(intervals[i], end_row, end_col) then
+				return intervals[i]
+			end
+		end
+	end
+	return result
+end
+
+local function insert_interval(intervals, node)
+	local start_row, start_col, end_row, end_col = node:range()
+	for _, interval in ipairs(intervals) do
+		if interval.id == node:id() then
+			return
+		end
+	end
+	local interval = {
+		id = node:id(),
+		node = node,
+		start_row = start_row,
+		start_col = start_col,
+		end_row = end_row,
+		end_col = end_col,
+	}
+	table.insert(intervals, upper_bound(intervals, start_row, start_col) + 1, interval)
+end
+
+-- Returns the outermost node of capture containing the cursor, or with opts.containing the innermost node of capture
+-- containing that node (like the namespace of get_test_definitions). Only the captures intersecting the cursor row are
+-- visited and found nodes are cached until the buffer changes.
+-- opts: optional boolean (return nil instead of raising an error), containing node
 function M.get_treesitter_query(bufnr, query, capture, opts)
 	opts = opts or {}
-	local node_at_cursor = vim.treesitter.get_node()
+	local row, col, end_row, end_col
+	if opts.containing ~= nil then
+		row, col, end_row, end_col = opts.containing:range()
+	else
+		local cursor = vim.api.nvim_win_get_cursor(0)
+		row, col = cursor[1] - 1, cursor[2]
+	end
 
-	local tree = vim.treesitter.get_parser(bufnr):parse()[1]
-	for id, node, metadata in query:iter_captures(tree:root(), bufnr) do
-		if query.captures[id] == capture then
-			if node:child_with_descendant(node_at_cursor) ~= nil or node == node_at_cursor then
-				return node
+	local intervals = get_intervals(bufnr, query, capture)
+	if not intervals.scanned[row] then
+		-- all nodes covering the row intersect it, nodes found for other rows may miss the inner ones
+		intervals.scanned[row] = true
+		local tree = vim.treesitter.get_parser(bufnr):parse()[1]
+		for id, node, metadata in query:iter_captures(tree:root(), bufnr, row, row + 1) do
+			if query.captures[id] == capture then
+				insert_interval(intervals, node)
 			end
 		end
 	end
+	local interval = find_interval(intervals, row, col, end_row, end_col)
+	if interval ~= nil then
+		return interval.node
+	end
 	if not opts.optional then
 		error("Cursor not in a test")
 	end
 end
 
+-- Returns the text of the first capture of query below root, cached per query and root until the buffer changes.
 function M.get_text_of_capture(bufnr, query, capture, root)
-	for id, node, metadata in query:iter_captures(root, bufnr) do
-		if query.captures[id] == capture then
-			return vim.treesitter.get_node_text(node, 0)
+	local entry = get_cache(bufnr)
+	entry.texts[query] = entry.texts[query] or {}
+	local texts = entry.texts[query]
+	local key = root:id()
+	if texts[key] == nil then
+		texts[key] = {}
+		for id, node, metadata in query:iter_captures(root, bufnr) do
+			local name = query.captures[id]
+			if texts[key][name] == nil then
+				texts[key][name] = vim.treesitter.get_node_text(node, bufnr)
+			end
+		end
+	end
+	return texts[key][capture]
+end
+
+local function get_node(node)
+	-- depending on the neovim version iter_matches returns a node or a list of nodes per capture
+	if type(node) == "table" then
+		return node[#node]
+	end
+	return node
+end
+
+local function contains(outer, inner)
+	local outer_start, _, outer_end, _ = outer:range()
+	local inner_start, _, inner_end, _ = inner:range()
+	return outer_start <= inner_start and inner_end <= outer_end
+end
+
+-- Returns all test definitions of the buffer sorted by start row: list of { type, suite, name, namespace, start_row, end_row }.
+-- Rows are 0-based, namespace is the innermost namespace (e.g. python class) containing the test.
+-- The result is cached until the buffer changes.
+function M.get_test_definitions(bufnr, query)
+	local entry = get_cache(bufnr)
+	if entry.definitions[query] == nil then
+		entry.definitions[query] = M.parse_test_definitions(bufnr, query)
+	end
+	return entry.definitions[query]
+end
+
+function M.parse_test_definitions(bufnr, query)
+	local tree = vim.treesitter.get_parser(bufnr):parse()[1]
+	local tests = {}
+	local namespaces = {}
+	for _, match in query:iter_matches(tree:root(), bufnr, 0, -1) do
+		local captures = {}
+		for id, node in pairs(match) do
+			captures[query.captures[id]] = get_node(node)
+		end
+		if captures["test.definition"] ~= nil then
+			table.insert(tests, captures)
+		elseif captures["namespace.definition"] ~= nil then
+			table.insert(namespaces, captures)
+		end
+	end
+
+	local function text(node)
+		return node and vim.treesitter.get_node_text(node, bufnr)
+	end
+
+	local result = {}
+	for _, captures in ipairs(tests) do
+		local node = captures["test.definition"]
+		local namespace = nil
+		for _, candidate in ipairs(namespaces) do
+			local namespace_node = candidate["namespace.definition"]
+			if contains(namespace_node, node) and (namespace == nil or contains(namespace.node, namespace_node)) then
+				namespace = { node = namespace_node, name = text(candidate["namespace.name"]) }
+			end
+		end
+		local start_row, _, end_row, _ = node:range()
+		table.insert(result, {
+			type = text(captures["test.type"]),
+			suite = text(captures["test.suite"]),
+			name = text(captures["test.name"]),
+			namespace = namespace and namespace.name,
+			start_row = start_row,
+			end_row = end_row,
+		})
+	end
+	table.sort(result, function(a, b)
+		return a.start_row < b.start_row
+	end)
+	-- decorated python functions are matched with and without their decorators
+	local unique = {}
+	for _, definition in ipairs(result) do
+		local previous = unique[#unique]
+		if previous == nil or previous.name ~= definition.name or previous.end_row < definition.end_row then
+			table.insert(unique, definition)
+		end
+	end
+	return unique
+end
+
+-- Returns the test definitions intersecting the 0-based rows start_row..end_row.
+function M.get_test_definitions_in_range(bufnr, query, start_row, end_row)
+	local result = {}
+	for _, definition in ipairs(M.get_test_definitions(bufnr, query)) do
+		if definition.start_row <= end_row and start_row <= definition.end_row then
+			table.insert(result, definition)
 		end
 	end
+	return result
 end
 
+-- Returns the test definitions containing the entries of the quickfix list that are in files of filetype lang.
+function M.get_test_definitions_in_qflist(lang)
+	local query = vim.treesitter.query.get(lang, "bazel")
+	local result = {}
+	local seen = {}
+	for _, item in ipairs(vim.fn.getqflist()) do
+		if item.bufnr ~= 0 and item.valid == 1 then
+			vim.fn.bufload(item.bufnr)
+			local filetype = vim.bo[item.bufnr].filetype
+			if filetype == "" then
+				filetype = vim.filetype.match({ buf = item.bufnr }) or ""
+			end
+			if filetype == lang then
+				local row = item.lnum - 1
+				for _, definition in ipairs(M.get_test_definitions_in_range(item.bufnr, query, row, row)) do
+					local key = item.bufnr .. ":" .. definition.start_row
+					if not seen[key] then
+						seen[key] = true
+						table.insert(result, definition)
+					end
+				end
+			end
+		end
+	end
+	return result
+end
+
+vim.api.nvim_create_autocmd({ "BufWipeout" }, {
+	callback = function(args)
+		cache[args.buf] = nil
+	end,
+})
+
 return M
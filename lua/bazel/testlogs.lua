@@ -0,0 +1,362 @@
+-- Reads the test.xml files of bazel-testlogs and publishes failing test cases as diagnostics.
+local test_parser = require("bazel.test_parser")
+
+local M = {}
+
+local uv = vim.loop
+
+local chunk_size = 65536
+local max_text = 4096
+
+-- test.xml path -> { mtime, size, target, cases }
+local results = {}
+local namespace = vim.api.nvim_create_namespace("bazel_testlogs")
+
+local entities = { lt = "<", gt = ">", amp = "&", quot = '"', apos = "'" }
+
+local function decode_entities(text)
+	return (
+		text:gsub("&(#?)([xX]?)(%w+);", function(number, hex, code)
+			if number == "" then
+				return entities[code]
+			end
+			local n = tonumber(code, hex ~= "" and 16 or 10)
+			if n ~= nil and n < 128 then
+				return string.char(n)
+			end
+		end)
+	)
+end
+
+local function parse_attributes(tag)
+	local attributes = {}
+	for key, _, value in tag:gmatch("([%w_:%-]+)%s*=%s*([\"'])(.-)%2") do
+		attributes[key] = decode_entities(value)
+	end
+	return attributes
+end
+
+-- Returns the index of the ">" that ends the tag starting at start, skipping quoted attribute values.
+local function find_tag_end(buffer, start)
+	local i = start
+	while true do
+		local j = buffer:find("[\"'>]", i)
+		if j == nil then
+			return nil
+		end
+		local c = buffer:sub(j, j)
+		if c == ">" then
+			return j
+		end
+		local k = buffer:find(c, j + 1, true)
+		if k == nil then
+			return nil
+		end
+		i = k + 1
+	end
+end
+
+-- Streaming parser for junit xml: calls on_testcase({ classname, name, file, line, failures }) for every test case.
+-- Only the currently unfinished token and the (truncated) text of failures is kept in memory.
+local function new_parser(on_testcase)
+	local buffer = ""
+	local testcase = nil
+	local failure = nil
+	local in_cdata = false
+
+	local function add_text(text)
+		if failure ~= nil and #failure.text < max_text then
+			failure.text = failure.text .. text:sub(1, max_text - #failure.text)
+		end
+	end
+
+	local function handle_tag(tag)
+		local closing, name = tag:match("^<(/?)([%w_:%-]+)")
+		if name == nil then
+			return
+		end
+		local self_closing = tag:sub(-2) == "/>"
+		if closing == "/" then
+			if (name == "failure" or name == "error") and failure ~= nil and testcase ~= nil then
+				table.insert(testcase.failures, failure)
+				failure = nil
+			elseif name == "testcase" and testcase ~= nil then
+				on_testcase(testcase)
+				testcase = nil
+			end
+			return
+		end
+		if name == "testcase" then
+			testcase = parse_attributes(tag)
+			testcase.failures = {}
+			if self_closing then
+				on_testcase(testcase)
+				testcase = nil
+			end
+		elseif (name == "failure" or name == "error") and testcase ~= nil then
+			failure = { message = parse_attributes(tag).message or "", text = "" }
+			if self_closing then
+				table.insert(testcase.failures, failure)
+				failure = nil
+			end
+		end
+	end
+
+	local function feed(chunk)
+		buffer = buffer .. chunk
+		local pos = 1
+		while true do
+			if in_cdata then
+				local cdata_end = buffer:find("]]>", pos, true)
+				if cdata_end == nil then
+					-- keep the last two characters in case they start the "]]>"
+					local keep_from = math.max(pos, #buffer - 1)
+					add_text(buffer:sub(pos, keep_from - 1))
+					pos = keep_from
+					break
+				end
+				add_text(buffer:sub(pos, cdata_end - 1))
+				pos = cdata_end + 3
+				in_cdata = false
+			else
+				local tag_start = buffer:find("<", pos, true)
+				if tag_start == nil then
+					-- keep a possibly incomplete entity at the end
+					local text_end = (buffer:find("&[^;]*$", pos) or #buffer + 1) - 1
+					add_text(decode_entities(buffer:sub(pos, text_end)))
+					pos = text_end + 1
+					break
+				end
+				add_text(decode_entities(buffer:sub(pos, tag_start - 1)))
+				pos = tag_start
+				if buffer:sub(pos, pos + 8) == "<![CDATA[" then
+					in_cdata = true
+					pos = pos + 9
+				elseif buffer:sub(pos, pos + 3) == "<!--" then
+					local comment_end = buffer:find("-->", pos + 4, true)
+					if comment_end == nil then
+						break
+					end
+					pos = comment_end + 3
+				elseif #buffer - pos < 8 and buffer:sub(pos + 1, pos + 1) == "!" then
+					-- wait for more data to decide between CDATA and comments
+					break
+				else
+					local tag_end = find_tag_end(buffer, pos + 1)
+					if tag_end == nil then
+						break
+					end
+					handle_tag(buffer:sub(pos, tag_end))
+					pos = tag_end + 1
+				end
+			end
+		end
+		buffer = buffer:sub(pos)
+	end
+
+	return feed
+end
+
+-- Reads path in chunks and calls on_testcase for every test case.
+function M.read_test_xml(path, on_testcase)
+	local fd = uv.fs_open(path, "r", 438)
+	if fd == nil then
+		return false
+	end
+	local feed = new_parser(on_testcase)
+	local offset = 0
+	while true do
+		local chunk = uv.fs_read(fd, chunk_size, offset)
+		if chunk == nil or chunk == "" then
+			break
+		end
+		feed(chunk)
+		offset = offset + #chunk
+	end
+	uv.fs_close(fd)
+	return true
+end
+
+local function find_test_xmls(dir, found)
+	local handle = uv.fs_scandir(dir)
+	if handle == nil then
+		return found
+	end
+	while true do
+		local name, kind = uv.fs_scandir_next(handle)
+		if name == nil then
+			break
+		end
+		local path = dir .. "/" .. name
+		if kind == "directory" or (kind == "link" and (uv.fs_stat(path) or {}).type == "directory") then
+			find_test_xmls(path, found)
+		elseif name == "test.xml" then
+			table.insert(found, path)
+		end
+	end
+	return found
+end
+
+-- Returns the bazel-testlogs directory of a test target like //foo/bar:baz_test.
+function M.get_target_dir(workspace, target)
+	local package, name = target:match("^//(.-):(.+)$")
+	if package == nil then
+		return nil
+	end
+	if package == "" then
+		return workspace .. "/bazel-testlogs/" .. name
+	end
+	return workspace .. "/bazel-testlogs/" .. package .. "/" .. name
+end
+
+-- Parses the test.xml files below the testlogs directory of target (all targets if nil) that changed since the last
+-- call and returns the paths of the changed files.
+function M.update(workspace, target)
+	local dir = target and M.get_target_dir(workspace, target) or workspace .. "/bazel-testlogs"
+	if dir == nil then
+		return {}
+	end
+	local changed = {}
+	for _, path in ipairs(find_test_xmls(dir, {})) do
+		local stat = uv.fs_stat(path)
+		local previous = results[path]
+		if
+			stat ~= nil
+			and (previous == nil or previous.mtime ~= stat.mtime.sec .. "." .. stat.mtime.nsec or previous.size ~= stat.size)
+		then
+			local cases = {}
+			M.read_test_xml(path, function(testcase)
+				table.insert(cases, testcase)
+			end)
+			results[path] = {
+				mtime = stat.mtime.sec .. "." .. stat.mtime.nsec,
+				size = stat.size,
+				target = target,
+				cases = cases,
+			}
+			table.insert(changed, path)
+		end
+	end
+	return changed
+end
+
+-- Returns the failing test cases of the last run of target (see M.update).
+function M.get_failed_cases(workspace, target)
+	local dir = M.get_target_dir(workspace, target)
+	local failed = {}
+	for path, result in pairs(results) do
+		if dir ~= nil and path:sub(1, #dir + 1) == dir .. "/" then
+			for _, testcase in ipairs(result.cases) do
+				if #testcase.failures > 0 then
+					table.insert(failed, testcase)
+				end
+			end
+		end
+	end
+	return failed
+end
+
+local function all_failed_cases()
+	local failed = {}
+	for _, result in pairs(results) do
+		for _, testcase in ipairs(result.cases) do
+			if #testcase.failures > 0 then
+				table.insert(failed, testcase)
+			end
+		end
+	end
+	return failed
+end
+
+-- gtest: TEST_P cases are reported as "Instance/Suite" "Name/0", TYPED_TEST cases as "Suite/0" "Name".
+-- pytest: classname is "package.module.Class" or "package.module", parametrized names end with "[...]".
+function M.normalize(testcase)
+	local suite = nil
+	for component in (testcase.classname or ""):gmatch("[^/]+") do
+		if not component:match("^%d+$") then
+			suite = component
+		end
+	end
+	local name = (testcase.name or ""):gsub("/%d+$", ""):gsub("%[.*%]$", "")
+	local class = suite and suite:match("([^%.]+)$")
+	return { suite = suite, class = class, name = name }
+end
+
+local function matches(definition, case)
+	if definition.name ~= case.name then
+		return false
+	end
+	if definition.suite ~= nil then
+		return definition.suite == case.suite
+	end
+	return definition.namespace == nil or definition.namespace == case.class
+end
+
+local function get_query(bufnr)
+	local filetype = vim.bo[bufnr].filetype
+	if filetype ~= "cpp" and filetype ~= "python" then
+		return nil
+	end
+	local ok, query = pcall(vim.treesitter.query.get, filetype, "bazel")
+	return ok and query or nil
+end
+
+-- Finds the line of a failure message like "foo_test.cc:15" or "foo/test_x.py:12: AssertionError" in the buffer.
+local function get_failure_line(bufnr, failure, definition)
+	local fname = vim.api.nvim_buf_get_name(bufnr)
+	local line = nil
+	for path, lnum in (failure.message .. "\n" .. failure.text):gmatch("([^%s:\"']+):(%d+)") do
+		lnum = tonumber(lnum) - 1
+		if
+			fname:sub(-#path) == path
+			and (fname:sub(-#path - 1, -#path - 1) == "/" or #fname == #path)
+			and definition.start_row <= lnum
+			and lnum <= definition.end_row
+		then
+			line = lnum
+		end
+	end
+	return line or definition.start_row
+end
+
+local function get_message(failure)
+	local message = failure.message ~= "" and failure.message or failure.text
+	return vim.trim(message)
+end
+
+-- Publishes the failing test cases of all parsed test.xml files as diagnostics in the loaded test buffers.
+function M.publish()
+	local failed = all_failed_cases()
+	for _, bufnr in ipairs(vim.api.nvim_list_bufs()) do
+		local query = vim.api.nvim_buf_is_loaded(bufnr) and get_query(bufnr)
+		if query then
+			local diagnostics = {}
+			if #failed > 0 then
+				local ok, definitions = pcall(test_parser.get_test_definitions, bufnr, query)
+				for _, definition in ipairs(ok and definitions or {}) do
+					for _, testcase in ipairs(failed) do
+						if matches(definition, M.normalize(testcase)) then
+							for _, failure in ipairs(testcase.failures) do
+								table.insert(diagnostics, {
+									lnum = get_failure_line(bufnr, failure, definition),
+									col = 0,
+									severity = vim.diagnostic.severity.ERROR,
+									source = "bazel",
+									message = get_message(failure),
+								})
+							end
+						end
+					end
+				end
+			end
+			vim.diagnostic.set(namespace, bufnr, diagnostics)
+		end
+	end
+end
+
+function M.clear()
+	results = {}
+	vim.diagnostic.reset(namespace)
+end
+
+return M
@@ -0,0 +1,164 @@
+-- Workspace metadata read natively through libuv and memoized per path, invalidated by file mtime.
+local M = {}
+
+local uv = vim.loop
+
+local found_files = {}
+local file_contents = {}
+
+local function parent(dir)
+	if dir == "/" or dir == "." then
+		return nil
+	end
+	local result = dir:match("^(.*)/[^/]*$")
+	if result == nil then
+		return "."
+	end
+	if result == "" then
+		return "/"
+	end
+	return result
+end
+
+local function join(dir, file)
+	if dir:sub(-1) == "/" then
+		return dir .. file
+	end
+	return dir .. "/" .. file
+end
+
+local function is_readable(path)
+	local stat = uv.fs_stat(path)
+	return stat ~= nil and stat.type ~= "directory"
+end
+
+-- Returns the content of path, only re-reading it when its mtime or size changed.
+function M.read_file(path)
+	local stat = uv.fs_stat(path)
+	if stat == nil then
+		file_contents[path] = nil
+		return nil
+	end
+	local cached = file_contents[path]
+	if cached and cached.sec == stat.mtime.sec and cached.nsec == stat.mtime.nsec and cached.size == stat.size then
+		return cached.content
+	end
+	local fd = uv.fs_open(path, "r", 438)
+	if fd == nil then
+		return nil
+	end
+	local content = uv.fs_read(fd, stat.size, 0)
+	uv.fs_close(fd)
+	file_contents[path] = { sec = stat.mtime.sec, nsec = stat.mtime.nsec, size = stat.size, content = content }
+	return content
+end
+
+-- Returns the mtime of dir or nil if it is not a directory.
+local function dir_mtime(dir)
+	local stat = uv.fs_stat(dir)
+	if stat == nil or stat.type ~= "directory" then
+		return nil
+	end
+	return stat.mtime.sec .. "." .. stat.mtime.nsec
+end
+
+local function is_unchanged(dirs)
+	for _, searched in ipairs(dirs) do
+		if dir_mtime(searched.dir) ~= searched.mtime then
+			return false
+		end
+	end
+	return true
+end
+
+-- Returns the first readable file of files in path, path/.., ... (the nearest directory wins), memoized per
+-- (path, files) until a file is created or removed in one of the searched directories (its mtime changes).
+function M.find_any_file(path, files)
+	local key = path .. "\0" .. table.concat(files, "\0")
+	local cached = found_files[key]
+	if cached ~= nil and is_unchanged(cached.dirs) then
+		return cached.result
+	end
+	local dirs = {}
+	local result = nil
+	local dir = path
+	while dir ~= nil and result == nil do
+		local mtime = dir_mtime(dir)
+		table.insert(dirs, { dir = dir, mtime = mtime })
+		if mtime ~= nil then
+			for _, file in ipairs(files) do
+				local candidate = join(dir, file)
+				if is_readable(candidate) then
+					result = candidate
+					break
+				end
+			end
+		end
+		dir = parent(dir)
+	end
+	found_files[key] = { result = result, dirs = dirs }
+	return result
+end
+
+-- Returns the first path/file, path/../file, ... that is readable.
+function M.find_file(path, file)
+	return M.find_any_file(path, { file })
+end
+
+local workspace_files = { "WORKSPACE", "WORKSPACE.bazel", "MODULE.bazel" }
+
+function M.find_workspace_file(path)
+	return M.find_any_file(path, workspace_files)
+end
+
+-- Returns "module" if the workspace root contains a MODULE.bazel (bzlmod), "workspace" otherwise.
+function M.get_flavor(root)
+	if is_readable(join(root, "MODULE.bazel")) then
+		return "module"
+	end
+	return "workspace"
+end
+
+function M.get_name(workspace_file)
+	local content = M.read_file(workspace_file)
+	if content == nil then
+		return nil
+	end
+	local function_name = workspace_file:match("[^/]*$") == "MODULE.bazel" and "module" or "workspace"
+	return content:match(function_name .. "%(%s*name%s*=%s*[\"'](.-)[\"']")
+end
+
+-- Returns { root, file, flavor, name } of the workspace containing path or nil.
+function M.get_info(path)
+	local workspace_file = M.find_workspace_file(path)
+	if workspace_file == nil then
+		return nil
+	end
+	local root = parent(workspace_file)
+	return {
+		root = root,
+		file = workspace_file,
+		flavor = M.get_flavor(root),
+		name = M.get_name(workspace_file),
+	}
+end
+
+-- The output base contains a DO_NOT_BUILD_HERE file with the path of the workspace it belongs to.
+function M.find_cache_file(path)
+	return M.find_file(path, "DO_NOT_BUILD_HERE")
+end
+
+function M.get_workspace_from_cache(path)
+	local cache_file = M.find_cache_file(path)
+	if cache_file == nil then
+		return nil
+	end
+	return M.read_file(cache_file)
+end
+
+function M.clear()
+	found_files = {}
+	file_contents = {}
+end
+
+return M
@@ -0,0 +1,92 @@
+"""
+Indexes of workspaces that are built in a background thread, so that the editor is not blocked while a large
+workspace is crawled and parsed. Files changed while an index is built are updated once the build is done. A failed
+build is not retried until a file of the workspace changes.
+"""
+
+import threading
+from crawler import is_ignored
+
+
+class BackgroundIndexes:
+    def __init__(self, create):
+        # workspace root -> built index
+        self.create = create
+        self.indexes = {}
+        # workspace root -> building thread
+        self.threads = {}
+        # workspace root -> files changed while its index is built
+        self.changed = {}
+        # workspace root -> exception of the failed build
+        self.failed = {}
+        self.lock = threading.Lock()
+
+    def start(self, workspace_root):
+        """
+        Starts building the index of 'workspace_root' unless it is built, being built or its build failed.
+        """
+        with self.lock:
+            if (
+                workspace_root in self.indexes
+                or workspace_root in self.threads
+                or workspace_root in self.failed
+            ):
+                return
+            thread = threading.Thread(
+                target=self._build, args=(workspace_root,), daemon=True
+            )
+            self.threads[workspace_root] = thread
+            self.changed[workspace_root] = []
+        thread.start()
+
+    def _build(self, workspace_root):
+        index = None
+        error = None
+        try:
+            index = self.create(workspace_root)
+        except Exception as e:
+            error = e
+        with self.lock:
+            changed = self.changed.pop(workspace_root)
+            if index is not None:
+                for fname in changed:
+                    index.update_file(fname)
+                self.indexes[workspace_root] = index
+            else:
+                self.failed[workspace_root] = error
+            del self.threads[workspace_root]
+
+    def get(self, workspace_root, wait=True):
+        """
+        Returns the index of 'workspace_root'. Without 'wait' None is returned until the index is built or if its build
+        failed, with 'wait' the error of the failed build is raised.
+        """
+        self.start(workspace_root)
+        with self.lock:
+            thread = self.threads.get(workspace_root)
+        if wait and thread is not None:
+            thread.join()
+        with self.lock:
+            if wait and workspace_root in self.failed:
+                raise self.failed[workspace_root]
+            return self.indexes.get(workspace_root)
+
+    def file_changed(self, fname):
+        """
+        Updates 'fname' in the indexes of the workspaces containing it, unless the workspace doesn't include it.
+        """
+        with self.lock:
+            for root in list(self.failed):
+                if fname.startswith(root) and not is_ignored(root, fname):
+                    # built again by the next get()
+                    del self.failed[root]
+            roots = [
+                root
+                for root in list(self.indexes) + list(self.changed)
+                if fname.startswith(root) and not is_ignored(root, fname)
+            ]
+            for root in roots:
+                if root in self.changed:
+                    self.changed[root].append(fname)
+                else:
+                    self.indexes[root].update_file(fname)
@@ -21,6 +21,67 @@ function! GoToBazelTarget()
   call search(pattern, "w", 0, 500)
 endfunction
 
+function! FindBazelReferences()
+    let items = py3eval("bazel_vim.find_references()")
+    if items is v:null
+        echo "Indexing the workspace, try again in a moment"
+        return
+    endif
+    if empty(items)
+        echo "No references found"
+        return
+    endif
+    call setqflist([], ' ', {'title': 'Bazel references', 'items': items})
+    copen
+endfunction
+
+function! s:BazelLintOutput(job_id, data, event)
+    let output = join(a:data, '')
+    if empty(output)
+        echoerr "Bazel lint failed"
+        return
+    endif
+    let response = json_decode(output)
+    if has_key(response, 'error')
+        echoerr "Bazel lint failed: " . response.error
+        return
+    endif
+    let items = map(response.result, {_, problem -> {'filename': problem.file, 'lnum': problem.line, 'col': problem.col + 1, 'text': problem.message, 'type': 'E'}})
+    if empty(items)
+        echo "No dangling labels found"
+        return
+    endif
+    call setqflist([], ' ', {'title': 'Bazel lint', 'items': items})
+    copen
+endfunction
+
+" lints in the background, the quickfix list is filled when it is done
+function! BazelLint()
+    let cmd = py3eval("bazel_vim.lint_command()")
+    call jobstart(cmd, {'stdout_buffered': v:true, 'on_stdout': function('s:BazelLintOutput')})
+endfunction
+
+function! FindBazelWorkspaceSymbols(query)
+    return py3eval("bazel_vim.find_workspace_symbols(vim.eval('a:query'))")
+endfunction
+
+function! CompleteBazelLabel(prefix)
+    return py3eval("bazel_vim.complete_label(vim.eval('a:prefix'))")
+endfunction
+
+" omnifunc completing the label in front of the cursor, e.g. setlocal omnifunc=BazelLabelComplete
+function! BazelLabelComplete(findstart, base)
+    if a:findstart
+        let line = strpart(getline('.'), 0, col('.') - 1)
+        return match(line, '\v[^"'' \t,\[(=]*$')
+    endif
+    return CompleteBazelLabel(a:base)
+endfunction
+
+function! GetBazelOwningTargets(fname)
+    return py3eval("bazel_vim.get_owning_targets(vim.eval('a:fname'))")
+endfunction
+
 function! PrintLabel()
     python3 bazel_vim.print_label()
 endfunction
@@ -31,3 +92,12 @@ endfunction
 
 command! -nargs=0 PrintLabel call PrintLabel()
 command! -nargs=0 GetLabel call GetLabel()
+command! -nargs=0 BazelLint call BazelLint()
+command! -nargs=? BazelSymbols lua require("bazel").select_workspace_symbol(<q-args> ~= "" and <q-args> or nil)
+command! -nargs=0 BazelStats lua require("bazel.telemetry").show()
+
+augroup bazel_vim
+    autocmd!
+    autocmd BufWritePost BUILD,BUILD.bazel,*.bzl python3 bazel_vim.file_changed(vim.eval('expand("<afile>:p")'))
+    autocmd BufEnter BUILD,BUILD.bazel,*.bzl python3 bazel_vim.buffer_entered(vim.eval('expand("<afile>:p")'))
+augroup END
@@ -1,8 +1,15 @@
 from copy import copy
 import ast
+import io
+import keyword
 import os
-from label import parse_label, resolve_label, resolve_label_str, resolve_filename
-from workspace import find_workspace_root, find_build_name
+import re
+import tokenize
+from bisect import bisect_right
+from label import Label, parse_label, resolve_label, resolve_label_str, resolve_filename
+from workspace import find_workspace_root, find_build_name, find_build_file
+from evaluator import find_target, evaluate, flatten
+import starlark_cache
 
 
 def parse_module_text(s):
@@ -17,6 +24,24 @@ def parse_file_by_name(fname):
     return parse_file(open(fname))
 
 
+def collect_file_targets(fname):
+    """
+    Returns [(lineno, name)] of collect_targets of the file 'fname', from the starlark_cache if the file didn't change
+    since it was parsed, also in an earlier session.
+    """
+    key = starlark_cache.file_key(fname)
+    table = starlark_cache.load(key)
+    if table is None:
+        table = starlark_cache.store(
+            key,
+            [
+                (name, starlark_cache.KIND_VARIABLE, "", lineno, 0)
+                for lineno, name in collect_targets(parse_file_by_name(fname))
+            ],
+        )
+    return [(row, name) for name, _, _, row, _ in table]
+
+
 def collect_imported_symbols(fname, workspace_root=None):
     if workspace_root is None:
         workspace_root = find_workspace_root(fname)
@@ -43,7 +68,7 @@ def collect_imported_symbols(fname, workspace_root=None):
             extension_label, resolve_filename(fname, workspace_root), workspace_root
         )
         yield (path, 1, extension_label, extension_label)
-        targets = list(collect_targets(parse_file_by_name(path)))
+        targets = collect_file_targets(path)
 
         for symbol in stmt.value.args[1:]:
             if not isinstance(symbol, ast.Str):
@@ -128,6 +153,111 @@ def collect_targets(module):
         #    print(f"Ignoring {ast.dump(stmt)}: Don't know how to handle {type(stmt)}")
 
 
+def collect_loads(module):
+    """
+    Yields (extension_label, alias, name) for every symbol loaded in 'module'.
+    """
+    assert isinstance(module, ast.Module)
+    for stmt in module.body:
+        if not is_load_call(stmt):
+            continue
+        extension_label = stmt.value.args[0].s
+        for symbol in stmt.value.args[1:]:
+            if isinstance(symbol, ast.Str):
+                yield (extension_label, symbol.s, symbol.s)
+        for kw in stmt.value.keywords:
+            if isinstance(kw.value, ast.Str):
+                yield (extension_label, kw.arg, kw.value.s)
+
+
+def is_load_call(stmt):
+    if not isinstance(stmt, ast.Expr) or not isinstance(stmt.value, ast.Call):
+        return False
+    if not isinstance(stmt.value.func, ast.Name) or stmt.value.func.id != "load":
+        return False
+    return bool(stmt.value.args) and isinstance(stmt.value.args[0], ast.Str)
+
+
+def is_label_like(s):
+    return s.startswith(("//", ":", "@"))
+
+
+# attributes whose bare strings (e.g. srcs = ["foo.cc"]) are labels
+LABEL_ATTRIBUTES = {
+    "actual",
+    "data",
+    "deps",
+    "exports",
+    "hdrs",
+    "implementation_deps",
+    "plugins",
+    "runtime_deps",
+    "src",
+    "srcs",
+    "tests",
+    "textual_hdrs",
+    "tools",
+}
+
+
+def is_bare_label(s):
+    # bare strings in attribute lists like srcs = ["foo.cc"] or deps = ["bar"]
+    return bool(s) and not s.startswith(("-", "$")) and not any(c.isspace() for c in s)
+
+
+def collect_references(module, is_build_file=True):
+    """
+    Returns a list of (lineno, col_offset, kind, value) for 'module'.
+    kind "label": 'value' is a string that refers to a target or file (the "name" of a rule is not a reference).
+    Bare strings are only labels in the attributes of LABEL_ATTRIBUTES of BUILD files.
+    kind "call": 'value' is the name of a called function, e.g. a rule or a macro.
+    """
+
+    class Visitor(ast.NodeVisitor):
+        def __init__(self):
+            self.result = []
+
+        def add(self, node, kind, value):
+            self.result.append((node.lineno, node.col_offset, kind, value))
+
+        def visit_Expr(self, node):
+            if is_load_call(node):
+                self.add(node.value.args[0], "label", node.value.args[0].s)
+                return
+            self.generic_visit(node)
+
+        def visit_Call(self, node):
+            if isinstance(node.func, ast.Name):
+                if node.func.id == "glob":
+                    # patterns are not labels
+                    return
+                self.add(node.func, "call", node.func.id)
+            else:
+                self.visit(node.func)
+            for arg in node.args:
+                self.visit(arg)
+            for kw in node.keywords:
+                if kw.arg == "name":
+                    continue
+                if not is_build_file or kw.arg not in LABEL_ATTRIBUTES:
+                    self.visit(kw.value)
+                    continue
+                elements = kw.value.elts if isinstance(kw.value, ast.List) else [kw.value]
+                for element in elements:
+                    if isinstance(element, ast.Str) and is_bare_label(element.s):
+                        self.add(element, "label", element.s)
+                    else:
+                        self.visit(element)
+
+        def visit_Str(self, node):
+            if is_label_like(node.s):
+                self.add(node, "label", node.s)
+
+    visitor = Visitor()
+    visitor.visit(module)
+    return visitor.result
+
+
 def find_symbol(symbol, fname, workspace_root=None):
     if workspace_root is None:
         workspace_root = find_workspace_root(fname)
@@ -150,11 +280,58 @@ def find_definition(label_str, fname, workspace_root=None):
     build_fname = resolve_label(build_label, workspace_root)
     # print(f"build_fname: {build_fname}")
 
-    for lineno, name in collect_targets(parse_file_by_name(build_fname)):
+    for lineno, name in collect_file_targets(build_fname):
         if name == label.target:
             # print(f"{build_fname}:{lineno}: {label.target}")
             return build_fname, lineno
 
+    if not label.repository:
+        # targets created by macros, loops or list comprehensions
+        target = find_target(build_fname, label.target, workspace_root)
+        if target is not None:
+            return build_fname, target.lineno
+
+
+def is_rule_like(target):
+    """
+    Returns True if 'target' was created by a rule and not by a macro of an external repository that might create
+    targets with other names. Native rules and rules loaded from rules_* repositories are rule like.
+    """
+    if target.extension is None:
+        return True
+    return parse_label(target.extension, Label(target="BUILD")).repository.startswith("rules_")
+
+
+def find_owning_targets(fname, workspace_root=None):
+    """
+    Returns the labels of the targets whose srcs or hdrs contain 'fname' (listed or matched by glob), using only the
+    evaluated BUILD file of its package, [] if no target contains it.
+    Returns None if that can't be decided locally (statements that can't be evaluated, external macros, ...).
+    """
+    if workspace_root is None:
+        workspace_root = find_workspace_root(fname)
+    build_fname = find_build_file(fname)
+    location = resolve_filename(build_fname, workspace_root)
+    file_label = resolve_filename(fname, workspace_root)
+    targets, errors = evaluate(build_fname, workspace_root)
+    if errors:
+        # skipped statements might create owners
+        return None
+
+    owners = []
+    for name, target in targets.items():
+        listed = False
+        for attr in ["srcs", "hdrs"]:
+            for element in flatten(target.attributes.get(attr)):
+                if element and parse_label(element, location) == file_label:
+                    listed = True
+        if not listed:
+            continue
+        if not is_rule_like(target):
+            return None
+        owners.append(f"//{location.package}:{name}")
+    return sorted(owners)
+
 
 def find_node(root, row, col):
     """
@@ -182,32 +359,163 @@ def find_node(root, row, col):
     return visitor.result
 
 
+# strings are skipped as a whole, escaped characters (including escaped newlines) are skipped inside and outside of
+# strings
+_LEXEME = re.compile(r'"""|\'\'\'|"|\'|#|\\.|[()\[\]{}]|\n', re.DOTALL)
+
+
+def statement_starts(text):
+    """
+    Returns the 1-based rows of 'text' where top-level statements start. Lines in brackets, in (triple-quoted)
+    strings, after an escaped newline, blank lines and comments don't start statements.
+    """
+    starts = []
+    depth = 0
+    quote = None
+    row = 1
+    line_start = 0
+    position = 0
+    continued = False
+    while True:
+        if quote is None and depth == 0 and not continued and position == line_start:
+            if text[line_start : line_start + 1] not in ("", " ", "\t", "#", "\n"):
+                starts.append(row)
+        match = _LEXEME.search(text, position)
+        if match is None:
+            return starts
+        lexeme = match.group()
+        position = match.end()
+        continued = False
+        if lexeme == "\n" or lexeme == "\\\n":
+            row += 1
+            line_start = position
+            if quote is not None and len(quote) == 1 and lexeme == "\n":
+                # unterminated string
+                quote = None
+            continued = lexeme == "\\\n"
+        elif quote is not None:
+            if lexeme == quote:
+                quote = None
+        elif lexeme in ('"""', "'''", '"', "'"):
+            quote = lexeme
+        elif lexeme == "#":
+            end = text.find("\n", position)
+            position = len(text) if end == -1 else end
+        elif lexeme in "([{":
+            depth += 1
+        elif lexeme in ")]}":
+            depth = max(depth - 1, 0)
+
+
+def find_statement(lines, row):
+    """
+    Returns the 1-based (first, last) rows of the top-level statement of 'lines' that contains 'row'.
+    """
+    starts = statement_starts("\n".join(lines))
+    i = bisect_right(starts, row)
+    first = starts[i - 1] if i > 0 else 1
+    last = starts[i] - 1 if i < len(starts) else len(lines)
+    return first, last
+
+
+def _tokenize(source):
+    """
+    Returns the tokens of 'source' up to the first error, e.g. of unclosed brackets or strings while editing.
+    """
+    tokens = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            tokens.append(token)
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    return tokens
+
+
+def find_token_at(text, row, col):
+    """
+    Returns ("string", value) or ("name", identifier) of the last string or name starting in 'row' at or before 'col'
+    (like find_node) or None. Only the top-level statement containing 'row' is tokenized, so the rest of 'text' doesn't
+    need to be valid starlark.
+    """
+    lines = text.split("\n")
+    if not 1 <= row <= len(lines):
+        return None
+    first, last = find_statement(lines, row)
+    tokens = _tokenize("\n".join(lines[first - 1 : last]) + "\n")
+    row = row - first + 1
+    depth = 0
+    in_signature = False
+    result = None
+    for i, token in enumerate(tokens):
+        if token.type == tokenize.OP and token.string in "([{":
+            depth += 1
+        elif token.type == tokenize.OP and token.string in ")]}":
+            depth -= 1
+        elif token.string == "def":
+            in_signature = True
+        elif token.string == ":" and depth == 0:
+            in_signature = False
+        if token.start[0] != row or token.start[1] > col:
+            continue
+        if in_signature and token.type == tokenize.NAME:
+            # function and parameter names are definitions
+            continue
+        if token.type == tokenize.STRING:
+            try:
+                result = ("string", ast.literal_eval(token.string))
+            except (ValueError, SyntaxError):
+                continue
+        elif token.type == tokenize.NAME and not keyword.iskeyword(token.string):
+            previous = tokens[i - 1].string if i > 0 else ""
+            following = tokens[i + 1].string if i + 1 < len(tokens) else ""
+            if previous == "." or (depth > 0 and following == "="):
+                # attributes and keyword arguments are not names in the module
+                continue
+            result = ("name", token.string)
+    return result
+
+
+def find_thing_at(text, row, col):
+    """
+    Returns ("string", value) or ("name", identifier) under the cursor or None, see find_token_at.
+    Falls back to parsing all of 'text' if the statement can't be tokenized.
+    """
+    result = find_token_at(text, row, col)
+    if result is not None:
+        return result
+    try:
+        node = find_node(parse_module_text(text), row, col)
+    except SyntaxError:
+        return None
+    if isinstance(node, ast.Str):
+        return ("string", node.s)
+    if isinstance(node, ast.Name):
+        return ("name", node.id)
+    return None
+
+
 def find_definition_at(fname, text, row, col, workspace_root=None):
     if workspace_root is None:
         workspace_root = find_workspace_root(fname)
-    module = parse_module_text(text)
-    node = find_node(module, row, col)
-    if isinstance(node, ast.Str):
-        result = find_definition(node.s, fname, workspace_root) 
+    thing = find_thing_at(text, row, col)
+    if thing is None:
+        return None
+    kind, value = thing
+    if kind == "string":
+        result = find_definition(value, fname, workspace_root)
         if not result:
-            return find_symbol(node.s, fname, workspace_root)
+            return find_symbol(value, fname, workspace_root)
         return result
-    elif isinstance(node, ast.Name):
-        return find_symbol(node.id, fname, workspace_root)
-    else:
-        # print(f"Don't know how to go to {type(node)}")
-        return None
+    return find_symbol(value, fname, workspace_root)
 
 
 def get_target_label(fname, text, row, col, workspace_root=None):
     if workspace_root is None:
         workspace_root = find_workspace_root(fname)
-    module = parse_module_text(text)
-    node = find_node(module, row, col)
-    if isinstance(node, ast.Str):
-        return str(parse_label(node.s, resolve_filename(fname, workspace_root)))
-    else:
+    thing = find_thing_at(text, row, col)
+    if thing is None or thing[0] != "string":
         return None
+    return str(parse_label(thing[1], resolve_filename(fname, workspace_root)))
 
 
 def print_label(fname, text, row, col, workspace_root=None):
@@ -0,0 +1,200 @@
+"""
+Command line interface to the bazel file navigation, usable without the editor:
+
+    PYTHONPATH=plugin python -m bazel_cli definition BUILD 12 8
+    PYTHONPATH=plugin python -m bazel_cli label BUILD 12 8
+    PYTHONPATH=plugin python -m bazel_cli index /path/to/workspace
+    PYTHONPATH=plugin python -m bazel_cli lint /path/to/workspace
+    PYTHONPATH=plugin python -m bazel_cli symbols /path/to/workspace cc_lib
+    PYTHONPATH=plugin python -m bazel_cli complete /path/to/workspace //foo/b --file foo/BUILD
+    PYTHONPATH=plugin python -m bazel_cli batch < requests.jsonl
+
+Every command writes one JSON line {"result": ...} or {"error": "..."} to stdout. 'batch' reads one JSON request per
+line from stdin, e.g. {"id": 1, "command": "definition", "file": "BUILD", "row": 12, "col": 8}, and answers each with a
+JSON line that repeats the "id". Rows are 1-based, columns 0-based. Caches are kept between the requests of a batch.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import bazel
+import completion
+import lint
+import references
+import symbols
+from workspace import find_workspace_root
+
+
+def _read_text(request):
+    if "text" in request:
+        return request["text"]
+    with open(request["file"]) as f:
+        return f.read()
+
+
+def _workspace_root(request, path):
+    return request.get("workspace") or find_workspace_root(path)
+
+
+def find_definition(request):
+    fname = os.path.abspath(request["file"])
+    result = bazel.find_definition_at(
+        fname,
+        _read_text(request),
+        request["row"],
+        request["col"],
+        _workspace_root(request, fname),
+    )
+    if result is None:
+        return None
+    path, lineno = result
+    return {"file": path, "line": lineno}
+
+
+def get_label(request):
+    fname = os.path.abspath(request["file"])
+    return bazel.get_target_label(
+        fname,
+        _read_text(request),
+        request["row"],
+        request["col"],
+        _workspace_root(request, fname),
+    )
+
+
+def build_index(request):
+    workspace_root = os.path.abspath(request["workspace"])
+    start = time.monotonic()
+    index = references.ReferenceIndex(workspace_root)
+    index.build()
+    return {
+        "files": len(index.files),
+        "labels": sum(1 for files in index.label_files.values() if files),
+        "symbols": sum(1 for files in index.symbol_files.values() if files),
+        "seconds": round(time.monotonic() - start, 3),
+    }
+
+
+def lint_workspace(request):
+    workspace_root = os.path.abspath(request["workspace"])
+    return [
+        {"file": path, "line": lineno, "col": col_offset, "message": message}
+        for path, lineno, col_offset, message in lint.lint_workspace(
+            workspace_root, request.get("jobs")
+        )
+    ]
+
+
+def find_symbols(request):
+    workspace_root = os.path.abspath(request["workspace"])
+    return [
+        {
+            "name": symbol.name,
+            "kind": symbol.kind,
+            "label": symbol.label,
+            "file": symbol.path,
+            "line": symbol.lineno,
+        }
+        for symbol in symbols.find_symbols(
+            request["query"],
+            workspace_root,
+            request.get("limit", symbols.DEFAULT_LIMIT),
+        )
+    ]
+
+
+def complete_label(request):
+    workspace_root = os.path.abspath(request["workspace"])
+    fname = os.path.abspath(request.get("file", workspace_root))
+    return completion.complete_label(
+        request["prefix"],
+        fname,
+        workspace_root,
+        request.get("limit", completion.DEFAULT_LIMIT),
+    )
+
+
+COMMANDS = {
+    "definition": find_definition,
+    "label": get_label,
+    "index": build_index,
+    "lint": lint_workspace,
+    "symbols": find_symbols,
+    "complete": complete_label,
+}
+
+
+def handle(request):
+    response = {"id": request["id"]} if "id" in request else {}
+    try:
+        command = COMMANDS.get(request.get("command"))
+        if command is None:
+            raise Exception(f"unknown command {request.get('command')!r}")
+        response["result"] = command(request)
+    except Exception as e:
+        response["error"] = f"{type(e).__name__}: {e}"
+    return response
+
+
+def write(response, out):
+    out.write(json.dumps(response) + "\n")
+    out.flush()
+
+
+def run_batch(lines, out):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            write({"error": f"invalid request: {e}"}, out)
+            continue
+        write(handle(request), out)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="bazel_cli", description=__doc__.split("\n\n")[0].strip()
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ["definition", "label"]:
+        command = commands.add_parser(name)
+        command.add_argument("file")
+        command.add_argument("row", type=int)
+        command.add_argument("col", type=int)
+        command.add_argument("--workspace")
+    commands.add_parser("index").add_argument("workspace")
+    command = commands.add_parser("lint")
+    command.add_argument("workspace")
+    command.add_argument("--jobs", type=int)
+    command = commands.add_parser("symbols")
+    command.add_argument("workspace")
+    command.add_argument("query")
+    command.add_argument("--limit", type=int)
+    command = commands.add_parser("complete")
+    command.add_argument("workspace")
+    command.add_argument("prefix")
+    command.add_argument("--file")
+    command.add_argument("--limit", type=int)
+    commands.add_parser("batch")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "batch":
+        run_batch(sys.stdin, sys.stdout)
+        return 0
+    request = {key: value for key, value in vars(args).items() if value is not None}
+    response = handle(request)
+    write(response, sys.stdout)
+    return 1 if "error" in response else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Evaluates glob() like bazel: patterns are matched relative to the package directory, '*' matches within a path
+segment, '**' matches any number of segments, and subpackages (directories with a BUILD file) are not entered.
+
+Directory listings are cached until the modification time of the directory changes.
+"""
+
+import os
+import re
+from workspace import BUILD_FILES
+
+# directory -> (mtime_ns, files, directories)
+_listings = {}
+# pattern segment -> compiled regex
+_segments = {}
+
+
+def list_directory(directory):
+    """
+    Returns (files, directories) of 'directory', symlinks are followed. Returns empty lists if it can't be read.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return [], []
+    cached = _listings.get(directory)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
+    files = []
+    directories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                (directories if is_dir else files).append(entry.name)
+    except OSError:
+        return [], []
+    files.sort()
+    directories.sort()
+    _listings[directory] = (mtime, files, directories)
+    return files, directories
+
+
+def is_package(directory):
+    files, _ = list_directory(directory)
+    return any(name in files for name in BUILD_FILES)
+
+
+def _segment_regex(segment):
+    if segment not in _segments:
+        parts = []
+        for c in segment:
+            if c == "*":
+                parts.append("[^/]*")
+            elif c == "?":
+                parts.append("[^/]")
+            else:
+                parts.append(re.escape(c))
+        _segments[segment] = re.compile("".join(parts) + r"\Z")
+    return _segments[segment]
+
+
+def _split(pattern):
+    if pattern.startswith("/") or not pattern:
+        raise ValueError(f"invalid glob pattern {pattern!r}")
+    return [segment for segment in pattern.split("/") if segment != "."]
+
+
+def _subdirectories(directory, directories, visited):
+    result = []
+    for name in directories:
+        path = os.path.join(directory, name)
+        # a directory becoming a package changes its modification time, not the one of its parent
+        visited.add(path)
+        if not is_package(path):
+            result.append(name)
+    return result
+
+
+def _walk(directory, prefix, segments, exclude_directories, result, visited):
+    visited.add(directory)
+    files, directories = list_directory(directory)
+    segment, rest = segments[0], segments[1:]
+    if segment == "**":
+        subdirectories = _subdirectories(directory, directories, visited)
+        if rest:
+            # '**' matches zero segments
+            _walk(directory, prefix, rest, exclude_directories, result, visited)
+        else:
+            result.update(prefix + name for name in files)
+            if not exclude_directories:
+                result.update(prefix + name for name in subdirectories)
+        for name in subdirectories:
+            path = os.path.join(directory, name)
+            _walk(
+                path,
+                prefix + name + "/",
+                segments,
+                exclude_directories,
+                result,
+                visited,
+            )
+        return
+    regex = _segment_regex(segment)
+    if not rest:
+        result.update(prefix + name for name in files if regex.match(name))
+        if exclude_directories:
+            return
+    matching = [name for name in directories if regex.match(name)]
+    for name in _subdirectories(directory, matching, visited):
+        if not rest:
+            result.add(prefix + name)
+        else:
+            path = os.path.join(directory, name)
+            _walk(path, prefix + name + "/", rest, exclude_directories, result, visited)
+
+
+def _matches(segments, parts):
+    if not segments:
+        return not parts
+    if segments[0] == "**":
+        return any(_matches(segments[1:], parts[i:]) for i in range(len(parts) + 1))
+    if not parts or not _segment_regex(segments[0]).match(parts[0]):
+        return False
+    return _matches(segments[1:], parts[1:])
+
+
+def glob(
+    package_directory, include, exclude=(), exclude_directories=True, visited=None
+):
+    """
+    Returns the sorted package relative paths of the files in 'package_directory' matching one of the 'include'
+    patterns and none of the 'exclude' patterns. Directories are only returned if 'exclude_directories' is false.
+    The scanned directories are added to the set 'visited'.
+    """
+    if visited is None:
+        visited = set()
+    result = set()
+    for pattern in include:
+        _walk(
+            package_directory, "", _split(pattern), exclude_directories, result, visited
+        )
+    excluded = [_split(pattern) for pattern in exclude]
+    return sorted(
+        path
+        for path in result
+        if not any(_matches(segments, path.split("/")) for segments in excluded)
+    )
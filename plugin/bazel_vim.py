@@ -1,8 +1,15 @@
 import bazel
+import completion
+import references
+import symbols
 import vim
+import linecache
 import os.path
 import subprocess
-from workspace import find_build_file
+import sys
+from workspace import find_build_file, find_workspace_root, set_bazel_cmd
+
+set_bazel_cmd(lambda: vim.eval("get(g:, 'bazel_cmd', '')"))
 
 
 def jump_to_location(filename, line):
@@ -43,3 +50,85 @@ def get_target_label():
 
 def get_build_file():
     return find_build_file(vim.current.buffer.name)
+
+
+def get_owning_targets(fname):
+    try:
+        return bazel.find_owning_targets(fname)
+    except Exception:
+        # let the caller fall back to bazel query
+        return None
+
+
+def find_references():
+    row, col = vim.current.window.cursor
+    result = references.find_references_at(
+        vim.current.buffer.name, "\n".join(vim.current.buffer), row, col, wait=False
+    )
+    if result is None:
+        # the index is built in the background
+        return None
+    return [
+        {
+            "filename": path,
+            "lnum": lineno,
+            "col": col_offset + 1,
+            "text": linecache.getline(path, lineno).strip(),
+        }
+        for path, lineno, col_offset in result
+    ]
+
+
+def lint_command():
+    """
+    Returns the command linting the workspace of the current buffer with the command line interface. Lint runs in
+    worker processes, which must not be forked from the python host of the editor.
+    """
+    workspace_root = find_workspace_root(vim.current.buffer.name)
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bazel_cli.py")
+    return [sys.executable, cli, "lint", workspace_root]
+
+
+def find_workspace_symbols(query):
+    workspace_root = find_workspace_root(vim.current.buffer.name)
+    result = symbols.find_symbols(query, workspace_root, wait=False)
+    if result is None:
+        # the index is built in the background
+        return None
+    return [
+        {
+            "name": symbol.name,
+            "kind": symbol.kind,
+            "label": symbol.label,
+            "filename": symbol.path,
+            "lnum": symbol.lineno,
+        }
+        for symbol in result
+    ]
+
+
+def complete_label(prefix):
+    fname = vim.current.buffer.name
+    return completion.complete_label(
+        prefix, fname, find_workspace_root(fname), wait=False
+    )
+
+
+def buffer_entered(fname):
+    """
+    Starts building the indexes of the workspace of 'fname' in the background, so they are ready when needed.
+    """
+    try:
+        workspace_root = find_workspace_root(fname)
+    except Exception:
+        return
+    completion.get_index(workspace_root, wait=False)
+    references.get_index(workspace_root, wait=False)
+    symbols.get_index(workspace_root, wait=False)
+
+
+def file_changed(fname):
+    linecache.checkcache(fname)
+    completion.file_changed(fname)
+    references.file_changed(fname)
+    symbols.file_changed(fname)
@@ -0,0 +1,251 @@
+"""
+Completion of labels from a trie of the packages of a workspace and the targets of their BUILD files, without
+invoking bazel:
+
+    //foo/b     -> //foo/bar, //foo/baz, //foo/baz/qux, ...
+    //foo/bar:l -> //foo/bar:lib, //foo/bar:lib_test, ...
+    :l          -> :lib, :lib_test, ... of the package of the current file
+
+The targets are found by evaluating the BUILD files like go to definition, so targets of macros are completed too.
+Packages are ranked by depth, targets by length, both alphabetically after that. The trie is built in the background
+and updated incrementally when a BUILD file changes.
+"""
+
+import os
+from bisect import bisect_left, insort
+from bazel import parse_file_by_name, collect_targets
+from evaluator import Evaluator
+from label import Label, canonicalize, resolve_filename
+from crawler import find_starlark_files
+from background import BackgroundIndexes
+from workspace import BUILD_FILES
+
+DEFAULT_LIMIT = 50
+
+
+class PackageNode:
+    def __init__(self):
+        # path segment -> PackageNode
+        self.children = {}
+        # sorted path segments of the children
+        self.segments = []
+        # sorted target names if the directory is a package, otherwise None
+        self.targets = None
+
+    def child(self, segment):
+        if segment not in self.children:
+            self.children[segment] = PackageNode()
+            insort(self.segments, segment)
+        return self.children[segment]
+
+    def remove_child(self, segment):
+        del self.children[segment]
+        self.segments.pop(bisect_left(self.segments, segment))
+
+    def segments_with_prefix(self, prefix):
+        i = bisect_left(self.segments, prefix)
+        while i < len(self.segments) and self.segments[i].startswith(prefix):
+            yield self.segments[i]
+            i += 1
+
+
+def _split_package(package):
+    return package.split("/") if package else []
+
+
+def _ranked_targets(targets, prefix, limit):
+    i = bisect_left(targets, prefix)
+    matches = []
+    while i < len(targets) and targets[i].startswith(prefix):
+        matches.append(targets[i])
+        i += 1
+    matches.sort(key=lambda name: (len(name), name))
+    return matches[:limit]
+
+
+def _subpackages(parents):
+    for package, node in parents:
+        for segment in node.segments:
+            yield f"{package}/{segment}", node.children[segment]
+
+
+def _target_names(build_fname, workspace_root):
+    """
+    Returns the names of the targets of 'build_fname', also those created by macros, loops and list comprehensions.
+    """
+    try:
+        # not memoized like evaluate_build_file(), the index only keeps the names of the targets of all packages
+        return set(Evaluator(workspace_root, build_fname).evaluate())
+    except Exception:
+        # only the names written in the file
+        return set(name for _, name in collect_targets(parse_file_by_name(build_fname)))
+
+
+class LabelIndex:
+    def __init__(self, workspace_root):
+        self.workspace_root = workspace_root
+        self.root = PackageNode()
+        # path of the BUILD file -> mtime
+        self.files = {}
+
+    def build(self):
+        for path in find_starlark_files(self.workspace_root):
+            if os.path.basename(path) in BUILD_FILES:
+                self.update_file(path)
+
+    def find_node(self, package):
+        node = self.root
+        for segment in _split_package(package):
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def remove_package(self, package):
+        segments = _split_package(package)
+        path = [self.root]
+        for segment in segments:
+            node = path[-1].children.get(segment)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].targets = None
+        # drop the directories that don't lead to packages anymore
+        for parent, segment, node in reversed(list(zip(path, segments, path[1:]))):
+            if node.targets is not None or node.children:
+                break
+            parent.remove_child(segment)
+
+    def update_file(self, path):
+        if os.path.basename(path) not in BUILD_FILES:
+            return
+        directory = os.path.dirname(path)
+        package = os.path.relpath(directory, self.workspace_root)
+        if package == ".":
+            package = ""
+        if not os.path.exists(path):
+            self.files.pop(path, None)
+            others = [os.path.join(directory, name) for name in BUILD_FILES]
+            if not any(os.path.exists(other) for other in others):
+                self.remove_package(package)
+            return
+        mtime = os.path.getmtime(path)
+        if self.files.get(path) == mtime:
+            return
+        self.files[path] = mtime
+        try:
+            targets = sorted(_target_names(path, self.workspace_root))
+        except Exception:
+            # keep the targets of the last version that parsed while the file is edited
+            node = self.find_node(package)
+            if node is not None and node.targets is not None:
+                return
+            targets = []
+        node = self.root
+        for segment in _split_package(package):
+            node = node.child(segment)
+        node.targets = targets
+
+    def complete_packages(self, package_prefix, limit):
+        """
+        Returns the packages starting with 'package_prefix', shallow ones first.
+        """
+        segments = package_prefix.split("/")
+        node = self.root
+        for segment in segments[:-1]:
+            node = node.children.get(segment)
+            if node is None:
+                return []
+        parent = "/".join(segments[:-1])
+        level = (
+            (f"{parent}/{segment}" if parent else segment, node.children[segment])
+            for segment in node.segments_with_prefix(segments[-1])
+        )
+        # breadth first: packages are ordered by depth and alphabetically within a depth, a level is only expanded
+        # as far as needed
+        result = []
+        while True:
+            parents = []
+            for package, current in level:
+                if current.targets is not None:
+                    result.append(package)
+                    if len(result) == limit:
+                        return result
+                if current.children:
+                    parents.append((package, current))
+            if not parents:
+                return result
+            level = _subpackages(parents)
+
+    def complete(self, prefix, current_package=None, limit=DEFAULT_LIMIT):
+        """
+        Returns up to 'limit' labels starting with 'prefix' ("//package_prefix", "//package:target_prefix" or
+        ":target_prefix" relative to 'current_package').
+        """
+        if prefix.startswith(":"):
+            if current_package is None:
+                return []
+            node = self.find_node(current_package)
+            if node is None or node.targets is None:
+                return []
+            return [
+                f":{name}" for name in _ranked_targets(node.targets, prefix[1:], limit)
+            ]
+        if not prefix.startswith("//"):
+            # external repositories are not indexed
+            return []
+        package, colon, target_prefix = prefix[2:].partition(":")
+        if colon:
+            node = self.find_node(package)
+            if node is None or node.targets is None:
+                return []
+            if not target_prefix:
+                # the default target is the one named like the package
+                default = (
+                    canonicalize(Label(package=package)).target if package else None
+                )
+                targets = sorted(
+                    node.targets, key=lambda name: (name != default, len(name), name)
+                )
+                return [f"//{package}:{name}" for name in targets[:limit]]
+            return [
+                f"//{package}:{name}"
+                for name in _ranked_targets(node.targets, target_prefix, limit)
+            ]
+        return [f"//{package}" for package in self.complete_packages(package, limit)]
+
+
+def _create_index(workspace_root):
+    index = LabelIndex(workspace_root)
+    index.build()
+    return index
+
+
+_indexes = BackgroundIndexes(_create_index)
+
+
+def get_index(workspace_root, wait=True):
+    """
+    Returns the index of 'workspace_root', the first call builds it. Without 'wait' it is built in the background and
+    None is returned until it is done.
+    """
+    return _indexes.get(workspace_root, wait)
+
+
+def file_changed(fname):
+    _indexes.file_changed(fname)
+
+
+def complete_label(prefix, fname, workspace_root, limit=DEFAULT_LIMIT, wait=True):
+    """
+    Returns the labels starting with 'prefix', relative labels are completed in the package of 'fname'. Without
+    'wait' nothing is completed while the index is built in the background.
+    """
+    index = get_index(workspace_root, wait)
+    if index is None:
+        return []
+    try:
+        current_package = resolve_filename(fname, workspace_root).package
+    except Exception:
+        current_package = None
+    return index.complete(prefix, current_package, limit)
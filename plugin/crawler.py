@@ -0,0 +1,214 @@
+"""
+Enumerates the packages and Starlark files of a workspace like bazel does. The directories listed in .bazelignore
+are skipped, and packages deleted with --deleted_packages in .bazelrc are not reported, but their subdirectories are
+still searched. Symlinks into the output base (bazel-bin, bazel-out, ... also with another --symlink_prefix), symlink
+cycles, hidden directories and node_modules are not entered.
+
+Directories are read with scandir in a thread pool and results are yielded as soon as their directory was read, in
+no particular order.
+"""
+
+import os
+import queue
+import threading
+from workspace import BUILD_FILES, is_starlark_file
+
+SKIPPED_DIRECTORIES = {"node_modules"}
+
+# directory reads are I/O bound, more threads than cores hide the latency of cold caches and network file systems
+# (the default of ThreadPoolExecutor)
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) + 4)
+
+# written by bazel into the execroot, the convenience symlinks point to it or below it
+OUTPUT_MARKER = "DO_NOT_BUILD_HERE"
+
+
+def _read_lines(path):
+    try:
+        with open(path) as f:
+            return [line.strip() for line in f]
+    except OSError:
+        return []
+
+
+def read_bazelignore(workspace_root):
+    """
+    Returns the workspace relative paths of the directories listed in .bazelignore.
+    """
+    return {
+        os.path.normpath(line).strip("/")
+        for line in _read_lines(os.path.join(workspace_root, ".bazelignore"))
+        if line and not line.startswith("#")
+    }
+
+
+def read_deleted_packages(workspace_root):
+    """
+    Returns the packages passed to --deleted_packages in the .bazelrc of the workspace.
+    """
+    result = set()
+    for line in _read_lines(os.path.join(workspace_root, ".bazelrc")):
+        words = [] if line.startswith("#") else line.split()
+        for i, word in enumerate(words):
+            if word.startswith("--deleted_packages="):
+                value = word[len("--deleted_packages=") :]
+            elif word == "--deleted_packages" and i + 1 < len(words):
+                value = words[i + 1]
+            else:
+                continue
+            result.update(
+                package.lstrip("/") for package in value.split(",") if package
+            )
+    return result
+
+
+def is_output_tree(path):
+    """
+    Returns whether the real path of 'path' is in the execroot of a bazel output base.
+    """
+    path = os.path.realpath(path)
+    while True:
+        if os.path.exists(os.path.join(path, OUTPUT_MARKER)):
+            return True
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+
+
+def _is_cycle(path, directory):
+    # a symlink to the directory containing it or one of its parents
+    target = os.path.realpath(path)
+    real_directory = os.path.realpath(directory)
+    return real_directory == target or real_directory.startswith(target + "/")
+
+
+def _scan(directory, relative, ignored):
+    """
+    Returns (directory, relative, files, subdirectories) with the (path, relative path) of the subdirectories to
+    enter.
+    """
+    files = []
+    subdirectories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if not is_dir:
+                    files.append(entry.name)
+                    continue
+                name = entry.name
+                if name.startswith(".") or name in SKIPPED_DIRECTORIES:
+                    continue
+                child = f"{relative}/{name}" if relative else name
+                if child in ignored:
+                    continue
+                if entry.is_symlink() and (
+                    name.startswith("bazel-")
+                    or is_output_tree(entry.path)
+                    or _is_cycle(entry.path, directory)
+                ):
+                    continue
+                subdirectories.append((entry.path, child))
+    except OSError:
+        pass
+    return directory, relative, files, subdirectories
+
+
+def walk(workspace_root, jobs=None):
+    """
+    Yields (directory, workspace relative directory, file names) of the directories of 'workspace_root', read by
+    'jobs' threads.
+    """
+    ignored = read_bazelignore(workspace_root)
+    # last in, first out: the tree is searched depth first, the first packages are found early and few directories
+    # are queued
+    directories = queue.LifoQueue()
+    results = queue.SimpleQueue()
+    stopped = threading.Event()
+
+    def work():
+        while True:
+            item = directories.get()
+            if item is None or stopped.is_set():
+                return
+            try:
+                directory, relative, files, subdirectories = _scan(*item, ignored)
+            except Exception:
+                directory, relative, files, subdirectories = *item, [], []
+            for subdirectory in subdirectories:
+                directories.put(subdirectory)
+            results.put((directory, relative, files, len(subdirectories)))
+
+    threads = [
+        threading.Thread(target=work, daemon=True) for _ in range(jobs or DEFAULT_JOBS)
+    ]
+    directories.put((workspace_root, ""))
+    for thread in threads:
+        thread.start()
+    try:
+        pending = 1
+        while pending:
+            directory, relative, files, queued = results.get()
+            pending += queued - 1
+            yield directory, relative, files
+    finally:
+        # the caller may stop early
+        stopped.set()
+        for _ in threads:
+            directories.put(None)
+
+
+def is_ignored(workspace_root, path):
+    """
+    Returns whether find_starlark_files of 'workspace_root' skips the file 'path', e.g. when it is written in a
+    directory that is not searched or in a deleted package.
+    """
+    relative = os.path.relpath(path, workspace_root)
+    if relative == ".." or relative.startswith("../"):
+        return True
+    directory = os.path.dirname(relative)
+    ignored = read_bazelignore(workspace_root)
+    parent = workspace_root
+    child = ""
+    for name in directory.split("/") if directory else []:
+        child = f"{child}/{name}" if child else name
+        if name.startswith(".") or name in SKIPPED_DIRECTORIES or child in ignored:
+            return True
+        current = os.path.join(parent, name)
+        if os.path.islink(current) and (
+            name.startswith("bazel-")
+            or is_output_tree(current)
+            or _is_cycle(current, parent)
+        ):
+            return True
+        parent = current
+    return not path.endswith(".bzl") and directory in read_deleted_packages(
+        workspace_root
+    )
+
+
+def find_packages(workspace_root, jobs=None):
+    """
+    Yields the names of the packages of 'workspace_root' ("" for the root package) as they are found.
+    """
+    deleted = read_deleted_packages(workspace_root)
+    for _, relative, files in walk(workspace_root, jobs):
+        if relative not in deleted and any(name in files for name in BUILD_FILES):
+            yield relative
+
+
+def find_starlark_files(workspace_root, jobs=None):
+    """
+    Yields the paths of the BUILD files of the packages and of the .bzl files of 'workspace_root'.
+    """
+    deleted = read_deleted_packages(workspace_root)
+    for directory, relative, files in walk(workspace_root, jobs):
+        for name in files:
+            if is_starlark_file(name) and (
+                name.endswith(".bzl") or relative not in deleted
+            ):
+                yield os.path.join(directory, name)
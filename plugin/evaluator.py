@@ -0,0 +1,1138 @@
+"""
+Evaluates BUILD files together with the macros they load to find the targets they create, including targets created
+by macros, loops and list comprehensions.
+
+Only a sandboxed subset of starlark is evaluated: values are plain strings, numbers, lists, dicts and tuples, python
+objects can't be reached through attributes, recursion is rejected, the number of evaluation steps is bounded and so
+is the size of every value that is created. The values of loaded modules are frozen like in bazel. Statements that
+can't be evaluated (e.g. because they use symbols from external repositories) are skipped.
+"""
+
+import ast
+import os
+import re
+import string
+from bazel_glob import glob
+from label import parse_label, resolve_filename
+from workspace import find_workspace_root
+
+MAX_STEPS = 1000000
+MAX_LENGTH = 1000000
+MAX_INT_BITS = 1024
+
+
+class EvaluationError(Exception):
+    pass
+
+
+class StepLimitExceeded(EvaluationError):
+    pass
+
+
+class _Return(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+class _Break(Exception):
+    pass
+
+
+class _Continue(Exception):
+    pass
+
+
+class Target:
+    def __init__(self, kind, name, lineno, attributes, macros, definition, extension):
+        self.kind = kind
+        self.name = name
+        # line of the outermost call (rule or macro) in the evaluated BUILD file
+        self.lineno = lineno
+        self.attributes = attributes
+        # names of the macros that were called to create the target, outermost first
+        self.macros = macros
+        # (path, lineno) of the rule call, inside of the macro for macro generated targets
+        self.definition = definition
+        # label of the .bzl file of an external repository the rule was loaded from, None for other rules
+        self.extension = extension
+
+    def __repr__(self):
+        return f"Target(kind={self.kind}, name={self.name}, lineno={self.lineno}, macros={self.macros})"
+
+
+class Struct:
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __repr__(self):
+        fields = ", ".join(f"{k} = {v!r}" for k, v in self.fields.items())
+        return f"struct({fields})"
+
+
+class Select:
+    """
+    select() and its concatenations with other values, every branch is kept.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __add__(self, other):
+        return Select(self.parts + [other])
+
+    def __radd__(self, other):
+        return Select([other] + self.parts)
+
+    def __or__(self, other):
+        return self + other
+
+    def __ror__(self, other):
+        return other + self
+
+    def __repr__(self):
+        return f"select({self.parts!r})"
+
+
+class Function:
+    def __init__(self, node, module, defaults):
+        self.node = node
+        self.name = node.name
+        self.module = module
+        self.defaults = defaults
+
+    def __repr__(self):
+        return f"<function {self.name}>"
+
+
+class Builtin:
+    def __init__(self, name, function):
+        self.name = name
+        # called with (evaluator, args, kwargs, node)
+        self.function = function
+
+    def __repr__(self):
+        return f"<built-in function {self.name}>"
+
+
+class RuleClass:
+    """
+    Native rules, results of rule() and symbols that can't be loaded: calling them creates the target 'name'.
+    """
+
+    def __init__(self, kind, extension=None):
+        # None for results of rule() until they are bound to a global name
+        self.kind = kind
+        # label of the .bzl file the symbol couldn't be loaded from
+        self.extension = extension
+
+    def __repr__(self):
+        return f"<rule {self.kind}>"
+
+
+class FrozenList(list):
+    """
+    A list of a loaded module, it can't be changed.
+    """
+
+
+class FrozenDict(dict):
+    """
+    A dict of a loaded module, it can't be changed.
+    """
+
+
+class Module:
+    def __init__(self, path, label, is_build_file):
+        self.path = path
+        self.label = label
+        self.is_build_file = is_build_file
+        self.globals = {}
+
+
+class Frame:
+    def __init__(self, module, local_bindings=None):
+        self.module = module
+        self.locals = local_bindings
+
+
+def flatten(value):
+    """
+    Yields all strings of a (possibly nested) attribute value, for select() from all branches.
+    """
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for element in value:
+            yield from flatten(element)
+    elif isinstance(value, dict):
+        for element in value.values():
+            yield from flatten(element)
+    elif isinstance(value, Select):
+        for part in value.parts:
+            yield from flatten(part)
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _is_current(deps):
+    return all(_stat(path) == fingerprint for path, fingerprint in deps.items())
+
+
+def _check_length(value):
+    if isinstance(value, (str, list, tuple, dict)) and len(value) > MAX_LENGTH:
+        raise EvaluationError("value too large")
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise EvaluationError("value too large")
+    return value
+
+
+def _size(value):
+    """
+    Returns the length of the string representation of 'value', approximately and at most a bit more than
+    MAX_LENGTH. Nested values are counted every time they are referenced.
+    """
+    total = 0
+    pending = [value]
+    while pending and total <= MAX_LENGTH:
+        value = pending.pop()
+        if isinstance(value, str):
+            total += len(value) + 2
+        elif isinstance(value, (list, tuple)):
+            total += 2 * len(value) + 2
+            pending.extend(value)
+        elif isinstance(value, dict):
+            total += 4 * len(value) + 2
+            pending.extend(value.keys())
+            pending.extend(value.values())
+        elif isinstance(value, Struct):
+            total += 4 * len(value.fields) + 8
+            pending.extend(value.fields.values())
+        elif isinstance(value, Select):
+            pending.extend(value.parts)
+        else:
+            total += 24
+    return total
+
+
+def _check_size(size):
+    # checked before creating a string that would exceed the limit
+    if size > MAX_LENGTH:
+        raise EvaluationError("value too large")
+
+
+def _to_string(value):
+    if isinstance(value, str):
+        return value
+    _check_size(_size(value))
+    return repr(value)
+
+
+def _repr(value):
+    _check_size(_size(value))
+    return repr(value)
+
+
+def _range(*args):
+    values = range(*args)
+    _check_size(len(values))
+    return list(values)
+
+
+def freeze(value, memo=None):
+    """
+    Returns 'value' with all lists and dicts it contains replaced by frozen copies.
+    """
+    if memo is None:
+        memo = {}
+    if id(value) in memo:
+        return memo[id(value)]
+    if isinstance(value, list):
+        result = memo[id(value)] = FrozenList()
+        list.extend(result, [freeze(element, memo) for element in value])
+    elif isinstance(value, dict):
+        result = memo[id(value)] = FrozenDict()
+        dict.update(
+            result, {key: freeze(element, memo) for key, element in value.items()}
+        )
+    elif isinstance(value, tuple):
+        result = memo[id(value)] = tuple(freeze(element, memo) for element in value)
+    elif isinstance(value, Struct):
+        result = memo[id(value)] = Struct({})
+        result.fields = {
+            name: freeze(field, memo) for name, field in value.fields.items()
+        }
+    elif isinstance(value, Select):
+        result = memo[id(value)] = Select([freeze(part, memo) for part in value.parts])
+    elif isinstance(value, Function):
+        # default values are shared by all calls
+        value.defaults = [freeze(default, memo) for default in value.defaults]
+        result = memo[id(value)] = value
+    else:
+        result = value
+    return result
+
+
+def _check_mutable(value):
+    if isinstance(value, (FrozenList, FrozenDict)):
+        raise EvaluationError(f"can't change frozen {_type_name(value)}")
+
+
+def _type_name(value):
+    if value is None:
+        return "NoneType"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "list"
+    if isinstance(value, tuple):
+        return "tuple"
+    if isinstance(value, dict):
+        return "dict"
+    if isinstance(value, Struct):
+        return "struct"
+    if isinstance(value, Select):
+        return "select"
+    if isinstance(value, (Function, Builtin, RuleClass)):
+        return "function"
+    raise EvaluationError(f"unknown value {value!r}")
+
+
+def _format(s, args, kwargs):
+    size = len(s)
+    auto_index = 0
+    for _, field, spec, conversion in string.Formatter().parse(s):
+        if field is None:
+            continue
+        # str.format would allow attribute and index access of the arguments, specs (e.g. padding) are not starlark
+        if spec or conversion:
+            raise EvaluationError("format specs and conversions are not supported")
+        if field == "":
+            field = str(auto_index)
+            auto_index += 1
+        if field.isdigit():
+            if int(field) >= len(args):
+                raise EvaluationError(f"format index {field} out of range")
+            size += _size(args[int(field)])
+        elif field.isidentifier():
+            if field not in kwargs:
+                raise EvaluationError(f"missing format argument {field}")
+            size += _size(kwargs[field])
+        else:
+            raise EvaluationError(f"unsupported format field {field}")
+        _check_size(size)
+    return s.format(*args, **kwargs)
+
+
+def _join(separator, elements):
+    elements = list(elements)
+    _check_size(len(separator) * len(elements) + _size(elements))
+    return separator.join(elements)
+
+
+def _replace(s, old, new, count=-1):
+    n = s.count(old)
+    if count >= 0:
+        n = min(n, count)
+    _check_size(len(s) + n * max(0, len(new) - len(old)))
+    return s.replace(old, new, count)
+
+
+def _percent_format(s, values):
+    # widths and precisions would allow padding to any length
+    if re.search(r"%[-+ #0]*[*\d.]", s.replace("%%", "")):
+        raise EvaluationError("format widths are not supported")
+    _check_size(len(s) + _size(values))
+    return s % values
+
+
+_STRING_METHODS = {
+    "capitalize",
+    "count",
+    "endswith",
+    "find",
+    "index",
+    "isalnum",
+    "isalpha",
+    "isdigit",
+    "islower",
+    "isspace",
+    "istitle",
+    "isupper",
+    "lower",
+    "lstrip",
+    "partition",
+    "removeprefix",
+    "removesuffix",
+    "rfind",
+    "rindex",
+    "rpartition",
+    "rsplit",
+    "rstrip",
+    "split",
+    "splitlines",
+    "startswith",
+    "strip",
+    "title",
+    "upper",
+}
+_LIST_METHODS = {"append", "clear", "extend", "index", "insert", "pop", "remove"}
+_DICT_METHODS = {"clear", "get", "pop", "popitem", "setdefault", "update"}
+_MUTATING_METHODS = {
+    "append",
+    "clear",
+    "extend",
+    "insert",
+    "pop",
+    "popitem",
+    "remove",
+    "setdefault",
+    "update",
+}
+
+
+def _bound(name, method, convert=lambda x: x):
+    return Builtin(
+        name, lambda ev, args, kwargs, node: convert(method(*args, **kwargs))
+    )
+
+
+def _grown_length(value, name, args, kwargs):
+    if name in ("extend", "update"):
+        added = len(kwargs) + sum(
+            len(arg) if isinstance(arg, (str, list, tuple, dict)) else 1 for arg in args
+        )
+    elif name in ("append", "insert", "setdefault"):
+        added = 1
+    else:
+        added = 0
+    return len(value) + added
+
+
+def _mutating_method(value, name):
+    """
+    Returns the method 'name' of the list or dict 'value', checked before the call to not grow it beyond MAX_LENGTH.
+    """
+    _check_mutable(value)
+    method = getattr(value, name)
+
+    def call(ev, args, kwargs, node):
+        if _grown_length(value, name, args, kwargs) > MAX_LENGTH:
+            raise EvaluationError("value too large")
+        return method(*args, **kwargs)
+
+    return Builtin(name, call)
+
+
+def _string_method(value, name, function):
+    return Builtin(
+        name, lambda ev, args, kwargs, node: function(value, *args, **kwargs)
+    )
+
+
+def get_attribute(value, name):
+    if isinstance(value, Struct):
+        if name in value.fields:
+            return value.fields[name]
+    elif isinstance(value, str):
+        if name == "format":
+            return Builtin(
+                name, lambda ev, args, kwargs, node: _format(value, args, kwargs)
+            )
+        if name == "join":
+            return _string_method(value, name, _join)
+        if name == "replace":
+            return _string_method(value, name, _replace)
+        if name == "elems":
+            return Builtin(name, lambda ev, args, kwargs, node: list(value))
+        if name in _STRING_METHODS:
+            return _bound(name, getattr(value, name))
+    elif isinstance(value, list):
+        if name in _LIST_METHODS:
+            if name in _MUTATING_METHODS:
+                return _mutating_method(value, name)
+            return _bound(name, getattr(value, name))
+    elif isinstance(value, dict):
+        if name in ["items", "keys", "values"]:
+            return _bound(name, getattr(value, name), list)
+        if name in _DICT_METHODS:
+            if name in _MUTATING_METHODS:
+                return _mutating_method(value, name)
+            return _bound(name, getattr(value, name))
+    raise EvaluationError(f"{_type_name(value)} has no attribute {name}")
+
+
+def _builtin(name):
+    def decorator(function):
+        BUILTINS[name] = Builtin(name, function)
+        return function
+
+    return decorator
+
+
+BUILTINS = {}
+NATIVE = {}
+
+
+def _simple_builtin(name, function):
+    BUILTINS[name] = Builtin(
+        name, lambda ev, args, kwargs, node: function(*args, **kwargs)
+    )
+
+
+for _name, _function in [
+    ("len", len),
+    ("str", lambda x="": _to_string(x)),
+    ("repr", _repr),
+    ("int", int),
+    ("bool", bool),
+    ("list", lambda x=(): list(x)),
+    ("tuple", lambda x=(): tuple(x)),
+    ("dict", lambda *args, **kwargs: dict(*args, **kwargs)),
+    ("range", lambda *args: _range(*args)),
+    ("enumerate", lambda x, start=0: list(enumerate(x, start))),
+    ("zip", lambda *args: list(zip(*args))),
+    ("sorted", lambda x, reverse=False: sorted(x, reverse=reverse)),
+    ("reversed", lambda x: list(reversed(x))),
+    ("any", any),
+    ("all", all),
+    ("min", min),
+    ("max", max),
+    ("abs", abs),
+    ("type", _type_name),
+    ("hasattr", lambda x, name: _hasattr(x, name)),
+    ("getattr", lambda x, name, *default: _getattr(x, name, *default)),
+    ("print", lambda *args, **kwargs: None),
+    ("struct", lambda **kwargs: Struct(kwargs)),
+    ("depset", lambda direct=None, **kwargs: list(direct or [])),
+    ("Label", lambda x: x),
+    ("select", lambda conditions, **kwargs: Select([conditions])),
+    ("package", lambda *args, **kwargs: None),
+    ("licenses", lambda *args, **kwargs: None),
+    ("exports_files", lambda *args, **kwargs: None),
+    ("package_group", lambda *args, **kwargs: None),
+    ("workspace", lambda *args, **kwargs: None),
+    ("register_toolchains", lambda *args, **kwargs: None),
+    ("register_execution_platforms", lambda *args, **kwargs: None),
+]:
+    _simple_builtin(_name, _function)
+
+
+def _hasattr(value, name):
+    try:
+        get_attribute(value, name)
+        return True
+    except EvaluationError:
+        return False
+
+
+def _getattr(value, name, *default):
+    try:
+        return get_attribute(value, name)
+    except EvaluationError:
+        if default:
+            return default[0]
+        raise
+
+
+@_builtin("fail")
+def _fail(evaluator, args, kwargs, node):
+    raise EvaluationError("fail: " + " ".join(str(arg) for arg in args))
+
+
+@_builtin("rule")
+def _rule(evaluator, args, kwargs, node):
+    # the kind is the global name the rule is bound to, see Evaluator.exec_stmt
+    return RuleClass(None)
+
+
+@_builtin("provider")
+def _provider(evaluator, args, kwargs, node):
+    return Builtin("provider", lambda ev, args, kwargs, node: Struct(kwargs))
+
+
+@_builtin("glob")
+def _glob(evaluator, args, kwargs, node):
+    include = args[0] if args else kwargs.get("include", [])
+    exclude = args[1] if len(args) > 1 else kwargs.get("exclude", [])
+    exclude_directories = kwargs.get("exclude_directories", 1)
+    for patterns in [include, exclude]:
+        if not isinstance(patterns, (list, tuple)) or not all(
+            isinstance(pattern, str) for pattern in patterns
+        ):
+            raise EvaluationError("glob patterns must be a list of strings")
+    visited = set()
+    try:
+        result = glob(
+            os.path.dirname(evaluator.root.path),
+            include,
+            exclude,
+            exclude_directories,
+            visited,
+        )
+    except ValueError as e:
+        raise EvaluationError(str(e))
+    # the result changes with the listings of the scanned directories
+    for directory in visited:
+        evaluator.deps[directory] = _stat(directory)
+    return _check_length(result)
+
+
+@_builtin("package_name")
+def _package_name(evaluator, args, kwargs, node):
+    return evaluator.root.label.package
+
+
+@_builtin("repository_name")
+def _repository_name(evaluator, args, kwargs, node):
+    return "@" + evaluator.root.label.repository
+
+
+@_builtin("existing_rules")
+def _existing_rules(evaluator, args, kwargs, node):
+    return {
+        name: dict(target.attributes, name=name, kind=target.kind)
+        for name, target in evaluator.targets.items()
+    }
+
+
+@_builtin("existing_rule")
+def _existing_rule(evaluator, args, kwargs, node):
+    target = evaluator.targets.get(args[0])
+    if target is None:
+        return None
+    return dict(target.attributes, name=target.name, kind=target.kind)
+
+
+for _name in [
+    "glob",
+    "package_name",
+    "repository_name",
+    "existing_rules",
+    "existing_rule",
+    "exports_files",
+    "package_group",
+]:
+    NATIVE[_name] = BUILTINS[_name]
+del BUILTINS["existing_rules"], BUILTINS["existing_rule"]
+
+
+class _Native(Struct):
+    # native.<rule> is a rule for every name that is not a builtin
+    def __init__(self):
+        super().__init__(NATIVE)
+
+
+def _native_attribute(name):
+    if name in NATIVE:
+        return NATIVE[name]
+    return RuleClass(name)
+
+
+_BINARY_OPERATORS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.FloorDiv: lambda a, b: a // b,
+    ast.Mod: lambda a, b: a % b,
+    ast.BitOr: lambda a, b: a | b,
+    ast.BitAnd: lambda a, b: a & b,
+    ast.BitXor: lambda a, b: a ^ b,
+    ast.LShift: lambda a, b: a << b,
+    ast.RShift: lambda a, b: a >> b,
+}
+
+_COMPARISONS = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+_PRIMITIVES = (str, int, float, bool, list, tuple, dict, type(None), Select)
+
+# path -> (deps, Module) of evaluated .bzl files
+_modules = {}
+# path -> (deps, {name: Target}, errors) of evaluated BUILD files
+_build_files = {}
+
+
+class Evaluator:
+    def __init__(self, workspace_root, build_fname):
+        self.workspace_root = workspace_root
+        self.root = Module(
+            build_fname, resolve_filename(build_fname, workspace_root), True
+        )
+        self.targets = {}
+        # (lineno, message) of the statements of the BUILD file that were skipped
+        self.errors = []
+        self.steps = 0
+        self.call_site = None
+        self.macros = []
+        self.active = set()
+        self.loading = set()
+        self.deps = {build_fname: _stat(build_fname)}
+
+    def step(self):
+        self.steps += 1
+        if self.steps > MAX_STEPS:
+            raise StepLimitExceeded("too many evaluation steps")
+
+    # modules
+
+    def load_module(self, label_str, module):
+        label = parse_label(label_str, module.label)
+        if label.repository:
+            # external repositories are not evaluated
+            return None
+        path = os.path.join(self.workspace_root, label.package, label.target)
+        cached = _modules.get(path)
+        if cached is not None and _is_current(cached[0]):
+            self.deps.update(cached[0])
+            return cached[1]
+        if path in self.loading:
+            raise EvaluationError(f"cycle in load of {path}")
+        if not os.path.isfile(path):
+            return None
+
+        outer_deps = self.deps
+        self.deps = {path: _stat(path)}
+        self.loading.add(path)
+        try:
+            loaded = Module(path, label, False)
+            with open(path) as f:
+                self.exec_module(ast.parse(f.read()), loaded)
+            # loaded modules are shared by all evaluations
+            loaded.globals = freeze(loaded.globals)
+            _modules[path] = (self.deps, loaded)
+        finally:
+            self.loading.discard(path)
+            outer_deps.update(self.deps)
+            self.deps = outer_deps
+        return loaded
+
+    def exec_module(self, tree, module):
+        frame = Frame(module)
+        for stmt in tree.body:
+            try:
+                self.exec_stmt(stmt, frame)
+            except StepLimitExceeded:
+                raise
+            except Exception as e:
+                # skip what can't be evaluated, e.g. calls of symbols from external repositories
+                if module is self.root:
+                    self.errors.append((stmt.lineno, str(e)))
+
+    def exec_load(self, call, frame):
+        loaded = self.load_module(call.args[0].s, frame.module)
+        symbols = [(arg.s, arg.s) for arg in call.args[1:]]
+        symbols += [(kw.arg, kw.value.s) for kw in call.keywords]
+        missing = []
+        for alias, name in symbols:
+            if loaded is None:
+                # unknown symbols from external repositories are most likely rules
+                frame.module.globals[alias] = RuleClass(name, call.args[0].s)
+            elif name in loaded.globals and not name.startswith("_"):
+                frame.module.globals[alias] = loaded.globals[name]
+            else:
+                missing.append(name)
+        if missing:
+            # the symbols that were found stay bound
+            raise EvaluationError(f"{', '.join(missing)} not found in {loaded.path}")
+
+    # statements
+
+    def exec_block(self, stmts, frame):
+        for stmt in stmts:
+            self.exec_stmt(stmt, frame)
+
+    def exec_stmt(self, stmt, frame):
+        self.step()
+        if isinstance(stmt, ast.Expr):
+            value = stmt.value
+            if (
+                isinstance(value, ast.Call)
+                and isinstance(value.func, ast.Name)
+                and value.func.id == "load"
+            ):
+                self.exec_load(value, frame)
+                return
+            self.eval(value, frame)
+        elif isinstance(stmt, ast.Assign):
+            value = self.eval(stmt.value, frame)
+            for target in stmt.targets:
+                if (
+                    isinstance(value, RuleClass)
+                    and value.kind is None
+                    and isinstance(target, ast.Name)
+                    and frame.locals is None
+                ):
+                    # rules are exported with the name of the global they are bound to
+                    value.kind = target.id
+                self.assign(target, value, frame)
+        elif isinstance(stmt, ast.AugAssign):
+            value = self.binary(
+                stmt.op, self.eval(stmt.target, frame), self.eval(stmt.value, frame)
+            )
+            self.assign(stmt.target, value, frame)
+        elif isinstance(stmt, ast.If):
+            if self.eval(stmt.test, frame):
+                self.exec_block(stmt.body, frame)
+            else:
+                self.exec_block(stmt.orelse, frame)
+        elif isinstance(stmt, ast.For):
+            iterable = self.eval(stmt.iter, frame)
+            if isinstance(iterable, dict):
+                iterable = list(iterable)
+            for element in list(iterable):
+                self.assign(stmt.target, element, frame)
+                try:
+                    self.exec_block(stmt.body, frame)
+                except _Break:
+                    break
+                except _Continue:
+                    continue
+        elif isinstance(stmt, ast.FunctionDef):
+            defaults = [self.eval(default, frame) for default in stmt.args.defaults]
+            self.set(stmt.name, Function(stmt, frame.module, defaults), frame)
+        elif isinstance(stmt, ast.Return):
+            raise _Return(self.eval(stmt.value, frame) if stmt.value else None)
+        elif isinstance(stmt, ast.Break):
+            raise _Break()
+        elif isinstance(stmt, ast.Continue):
+            raise _Continue()
+        elif isinstance(stmt, ast.Pass):
+            pass
+        else:
+            raise EvaluationError(f"unsupported statement {type(stmt).__name__}")
+
+    def set(self, name, value, frame):
+        if frame.locals is not None:
+            frame.locals[name] = value
+        else:
+            frame.module.globals[name] = value
+
+    def assign(self, target, value, frame):
+        if isinstance(target, ast.Name):
+            self.set(target.id, value, frame)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            values = list(value)
+            if len(values) != len(target.elts):
+                raise EvaluationError("wrong number of values to unpack")
+            for element, element_value in zip(target.elts, values):
+                self.assign(element, element_value, frame)
+        elif isinstance(target, ast.Subscript):
+            container = self.eval(target.value, frame)
+            if not isinstance(container, (list, dict)):
+                raise EvaluationError("item assignment on immutable value")
+            _check_mutable(container)
+            if isinstance(target.slice, ast.Slice):
+                raise EvaluationError("slice assignment is not supported")
+            key = self.eval(target.slice, frame)
+            if (
+                isinstance(container, dict)
+                and key not in container
+                and len(container) >= MAX_LENGTH
+            ):
+                raise EvaluationError("value too large")
+            container[key] = value
+        else:
+            raise EvaluationError(f"can't assign to {type(target).__name__}")
+
+    # expressions
+
+    def lookup(self, name, frame):
+        if frame.locals is not None and name in frame.locals:
+            return frame.locals[name]
+        if name in frame.module.globals:
+            return frame.module.globals[name]
+        if name == "native":
+            return _Native()
+        if name in BUILTINS:
+            return BUILTINS[name]
+        if frame.module.is_build_file:
+            # native rules like cc_library are globals in BUILD files
+            return RuleClass(name)
+        raise EvaluationError(f"undefined name {name}")
+
+    def binary(self, op, left, right):
+        operator = _BINARY_OPERATORS.get(type(op))
+        if operator is None:
+            raise EvaluationError(f"unsupported operator {type(op).__name__}")
+        if not isinstance(left, _PRIMITIVES) or not isinstance(right, _PRIMITIVES):
+            raise EvaluationError("unsupported operand")
+        if isinstance(op, ast.Mult):
+            for a, b in [(left, right), (right, left)]:
+                if isinstance(a, (str, list, tuple)) and isinstance(b, int):
+                    if len(a) * b > MAX_LENGTH:
+                        raise EvaluationError("value too large")
+            if isinstance(left, int) and isinstance(right, int):
+                # checked before computing a product that would exceed the limit
+                if left.bit_length() + right.bit_length() > MAX_INT_BITS + 1:
+                    raise EvaluationError("value too large")
+        if isinstance(op, (ast.LShift, ast.RShift)):
+            if not isinstance(left, int) or not isinstance(right, int):
+                raise EvaluationError("unsupported operand")
+            if right < 0:
+                raise EvaluationError("negative shift count")
+            if (
+                isinstance(op, ast.LShift)
+                and left
+                and left.bit_length() + right > MAX_INT_BITS
+            ):
+                raise EvaluationError("value too large")
+        if isinstance(op, ast.Mod) and isinstance(left, str):
+            return _check_length(_percent_format(left, right))
+        return _check_length(operator(left, right))
+
+    def eval(self, node, frame):
+        self.step()
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bytes):
+                raise EvaluationError("bytes are not supported")
+            return node.value
+        if isinstance(node, ast.Name):
+            return self.lookup(node.id, frame)
+        if isinstance(node, ast.List):
+            return [self.eval(element, frame) for element in node.elts]
+        if isinstance(node, ast.Tuple):
+            return tuple(self.eval(element, frame) for element in node.elts)
+        if isinstance(node, ast.Dict):
+            result = {}
+            for key, value in zip(node.keys, node.values):
+                if key is None:
+                    result.update(self.eval(value, frame))
+                else:
+                    result[self.eval(key, frame)] = self.eval(value, frame)
+            return result
+        if isinstance(node, ast.BinOp):
+            return self.binary(
+                node.op, self.eval(node.left, frame), self.eval(node.right, frame)
+            )
+        if isinstance(node, ast.BoolOp):
+            value = None
+            for operand in node.values:
+                value = self.eval(operand, frame)
+                if isinstance(node.op, ast.And) and not value:
+                    return value
+                if isinstance(node.op, ast.Or) and value:
+                    return value
+            return value
+        if isinstance(node, ast.UnaryOp):
+            operand = self.eval(node.operand, frame)
+            if isinstance(node.op, ast.Not):
+                return not operand
+            if isinstance(node.op, ast.USub) and isinstance(operand, (int, float)):
+                return -operand
+            if isinstance(node.op, ast.UAdd) and isinstance(operand, (int, float)):
+                return operand
+            raise EvaluationError("unsupported unary operator")
+        if isinstance(node, ast.Compare):
+            left = self.eval(node.left, frame)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.eval(comparator, frame)
+                compare = _COMPARISONS.get(type(op))
+                if compare is None or not isinstance(left, _PRIMITIVES):
+                    raise EvaluationError("unsupported comparison")
+                if not compare(left, right):
+                    return False
+                left = right
+            return True
+        if isinstance(node, ast.IfExp):
+            if self.eval(node.test, frame):
+                return self.eval(node.body, frame)
+            return self.eval(node.orelse, frame)
+        if isinstance(node, ast.Attribute):
+            value = self.eval(node.value, frame)
+            if isinstance(value, _Native):
+                return _native_attribute(node.attr)
+            return get_attribute(value, node.attr)
+        if isinstance(node, ast.Subscript):
+            value = self.eval(node.value, frame)
+            if not isinstance(value, (str, list, tuple, dict)):
+                raise EvaluationError("value is not subscriptable")
+            if isinstance(node.slice, ast.Slice):
+                bounds = [
+                    self.eval(bound, frame) if bound is not None else None
+                    for bound in [node.slice.lower, node.slice.upper, node.slice.step]
+                ]
+                return value[slice(*bounds)]
+            return value[self.eval(node.slice, frame)]
+        if isinstance(node, (ast.ListComp, ast.DictComp)):
+            return self.eval_comprehension(node, frame)
+        if isinstance(node, ast.Call):
+            return self.eval_call(node, frame)
+        if isinstance(node, ast.Lambda):
+            raise EvaluationError("lambda is not supported")
+        raise EvaluationError(f"unsupported expression {type(node).__name__}")
+
+    def eval_comprehension(self, node, frame):
+        # comprehension variables are local to the comprehension
+        scope = Frame(frame.module, dict(frame.locals or {}))
+        result = [] if isinstance(node, ast.ListComp) else {}
+
+        def generate(generators):
+            if not generators:
+                if isinstance(node, ast.ListComp):
+                    result.append(self.eval(node.elt, scope))
+                else:
+                    result[self.eval(node.key, scope)] = self.eval(node.value, scope)
+                if len(result) > MAX_LENGTH:
+                    raise EvaluationError("value too large")
+                return
+            generator = generators[0]
+            iterable = self.eval(generator.iter, scope)
+            for element in list(iterable):
+                self.assign(generator.target, element, scope)
+                if all(self.eval(condition, scope) for condition in generator.ifs):
+                    generate(generators[1:])
+
+        generate(node.generators)
+        return result
+
+    def eval_call(self, node, frame):
+        function = self.eval(node.func, frame)
+        args = []
+        for arg in node.args:
+            if isinstance(arg, ast.Starred):
+                args.extend(self.eval(arg.value, frame))
+            else:
+                args.append(self.eval(arg, frame))
+        kwargs = {}
+        for kw in node.keywords:
+            if kw.arg is None:
+                kwargs.update(self.eval(kw.value, frame))
+            else:
+                kwargs[kw.arg] = self.eval(kw.value, frame)
+
+        outer_call_site = self.call_site
+        if frame.module is self.root:
+            self.call_site = node.lineno
+        try:
+            return self.call(function, args, kwargs, node, frame)
+        finally:
+            self.call_site = outer_call_site
+
+    def call(self, function, args, kwargs, node, frame):
+        if isinstance(function, Builtin):
+            return _check_length(function.function(self, args, kwargs, node))
+        if isinstance(function, RuleClass):
+            return self.create_target(function, args, kwargs, node, frame)
+        if isinstance(function, Function):
+            return self.call_function(function, args, kwargs)
+        raise EvaluationError(f"{_type_name(function)} is not callable")
+
+    def create_target(self, rule, args, kwargs, node, frame):
+        name = kwargs.get("name")
+        if args or not isinstance(name, str):
+            raise EvaluationError("rules must be called with a name")
+        self.targets[name] = Target(
+            kind=rule.kind or "rule",
+            name=name,
+            lineno=self.call_site,
+            attributes=kwargs,
+            macros=list(self.macros),
+            definition=(frame.module.path, node.lineno),
+            extension=rule.extension,
+        )
+        return None
+
+    def call_function(self, function, args, kwargs):
+        if function in self.active:
+            raise EvaluationError(f"recursive call of {function.name}")
+        parameters = function.node.args
+        names = [arg.arg for arg in parameters.args]
+        local_bindings = {}
+        n_required = len(names) - len(function.defaults)
+        for name, default in zip(names[n_required:], function.defaults):
+            local_bindings[name] = default
+        for name, value in zip(names, args):
+            local_bindings[name] = value
+        extra_args = args[len(names) :]
+        if extra_args and parameters.vararg is None:
+            raise EvaluationError(f"too many arguments for {function.name}")
+        if parameters.vararg is not None:
+            local_bindings[parameters.vararg.arg] = tuple(extra_args)
+        extra_kwargs = {}
+        for name, value in kwargs.items():
+            if name in names:
+                local_bindings[name] = value
+            else:
+                extra_kwargs[name] = value
+        if extra_kwargs and parameters.kwarg is None:
+            raise EvaluationError(f"unexpected arguments for {function.name}")
+        if parameters.kwarg is not None:
+            local_bindings[parameters.kwarg.arg] = extra_kwargs
+        if any(name not in local_bindings for name in names):
+            raise EvaluationError(f"missing arguments for {function.name}")
+
+        self.active.add(function)
+        self.macros.append(function.name)
+        try:
+            self.exec_block(function.node.body, Frame(function.module, local_bindings))
+        except _Return as result:
+            return result.value
+        finally:
+            self.macros.pop()
+            self.active.discard(function)
+        return None
+
+    def evaluate(self):
+        with open(self.root.path) as f:
+            tree = ast.parse(f.read())
+        try:
+            self.exec_module(tree, self.root)
+        except StepLimitExceeded as e:
+            # keep the targets found so far
+            self.errors.append((0, str(e)))
+        return self.targets
+
+
+def evaluate(build_fname, workspace_root=None):
+    """
+    Returns ({name: Target}, errors) of evaluating 'build_fname', errors are (lineno, message) of the skipped
+    statements of the BUILD file. The result is memoized until the BUILD file, one of the .bzl files it loads or one
+    of the directories it globs changes.
+    """
+    if workspace_root is None:
+        workspace_root = find_workspace_root(build_fname)
+    cached = _build_files.get(build_fname)
+    if cached is not None and _is_current(cached[0]):
+        return cached[1], cached[2]
+    evaluator = Evaluator(workspace_root, build_fname)
+    targets = evaluator.evaluate()
+    _build_files[build_fname] = (evaluator.deps, targets, evaluator.errors)
+    return targets, evaluator.errors
+
+
+def evaluate_build_file(build_fname, workspace_root=None):
+    """
+    Returns {name: Target} of all targets created by evaluating 'build_fname'.
+    """
+    return evaluate(build_fname, workspace_root)[0]
+
+
+def find_target(build_fname, name, workspace_root=None):
+    """
+    Returns the Target 'name' created in 'build_fname' or None.
+    """
+    try:
+        return evaluate_build_file(build_fname, workspace_root).get(name)
+    except (OSError, SyntaxError, EvaluationError, AssertionError):
+        return None
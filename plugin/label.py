@@ -160,7 +160,9 @@ def resolve_filename(fname, workspace_root):
     externals = get_external_directory(workspace_root)
     if fname.startswith(externals):
         repository = os.path.relpath(fname, start=externals).split("/")[0]
-        return _resolve_filename(fname, externals, repository)
+        return _resolve_filename(
+            fname, os.path.join(externals, repository), repository
+        )
     raise Exception(f"{fname} is neither in {workspace_root} nor in {externals}")
 
 
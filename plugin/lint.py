@@ -0,0 +1,332 @@
+"""
+Checks all BUILD and .bzl files of a workspace for labels that don't refer to an existing package, target or file and
+for loaded symbols that are not defined in the loaded .bzl file, without invoking bazel.
+
+Files are checked in parallel worker processes. Targets of a package are the targets of its evaluated BUILD file
+(see evaluator.py), their declared outputs and the files of the package. Labels of external repositories are not
+checked.
+"""
+
+import ast
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from bazel import (
+    LABEL_ATTRIBUTES,
+    parse_file_by_name,
+    collect_targets,
+    collect_loads,
+    is_label_like,
+    is_load_call,
+    is_rule_like,
+)
+from evaluator import evaluate_build_file, flatten
+from label import parse_label, resolve_label_str, resolve_filename
+from crawler import find_starlark_files
+
+# attributes that declare output files of a rule
+OUTPUT_ATTRIBUTES = ["out", "outs"]
+
+# implicit outputs of common rules, e.g. the shared library of a cc_library
+IMPLICIT_OUTPUTS = [
+    "lib{}.a",
+    "lib{}.lo",
+    "lib{}.so",
+    "lib{}.pic.a",
+    "{}.stripped",
+    "{}.dwp",
+    "{}_deploy.jar",
+    "lib{}.jar",
+    "lib{}-src.jar",
+]
+
+BUILTIN_PACKAGES = {"visibility", "conditions"}
+PACKAGE_TARGETS = {"__pkg__", "__subpackages__"}
+WILDCARD_TARGETS = {"all", "*", "all-targets"}
+
+CHUNK_SIZE = 64
+
+
+class Package:
+    def __init__(self, names, prefixes):
+        # names of targets and files of the package
+        self.names = names
+        # names of targets created by macros of external repositories, targets they generate are unknown
+        self.prefixes = prefixes
+
+    def __contains__(self, name):
+        return name in self.names or name.startswith(self.prefixes)
+
+
+# package directory -> Package or None if there is no package
+_packages = {}
+# path of a .bzl file -> top-level names or None if it can't be parsed
+_extensions = {}
+
+
+def _build_file(directory):
+    for name in ["BUILD.bazel", "BUILD"]:
+        candidate = os.path.join(directory, name)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _external_symbols(module, location):
+    """
+    Returns the names of symbols loaded from external repositories other than rules_*.
+    """
+    result = set()
+    for extension_label, alias, _ in collect_loads(module):
+        try:
+            repository = parse_label(extension_label, location).repository
+        except AssertionError:
+            continue
+        if repository and not repository.startswith("rules_"):
+            result.add(alias)
+    return result
+
+
+def _read_package(directory, workspace_root):
+    build_fname = _build_file(directory)
+    if build_fname is None:
+        return None
+    module = parse_file_by_name(build_fname)
+    location = resolve_filename(build_fname, workspace_root)
+    external_symbols = _external_symbols(module, location)
+
+    names = set(name for _, name in collect_targets(module))
+    prefixes = set()
+    targets = evaluate_build_file(build_fname, workspace_root)
+    for name, target in targets.items():
+        names.add(name)
+        names.update(pattern.format(name) for pattern in IMPLICIT_OUTPUTS)
+        for attribute in OUTPUT_ATTRIBUTES:
+            names.update(flatten(target.attributes.get(attribute)))
+        if not is_rule_like(target):
+            prefixes.add(name)
+    # calls of external macros that were skipped by the evaluator
+    for stmt in module.body:
+        if (
+            isinstance(stmt, ast.Expr)
+            and isinstance(stmt.value, ast.Call)
+            and isinstance(stmt.value.func, ast.Name)
+            and stmt.value.func.id in external_symbols
+        ):
+            for kw in stmt.value.keywords:
+                if kw.arg == "name" and isinstance(kw.value, ast.Str):
+                    prefixes.add(kw.value.s)
+    return Package(names, tuple(prefixes))
+
+
+def find_subpackage(directory, target, workspace_root):
+    """
+    Returns the package below 'directory' containing the file 'target', which a label of the package of 'directory'
+    can't refer to, or None.
+    """
+    segments = target.split("/")[:-1]
+    for i in range(len(segments)):
+        subdirectory = os.path.join(directory, *segments[: i + 1])
+        if _build_file(subdirectory) is not None:
+            return os.path.relpath(subdirectory, workspace_root)
+    return None
+
+
+def get_package(directory, workspace_root):
+    if directory not in _packages:
+        try:
+            _packages[directory] = _read_package(directory, workspace_root)
+        except Exception:
+            # a package that can't be read contains anything
+            _packages[directory] = Package(set(), ("",))
+    return _packages[directory]
+
+
+def get_extension_symbols(path):
+    if path not in _extensions:
+        try:
+            _extensions[path] = set(
+                name for _, name in collect_targets(parse_file_by_name(path))
+            )
+        except Exception:
+            _extensions[path] = None
+    return _extensions[path]
+
+
+def _is_checkable(s):
+    # format templates, make variables and shell commands are not labels
+    return s and not any(c in s for c in "{$ \t\n")
+
+
+def collect_label_strings(module, is_build_file):
+    """
+    Yields the Str nodes of 'module' that must be labels. Bare strings are only labels in the attributes of
+    LABEL_ATTRIBUTES of BUILD files.
+    """
+
+    def strings(node, bare):
+        if isinstance(node, ast.Str):
+            if is_label_like(node.s) or bare:
+                yield node
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name) and node.func.id == "glob":
+                # patterns are not labels
+                return
+            for arg in node.args:
+                yield from strings(arg, False)
+            for kw in node.keywords:
+                if kw.arg == "name":
+                    continue
+                yield from strings(
+                    kw.value, is_build_file and kw.arg in LABEL_ATTRIBUTES
+                )
+        elif isinstance(node, ast.Dict):
+            for key in node.keys:
+                if key is not None:
+                    yield from strings(key, False)
+            for value in node.values:
+                yield from strings(value, bare)
+        elif isinstance(node, (ast.List, ast.Tuple, ast.BinOp)):
+            for child in ast.iter_child_nodes(node):
+                yield from strings(child, bare)
+        else:
+            for child in ast.iter_child_nodes(node):
+                yield from strings(child, False)
+
+    for stmt in module.body:
+        # docstrings and loads (see check_loads) are skipped
+        if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Str):
+            continue
+        if is_load_call(stmt):
+            continue
+        yield from strings(stmt, False)
+
+
+def check_label(label_str, location, workspace_root):
+    """
+    Returns a message if the label 'label_str' read in 'location' is dangling, otherwise None.
+    """
+    label = parse_label(label_str, location)
+    if label.repository or label.package in BUILTIN_PACKAGES:
+        return None
+    if label.package.endswith("...") or label.target in WILDCARD_TARGETS:
+        return None
+    directory = os.path.join(workspace_root, label.package)
+    package = get_package(directory, workspace_root)
+    if package is None:
+        return f"package //{label.package} of {label_str} does not exist"
+    if label.target in PACKAGE_TARGETS or label.target in package:
+        return None
+    # files are resolved like loaded .bzl files
+    if os.path.exists(resolve_label_str(label_str, location, workspace_root)):
+        subpackage = find_subpackage(directory, label.target, workspace_root)
+        if subpackage is None:
+            return None
+        return f"{label_str} crosses the boundary of package //{subpackage}"
+    return f"target //{label.package}:{label.target} of {label_str} does not exist"
+
+
+def check_loads(module, location, workspace_root):
+    for stmt in module.body:
+        if not is_load_call(stmt):
+            continue
+        node = stmt.value.args[0]
+        extension_label = node.s
+        try:
+            label = parse_label(extension_label, location)
+            if label.repository:
+                continue
+            path = resolve_label_str(extension_label, location, workspace_root)
+        except AssertionError:
+            yield (node.lineno, node.col_offset, f"invalid label {extension_label!r}")
+            continue
+        symbols = get_extension_symbols(path) if os.path.isfile(path) else None
+        if symbols is None:
+            yield (node.lineno, node.col_offset, f"{extension_label} not found")
+            continue
+        subpackage = find_subpackage(
+            os.path.join(workspace_root, label.package), label.target, workspace_root
+        )
+        if subpackage is not None:
+            message = (
+                f"{extension_label} crosses the boundary of package //{subpackage}"
+            )
+            yield (node.lineno, node.col_offset, message)
+            continue
+        loaded = [arg for arg in stmt.value.args[1:] if isinstance(arg, ast.Str)]
+        loaded += [
+            kw.value for kw in stmt.value.keywords if isinstance(kw.value, ast.Str)
+        ]
+        for symbol in loaded:
+            if symbol.s.startswith("_"):
+                message = f"{symbol.s} is private to {extension_label}"
+            elif symbol.s not in symbols:
+                message = f"{symbol.s} not found in {extension_label}"
+            else:
+                continue
+            yield (symbol.lineno, symbol.col_offset, message)
+
+
+def lint_file(path, workspace_root):
+    """
+    Returns a list of (path, lineno, col_offset, message) of the dangling labels and loaded symbols in 'path'.
+    """
+    try:
+        module = parse_file_by_name(path)
+        location = resolve_filename(path, workspace_root)
+    except SyntaxError as e:
+        return [(path, e.lineno or 1, (e.offset or 1) - 1, f"syntax error: {e.msg}")]
+    except Exception as e:
+        return [(path, 1, 0, str(e))]
+
+    result = [
+        (path, *problem) for problem in check_loads(module, location, workspace_root)
+    ]
+    is_build_file = not path.endswith(".bzl")
+    for node in collect_label_strings(module, is_build_file):
+        # package relative labels of .bzl files refer to the package of the calling BUILD file
+        if not _is_checkable(node.s) or (
+            not is_build_file and not node.s.startswith("//")
+        ):
+            continue
+        try:
+            message = check_label(node.s, location, workspace_root)
+        except AssertionError:
+            message = f"invalid label {node.s!r}"
+        if message is not None:
+            result.append((path, node.lineno, node.col_offset, message))
+    return result
+
+
+def lint_files(paths, workspace_root):
+    result = []
+    for path in paths:
+        result.extend(lint_file(path, workspace_root))
+    return result
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def lint_workspace(workspace_root, jobs=None):
+    """
+    Returns a sorted list of (path, lineno, col_offset, message) of all dangling labels and loaded symbols of the
+    BUILD and .bzl files in 'workspace_root'. 'jobs' is the number of worker processes (default: number of cores).
+    """
+    # packages may have changed since the last run
+    _packages.clear()
+    _extensions.clear()
+    paths = sorted(find_starlark_files(workspace_root))
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    check = partial(lint_files, workspace_root=workspace_root)
+    if jobs <= 1 or len(paths) <= CHUNK_SIZE:
+        result = check(paths)
+    else:
+        result = []
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for problems in executor.map(check, _chunks(paths, CHUNK_SIZE)):
+                result.extend(problems)
+    return sorted(result)
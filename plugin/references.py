@@ -0,0 +1,200 @@
+import ast
+import os.path
+from collections import defaultdict
+from bazel import (
+    parse_module_text,
+    parse_file_by_name,
+    collect_references,
+    collect_loads,
+    find_node,
+    is_load_call,
+)
+from label import parse_label, resolve_filename
+from crawler import find_starlark_files
+from background import BackgroundIndexes
+from workspace import find_workspace_root
+
+
+def symbol_key(extension_label, name):
+    return f"{extension_label}%{name}"
+
+
+def _top_level_definitions(module):
+    definitions = set()
+    for stmt in module.body:
+        if isinstance(stmt, ast.FunctionDef):
+            definitions.add(stmt.name)
+        elif isinstance(stmt, ast.Assign):
+            definitions.update(t.id for t in stmt.targets if isinstance(t, ast.Name))
+    return definitions
+
+
+def _loaded_symbols(module, location):
+    return {
+        alias: symbol_key(parse_label(extension_label, location), name)
+        for extension_label, alias, name in collect_loads(module)
+    }
+
+
+def _resolve_call(name, loaded_symbols, definitions, location):
+    if name in loaded_symbols:
+        return loaded_symbols[name]
+    if name in definitions:
+        return symbol_key(location, name)
+    # builtin rule or function
+    return None
+
+
+class FileReferences:
+    def __init__(self, mtime, labels, symbols):
+        self.mtime = mtime
+        # canonical label -> [(lineno, col_offset)]
+        self.labels = labels
+        # symbol key -> [(lineno, col_offset)]
+        self.symbols = symbols
+
+
+class ReferenceIndex:
+    """
+    Reverse index from labels and loaded symbols to the places in BUILD and .bzl files that use them.
+    """
+
+    def __init__(self, workspace_root):
+        self.workspace_root = workspace_root
+        self.files = {}
+        self.label_files = defaultdict(set)
+        self.symbol_files = defaultdict(set)
+
+    def build(self):
+        for path in find_starlark_files(self.workspace_root):
+            self.update_file(path)
+
+    def remove_file(self, path):
+        old = self.files.pop(path, None)
+        if old is None:
+            return
+        for label in old.labels:
+            self.label_files[label].discard(path)
+        for key in old.symbols:
+            self.symbol_files[key].discard(path)
+
+    def update_file(self, path):
+        if not os.path.exists(path):
+            self.remove_file(path)
+            return
+        mtime = os.path.getmtime(path)
+        old = self.files.get(path)
+        if old is not None and old.mtime == mtime:
+            return
+        self.remove_file(path)
+        try:
+            module = parse_file_by_name(path)
+            location = resolve_filename(path, self.workspace_root)
+        except Exception:
+            # files that don't parse can't reference anything
+            return
+
+        loaded_symbols = _loaded_symbols(module, location)
+        definitions = _top_level_definitions(module)
+        labels = defaultdict(list)
+        symbols = defaultdict(list)
+        is_build_file = not path.endswith(".bzl")
+        for lineno, col_offset, kind, value in collect_references(module, is_build_file):
+            if kind == "label":
+                try:
+                    labels[str(parse_label(value, location))].append((lineno, col_offset))
+                except AssertionError:
+                    continue
+            else:
+                key = _resolve_call(value, loaded_symbols, definitions, location)
+                if key is not None:
+                    symbols[key].append((lineno, col_offset))
+
+        self.files[path] = FileReferences(mtime, labels, symbols)
+        for label in labels:
+            self.label_files[label].add(path)
+        for key in symbols:
+            self.symbol_files[key].add(path)
+
+    def _references(self, files, key, attribute):
+        for path in sorted(files.get(key, ())):
+            for lineno, col_offset in getattr(self.files[path], attribute)[key]:
+                yield (path, lineno, col_offset)
+
+    def find_label_references(self, label):
+        return list(self._references(self.label_files, str(label), "labels"))
+
+    def find_symbol_references(self, key):
+        return list(self._references(self.symbol_files, key, "symbols"))
+
+
+def _create_index(workspace_root):
+    index = ReferenceIndex(workspace_root)
+    index.build()
+    return index
+
+
+_indexes = BackgroundIndexes(_create_index)
+
+
+def get_index(workspace_root, wait=True):
+    """
+    Returns the index of 'workspace_root', the first call builds it. Without 'wait' it is built in the background and
+    None is returned until it is done.
+    """
+    return _indexes.get(workspace_root, wait)
+
+
+def file_changed(fname):
+    _indexes.file_changed(fname)
+
+
+def _symbol_at(module, node, location):
+    for stmt in module.body:
+        if not is_load_call(stmt):
+            continue
+        call = stmt.value
+        if node in call.args[1:]:
+            return symbol_key(parse_label(call.args[0].s, location), node.s)
+        for kw in call.keywords:
+            if node is kw.value:
+                return symbol_key(parse_label(call.args[0].s, location), node.s)
+    return None
+
+
+def _def_at(module, row, location):
+    for stmt in module.body:
+        if isinstance(stmt, ast.FunctionDef) and stmt.lineno == row:
+            return symbol_key(location, stmt.name)
+    return None
+
+
+def find_references_at(fname, text, row, col, workspace_root=None, wait=True):
+    """
+    Returns [(path, lineno, col_offset)] of all references to the label, loaded symbol or top-level function under the cursor.
+    Without 'wait' None is returned while the index is built in the background.
+    """
+    if workspace_root is None:
+        workspace_root = find_workspace_root(fname)
+    index = get_index(workspace_root, wait)
+    if index is None:
+        return None
+    module = parse_module_text(text)
+    location = resolve_filename(fname, workspace_root)
+
+    node = find_node(module, row, col)
+    if isinstance(node, ast.Str):
+        key = _symbol_at(module, node, location)
+        if key is not None:
+            return index.find_symbol_references(key)
+        return index.find_label_references(parse_label(node.s, location))
+    if isinstance(node, ast.Name):
+        key = _resolve_call(
+            node.id,
+            _loaded_symbols(module, location),
+            _top_level_definitions(module),
+            location,
+        )
+        return index.find_symbol_references(key) if key else []
+    key = _def_at(module, row, location)
+    return index.find_symbol_references(key) if key else []
@@ -1,7 +1,10 @@
 import ast
+import re
+from bisect import bisect_right
 from copy import copy
 from functools import total_ordering
-from label import parse_label, resolve_label
+from label import Label, parse_label, resolve_label
+import starlark_cache
 
 
 def first(xs):
@@ -39,6 +42,26 @@ class Cursor:
         return Cursor(row=self.row, col=self.col + cols)
 
 
+class Children:
+    """
+    Child nodes sorted by their start position, the child covering a cursor is found by binary search.
+    Siblings don't overlap, so only the last child starting before the cursor can cover it.
+    """
+
+    def __init__(self, children):
+        self.children = sorted(
+            (child for child in children if child.start is not None),
+            key=lambda child: (child.start.row, child.start.col),
+        )
+        self.starts = [(child.start.row, child.start.col) for child in self.children]
+
+    def find(self, cursor):
+        i = bisect_right(self.starts, (cursor.row, cursor.col)) - 1
+        if i >= 0 and self.children[i].covers(cursor):
+            return self.children[i]
+        return None
+
+
 class Reference:
     def __init__(self, label, cursor):
         self.label = label
@@ -88,6 +111,7 @@ class Environment:
 class File:
     def __init__(self, stmts):
         self.stmts = stmts
+        self.children = Children(stmts)
 
     def covers(self, cursor):
         if not self.stmts:
@@ -96,16 +120,17 @@ class File:
 
     def get_thing_at(self, cursor):
         assert self.covers(cursor)
-        for stmt in self.stmts:
-            if stmt.covers(cursor):
-                return stmt.get_thing_at(cursor)
+        stmt = self.children.find(cursor)
+        if stmt is not None:
+            return stmt.get_thing_at(cursor)
 
 
 class DefStmt:
-    def __init__(self, name, parameters, suite):
+    def __init__(self, name, parameters, suite, reference=None):
         self.name = name
         self.parameters = parameters
         self.suite = suite
+        self.reference = reference
         self.start = start(first([parameters, suite]))
         self.end = end(first([suite, parameters]))
 
@@ -124,6 +149,7 @@ class DefStmt:
 class Parameters:
     def __init__(self, parameters):
         self.parameters = parameters
+        self.children = Children(parameters)
         self.start = start(first(self.parameters))
         self.end = end(first(self.parameters[::-1]))
 
@@ -137,9 +163,9 @@ class Parameters:
 
     def get_thing_at(self, cursor):
         assert self.covers(cursor)
-        for parameter in self.parameters:
-            if parameter.covers(cursor):
-                return parameter.get_thing_at(cursor)
+        parameter = self.children.find(cursor)
+        if parameter is not None:
+            return parameter.get_thing_at(cursor)
 
 
 class VarParameter:
@@ -250,6 +276,7 @@ class ForStmt:
 class Suite:
     def __init__(self, stmts):
         self.stmts = stmts
+        self.children = Children(stmts)
         self.start = start(first(stmts))
         self.end = end(first(stmts[::-1]))
 
@@ -263,9 +290,9 @@ class Suite:
 
     def get_thing_at(self, cursor):
         assert self.covers(cursor)
-        for stmt in self.stmts:
-            if stmt.covers(cursor):
-                return stmt.get_thing_at(cursor)
+        stmt = self.children.find(cursor)
+        if stmt is not None:
+            return stmt.get_thing_at(cursor)
 
 
 class SimpleStmt:
@@ -337,6 +364,7 @@ class ExprStmt:
 class Expression:
     def __init__(self, tests):
         self.tests = tests
+        self.children = Children(tests)
         self.start = start(first(tests))
         self.end = end(first(tests[::-1]))
 
@@ -350,9 +378,9 @@ class Expression:
 
     def get_thing_at(self, cursor):
         assert self.covers(cursor)
-        for argument in self.tests:
-            if argument.covers(cursor):
-                return argument.get_thing_at(cursor)
+        argument = self.children.find(cursor)
+        if argument is not None:
+            return argument.get_thing_at(cursor)
 
 
 class IfExpr:
@@ -472,6 +500,7 @@ class LoadStmt:
 class Arguments:
     def __init__(self, arguments):
         self.arguments = arguments
+        self.children = Children(arguments)
         self.start = start(first(arguments))
         self.end = end(first(arguments[::-1]))
 
@@ -485,9 +514,9 @@ class Arguments:
 
     def get_thing_at(self, cursor):
         assert self.covers(cursor)
-        for argument in self.arguments:
-            if argument.covers(cursor):
-                return argument.get_thing_at(cursor)
+        argument = self.children.find(cursor)
+        if argument is not None:
+            return argument.get_thing_at(cursor)
 
 
 class VarArgExpansion:
@@ -610,6 +639,7 @@ class String:
 class ListExpr:
     def __init__(self, elements):
         self.elements = elements
+        self.children = Children(elements)
         self.start = start(first(elements))
         self.end = end(first(elements[::-1]))
 
@@ -623,9 +653,9 @@ class ListExpr:
 
     def get_thing_at(self, cursor):
         assert self.covers(cursor)
-        for entry in self.elements:
-            if entry.covers(cursor):
-                return entry.get_thing_at(cursor)
+        entry = self.children.find(cursor)
+        if entry is not None:
+            return entry.get_thing_at(cursor)
 
 
 class ForClause:
@@ -718,6 +748,7 @@ class DictEntry:
 class DictExpr:
     def __init__(self, entries):
         self.entries = entries
+        self.children = Children(entries)
         self.start = start(first(entries))
         self.end = end(first(entries[::-1]))
 
@@ -731,9 +762,9 @@ class DictExpr:
 
     def get_thing_at(self, cursor):
         assert self.covers(cursor)
-        for entry in self.entries:
-            if entry.covers(cursor):
-                return entry.get_thing_at(cursor)
+        entry = self.children.find(cursor)
+        if entry is not None:
+            return entry.get_thing_at(cursor)
 
 
 class DictComp:
@@ -744,6 +775,7 @@ class DictComp:
 class TupleExpr:
     def __init__(self, elements):
         self.elements = elements
+        self.children = Children(elements)
         self.start = start(first(elements))
         self.end = end(first(elements[::-1]))
 
@@ -757,9 +789,9 @@ class TupleExpr:
 
     def get_thing_at(self, cursor):
         assert self.covers(cursor)
-        for entry in self.elements:
-            if entry.covers(cursor):
-                return entry.get_thing_at(cursor)
+        entry = self.children.find(cursor)
+        if entry is not None:
+            return entry.get_thing_at(cursor)
 
 
 def create_scope_from_parameters(environment, parameters):
@@ -814,7 +846,8 @@ def parse_suite(stmts, environment):
 def parse_def_stmt(stmt, environment):
     assert isinstance(stmt, ast.FunctionDef)
     scope, parameters = parse_parameters(stmt.args, environment)
-    result = DefStmt(stmt.name, parameters, parse_suite(stmt.body, scope))
+    reference = Reference(environment.label, Cursor(stmt.lineno, stmt.col_offset))
+    result = DefStmt(stmt.name, parameters, parse_suite(stmt.body, scope), reference)
     environment.bindings[stmt.name] = result
     return result
 
@@ -1060,14 +1093,119 @@ def parse_load_keyword(keyword, environment, extension_environment):
     return NamedArgument(keyword.arg, String(keyword.value.s, cursor, environment.bindings[keyword.value.s]))
 
 
+class CachedBindings:
+    """
+    Top-level bindings of a module read from the starlark_cache: every binding is a Reference to its definition.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def __contains__(self, key):
+        return isinstance(key, str) and key in self.table
+
+    def __getitem__(self, key):
+        entry = self.table.get(key) if isinstance(key, str) else None
+        if entry is None:
+            # print(f"undefined binding: {key}")
+            return "undefined"
+        _, kind, label, row, col = entry
+        reference = Reference(
+            parse_label(label, Label(target="BUILD")), Cursor(row, col)
+        )
+        reference.kind = kind
+        return reference
+
+
+def binding_reference(binding):
+    if isinstance(binding, Reference):
+        return getattr(binding, "kind", starlark_cache.KIND_VARIABLE), binding
+    if isinstance(binding, DefStmt) and binding.reference is not None:
+        return starlark_cache.KIND_DEF, binding.reference
+    if isinstance(binding, Identifier) and isinstance(binding.reference(), Reference):
+        return starlark_cache.KIND_VARIABLE, binding.reference()
+    return None
+
+
+def top_level_names(module):
+    names = set()
+    for stmt in module.body:
+        if isinstance(stmt, ast.FunctionDef):
+            names.add(stmt.name)
+        elif isinstance(stmt, (ast.Assign, ast.AugAssign)):
+            targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+            for target in targets:
+                names.update(
+                    node.id for node in ast.walk(target) if isinstance(node, ast.Name)
+                )
+        elif is_load_stmt(stmt):
+            names.update(
+                arg.s for arg in stmt.value.args[1:] if isinstance(arg, ast.Str)
+            )
+            names.update(kw.arg for kw in stmt.value.keywords)
+    return names
+
+
+def serialize_bindings(environment, names):
+    # parameters share the bindings of the module, only keep the top-level names
+    result = []
+    for name, binding in dict.items(environment.bindings):
+        if name not in names:
+            continue
+        kind_reference = binding_reference(binding)
+        if kind_reference is None:
+            # builtins and keywords
+            continue
+        kind, reference = kind_reference
+        cursor = reference.cursor
+        result.append((name, kind, str(reference.label), cursor.row, cursor.col))
+    return result
+
+
+LOAD_PATTERN = re.compile(r"""^load\(\s*["']([^"']+)["']""", re.MULTILINE)
+
+
+def module_key(path, label, workspace_root):
+    labels = {path: label}
+
+    def load_paths(current):
+        with open(current) as f:
+            text = f.read()
+        for load_label_str in LOAD_PATTERN.findall(text):
+            load_label = parse_label(load_label_str, labels[current])
+            load_path = resolve_label(load_label, workspace_root)
+            labels.setdefault(load_path, load_label)
+            yield load_path
+
+    return starlark_cache.module_key(path, load_paths)
+
+
+def load_extension_environment(path, label, workspace_root):
+    """
+    Returns the Environment of the extension at 'path', from the starlark_cache if neither it nor its transitive loads
+    changed.
+    """
+    key = module_key(path, label, workspace_root)
+    table = starlark_cache.load(key)
+    if table is None:
+        module = ast.parse(open(path).read())
+        _, environment = parse_module(module, label, workspace_root)
+        table = starlark_cache.store(
+            key, serialize_bindings(environment, top_level_names(module))
+        )
+    return Environment(
+        label, workspace_root, targets=Targets(), bindings=CachedBindings(table)
+    )
+
+
 def parse_load_arguments(args, keywords, environment):
     assert args
     assert isinstance(args[0], ast.Str)
 
     extension_label = parse_label(args[0].s, environment.label)
     path = resolve_label(extension_label, environment.workspace_root)
-    _, extension_environment = parse_module(
-        ast.parse(open(path).read()), extension_label, environment.workspace_root
+    extension_environment = load_extension_environment(
+        path, extension_label, environment.workspace_root
     )
 
     return Arguments(
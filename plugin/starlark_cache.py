@@ -0,0 +1,263 @@
+"""
+On-disk cache of the top-level bindings of starlark modules, shared between editor sessions.
+
+Every module is stored in its own file named by the content hash of the module and its transitive loads:
+
+    header:  magic "BZLE", format version (u16), number of bindings (u32)
+    offsets: one u32 per binding, sorted by binding name
+    records: name length (u16), name, label length (u16), label, row (u32), col (u32), kind (u8)
+
+Files are mapped with mmap and bindings are looked up with a binary search, so only the pages that are used are read.
+Entries that don't have this structure (e.g. truncated files) are ignored. The least recently used entries are removed
+once the directory exceeds MAX_FILES or MAX_BYTES.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+
+FORMAT_VERSION = 1
+MAGIC = b"BZLE"
+
+KIND_DEF = 0
+KIND_VARIABLE = 1
+
+MAX_FILES = 10000
+MAX_BYTES = 64 * 1024 * 1024
+# the size of the directory is checked by the first store of a session and then after every PRUNE_INTERVAL stores
+PRUNE_INTERVAL = 100
+
+_HEADER = struct.Struct("<4sHI")
+_OFFSET = struct.Struct("<I")
+_LENGTH = struct.Struct("<H")
+_POSITION = struct.Struct("<IIB")
+
+# path -> (mtime_ns, size, digest of the content)
+_content_digests = {}
+# cache key -> BindingTable
+_tables = {}
+_stores = 0
+
+
+def cache_directory():
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(root, "bazel.nvim", f"starlark-v{FORMAT_VERSION}")
+
+
+def content_digest(path):
+    st = os.stat(path)
+    cached = _content_digests.get(path)
+    if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _content_digests[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def module_key(path, load_paths):
+    """
+    Returns the cache key of the module at 'path' whose loads resolve to 'load_paths' (a function returning the paths
+    of the modules loaded by a path).
+    """
+    h = hashlib.sha256()
+    seen = set()
+    pending = [path]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        h.update(current.encode())
+        h.update(content_digest(current).encode())
+        pending.extend(sorted(load_paths(current), reverse=True))
+    return h.hexdigest()
+
+
+def file_key(path):
+    """
+    Returns the cache key of the definitions of the file at 'path' alone, without its loads.
+    """
+    h = hashlib.sha256(b"file\0")
+    h.update(path.encode())
+    h.update(content_digest(path).encode())
+    return h.hexdigest()
+
+
+def encode(bindings):
+    """
+    bindings: list of (name, kind, label, row, col)
+    """
+    records = []
+    for name, kind, label, row, col in sorted(bindings):
+        name_bytes = name.encode()
+        label_bytes = label.encode()
+        records.append(
+            _LENGTH.pack(len(name_bytes))
+            + name_bytes
+            + _LENGTH.pack(len(label_bytes))
+            + label_bytes
+            + _POSITION.pack(row, col, kind)
+        )
+    offset = _HEADER.size + _OFFSET.size * len(records)
+    offsets = []
+    for record in records:
+        offsets.append(_OFFSET.pack(offset))
+        offset += len(record)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(records))
+    return header + b"".join(offsets) + b"".join(records)
+
+
+class BindingTable:
+    """
+    Read-only view of an encoded module, 'buffer' is a bytes-like object (usually a mmap).
+    """
+
+    def __init__(self, buffer):
+        magic, version, count = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("unknown starlark cache format")
+        self.buffer = buffer
+        self.count = count
+        self._validate()
+
+    def _validate(self):
+        # the offsets increase and the last record ends at the end of the buffer
+        end = _HEADER.size + _OFFSET.size * self.count
+        if end > len(self.buffer):
+            raise ValueError("truncated starlark cache entry")
+        for i in range(self.count):
+            offset = self._offset(i)
+            if offset < end:
+                raise ValueError("invalid starlark cache entry")
+            end = offset + 1
+        if self.count:
+            _, end = self._name(self._offset(self.count - 1))
+            (length,) = _LENGTH.unpack_from(self.buffer, end)
+            end += _LENGTH.size + length + _POSITION.size
+        if end != len(self.buffer):
+            raise ValueError("truncated starlark cache entry")
+
+    def _offset(self, i):
+        return _OFFSET.unpack_from(self.buffer, _HEADER.size + _OFFSET.size * i)[0]
+
+    def _name(self, offset):
+        (length,) = _LENGTH.unpack_from(self.buffer, offset)
+        start = offset + _LENGTH.size
+        return bytes(self.buffer[start : start + length]), start + length
+
+    def _record(self, offset):
+        name, offset = self._name(offset)
+        (length,) = _LENGTH.unpack_from(self.buffer, offset)
+        start = offset + _LENGTH.size
+        label = bytes(self.buffer[start : start + length]).decode(errors="replace")
+        row, col, kind = _POSITION.unpack_from(self.buffer, start + length)
+        return name.decode(errors="replace"), kind, label, row, col
+
+    def get(self, name):
+        """
+        Returns (name, kind, label, row, col) of the binding 'name' or None.
+        """
+        key = name.encode()
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            mid_name, _ = self._name(self._offset(mid))
+            if mid_name < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count:
+            offset = self._offset(low)
+            if self._name(offset)[0] == key:
+                return self._record(offset)
+        return None
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self._record(self._offset(i))
+
+
+def _open_table(fname):
+    with open(fname, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    table = BindingTable(buffer)
+    # marks the entry as recently used for prune()
+    os.utime(fname)
+    return table
+
+
+def prune(directory=None):
+    """
+    Removes the least recently used entries until there are at most MAX_FILES entries of at most MAX_BYTES.
+    """
+    directory = directory or cache_directory()
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+    except OSError:
+        return
+    entries.sort()
+    count = len(entries)
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if count <= MAX_FILES and total <= MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        count -= 1
+        total -= size
+
+
+def load(key):
+    """
+    Returns the BindingTable stored for 'key' or None.
+    """
+    if key in _tables:
+        return _tables[key]
+    fname = os.path.join(cache_directory(), key)
+    try:
+        table = _open_table(fname)
+    except (OSError, ValueError, struct.error):
+        # missing or corrupted, it is written again
+        return None
+    _tables[key] = table
+    return table
+
+
+def store(key, bindings):
+    """
+    Writes the bindings of a module and returns them as BindingTable. Failing to write the cache is not an error.
+    """
+    global _stores
+    data = encode(bindings)
+    directory = cache_directory()
+    fname = os.path.join(directory, key)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp_fname = f"{fname}.{os.getpid()}.tmp"
+        with open(tmp_fname, "wb") as f:
+            f.write(data)
+        os.replace(tmp_fname, fname)
+    except OSError:
+        pass
+    if _stores % PRUNE_INTERVAL == 0:
+        prune(directory)
+    _stores += 1
+    table = BindingTable(data)
+    _tables[key] = table
+    return table
@@ -0,0 +1,308 @@
+"""
+Index of the top-level symbols (macros, rules, providers and other variables) of all .bzl files of a workspace and
+its external repositories, searchable by name.
+
+Substring queries of three or more characters are answered from a trigram index of the lower case names, prefixes
+from the sorted names. Shorter queries and fuzzy (subsequence) matches are searched with a regex in all names joined
+into one string, shortest names first, until enough names matched.
+
+The index is built in the background like the other indexes. After changes the search structures are prepared again
+in the background too, the editor searches the previous ones until then.
+"""
+
+import ast
+import heapq
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from background import BackgroundIndexes
+from bazel import parse_file_by_name, collect_targets
+from label import resolve_filename
+from crawler import find_starlark_files
+from workspace import get_external_directory
+
+DEFAULT_LIMIT = 200
+
+
+class Symbol:
+    def __init__(self, name, kind, path, lineno, label):
+        self.name = name
+        # "macro", "rule", "provider", "aspect" or "variable"
+        self.kind = kind
+        self.path = path
+        self.lineno = lineno
+        # label of the .bzl file
+        self.label = label
+
+
+def trigrams(s):
+    return {s[i : i + 3] for i in range(len(s) - 2)}
+
+
+def _kinds(module):
+    """
+    Returns {lineno: kind} of the top-level definitions of 'module'.
+    """
+    result = {}
+    for stmt in module.body:
+        if isinstance(stmt, ast.FunctionDef):
+            result[stmt.lineno] = "macro"
+        elif isinstance(stmt, ast.Assign):
+            kind = "variable"
+            value = stmt.value
+            if isinstance(value, ast.Call) and isinstance(value.func, ast.Name):
+                if value.func.id in ["rule", "provider", "aspect"]:
+                    kind = value.func.id
+            for target in stmt.targets:
+                result[target.lineno] = kind
+    return result
+
+
+def collect_symbols(path, label):
+    module = parse_file_by_name(path)
+    kinds = _kinds(module)
+    return [
+        Symbol(name, kinds.get(lineno, "variable"), path, lineno, label)
+        for lineno, name in collect_targets(module)
+        # private symbols can't be loaded
+        if not name.startswith("_")
+    ]
+
+
+class SearchTable:
+    """
+    Search structures of the symbols of an index at one point in time: lower case names, symbol ids ordered by name
+    length, their position in that order, the names in that order joined by "\n" with their offsets and the sorted
+    names. They are not changed afterwards, so searches can use them while a new table is prepared.
+    """
+
+    def __init__(self, symbols, generation):
+        self.generation = generation
+        self.symbols = symbols
+        lower = [symbol and symbol.name.lower() for symbol in symbols]
+        ids = [i for i, name in enumerate(lower) if name is not None]
+        order = sorted(ids, key=lambda i: (len(lower[i]), lower[i]))
+        rank = [0] * len(lower)
+        offsets = []
+        offset = 0
+        for position, symbol_id in enumerate(order):
+            rank[symbol_id] = position
+            offsets.append(offset)
+            offset += len(lower[symbol_id]) + 1
+        self.lower = lower
+        self.order = order
+        self.rank = rank
+        self.joined = "\n".join(lower[i] for i in order)
+        self.offsets = offsets
+        self.sorted_names = sorted((lower[i], i) for i in ids)
+
+    def prefix_matches(self, query, limit):
+        first = bisect_left(self.sorted_names, (query,))
+        end = bisect_left(self.sorted_names, (query + "\U0010ffff",), first)
+        if end - first > limit:
+            # common prefixes: the names are joined in rank order, so the scan stops after the best ones
+            return self.scan(re.compile("^" + re.escape(query), re.MULTILINE), limit)
+        return [symbol_id for _, symbol_id in self.sorted_names[first:end]]
+
+    def scan(self, pattern, limit):
+        """
+        Returns the ids of the first 'limit' names matching the regex 'pattern', shorter names first.
+        """
+        result = []
+        position = 0
+        while len(result) < limit:
+            match = pattern.search(self.joined, position)
+            if match is None:
+                break
+            i = bisect_right(self.offsets, match.start()) - 1
+            result.append(self.order[i])
+            # continue after the matching name
+            position = self.offsets[i] + len(self.lower[self.order[i]]) + 1
+        return result
+
+    def substring_matches(self, query, limit, postings):
+        if len(query) < 3:
+            return self.scan(re.compile(re.escape(query)), limit)
+        candidates = None
+        for trigram in sorted(trigrams(query), key=lambda t: len(postings.get(t, ()))):
+            posting = postings.get(trigram)
+            if not posting:
+                return []
+            candidates = set(posting) if candidates is None else candidates & posting
+        # the postings may contain symbols added after the table was prepared
+        return [
+            i
+            for i in candidates
+            if i < len(self.lower)
+            and self.lower[i] is not None
+            and query in self.lower[i]
+        ]
+
+    def fuzzy_matches(self, query, limit):
+        # starts with a literal that is searched quickly and doesn't backtrack: every other character of the query is
+        # matched at its first occurrence after the previous one
+        pattern = re.escape(query[0]) + "".join(
+            f"[^\n{re.escape(c)}]*{re.escape(c)}" for c in query[1:]
+        )
+        return self.scan(re.compile(pattern), limit)
+
+
+class SymbolIndex:
+    def __init__(self, workspace_root):
+        self.workspace_root = workspace_root
+        # path -> (mtime, [symbol id])
+        self.files = {}
+        # symbol id -> Symbol, None for removed symbols
+        self.symbols = []
+        # trigram of the lower case name -> {symbol id}
+        self.postings = defaultdict(set)
+        # incremented by every change of the symbols
+        self.generation = 0
+        # SearchTable of the symbols, prepared again after changes
+        self.table = None
+        self.lock = threading.Lock()
+        # thread preparing the table in the background
+        self.preparing = None
+
+    def roots(self):
+        yield self.workspace_root
+        try:
+            external = get_external_directory(self.workspace_root)
+        except Exception:
+            # without bazel only the workspace is indexed
+            return
+        if os.path.isdir(external):
+            yield external
+
+    def build(self):
+        for root in self.roots():
+            for path in find_starlark_files(root):
+                if path.endswith(".bzl"):
+                    self.update_file(path)
+
+    def remove_file(self, path):
+        old = self.files.pop(path, None)
+        if old is None:
+            return
+        for symbol_id in old[1]:
+            for trigram in trigrams(self.symbols[symbol_id].name.lower()):
+                self.postings[trigram].discard(symbol_id)
+            self.symbols[symbol_id] = None
+        self.generation += 1
+
+    def update_file(self, path):
+        if not os.path.exists(path):
+            self.remove_file(path)
+            return
+        mtime = os.path.getmtime(path)
+        old = self.files.get(path)
+        if old is not None and old[0] == mtime:
+            return
+        self.remove_file(path)
+        try:
+            symbols = collect_symbols(
+                path, str(resolve_filename(path, self.workspace_root))
+            )
+        except Exception:
+            # files that don't parse define nothing
+            return
+        ids = []
+        for symbol in symbols:
+            symbol_id = len(self.symbols)
+            self.symbols.append(symbol)
+            for trigram in trigrams(symbol.name.lower()):
+                self.postings[trigram].add(symbol_id)
+            ids.append(symbol_id)
+        self.files[path] = (mtime, ids)
+        self.generation += 1
+
+    def prepare(self):
+        """
+        Returns the SearchTable of the current symbols, prepares it if they changed.
+        """
+        table = self.table
+        if table is not None and table.generation == self.generation:
+            return table
+        # read before the symbols, changes in between are prepared again
+        generation = self.generation
+        table = SearchTable(list(self.symbols), generation)
+        with self.lock:
+            # a table prepared concurrently may be newer
+            if self.table is None or self.table.generation < table.generation:
+                self.table = table
+        return table
+
+    def _prepare_in_background(self):
+        with self.lock:
+            if self.preparing is not None and self.preparing.is_alive():
+                return
+            self.preparing = threading.Thread(target=self.prepare, daemon=True)
+            self.preparing.start()
+
+    def search(self, query, limit=DEFAULT_LIMIT, wait=True):
+        """
+        Returns up to 'limit' Symbols whose names contain 'query' (case insensitive) or, if there are not enough,
+        contain its characters in order. Exact and prefix matches come first, then substring and fuzzy matches,
+        shorter names first. Without 'wait' the search structures are prepared in the background after changes and
+        the previous ones are searched until then.
+        """
+        query = query.lower()
+        if not query:
+            return []
+        table = self.table
+        if wait or table is None:
+            table = self.prepare()
+        elif table.generation != self.generation:
+            self._prepare_in_background()
+        result = []
+        seen = set()
+        for matches in [
+            lambda: table.prefix_matches(query, limit),
+            lambda: table.substring_matches(query, limit + len(seen), self.postings),
+            lambda: table.fuzzy_matches(query, limit + len(seen)),
+        ]:
+            if len(result) >= limit:
+                break
+            candidates = [i for i in matches() if i not in seen]
+            best = heapq.nsmallest(
+                limit - len(result), candidates, key=table.rank.__getitem__
+            )
+            result.extend(best)
+            seen.update(best)
+        return [table.symbols[i] for i in result]
+
+
+def _create_index(workspace_root):
+    index = SymbolIndex(workspace_root)
+    index.build()
+    # the first search doesn't wait for the search structures
+    index.prepare()
+    return index
+
+
+_indexes = BackgroundIndexes(_create_index)
+
+
+def get_index(workspace_root, wait=True):
+    """
+    Returns the index of 'workspace_root', the first call builds it. Without 'wait' it is built in the background and
+    None is returned until it is done.
+    """
+    return _indexes.get(workspace_root, wait)
+
+
+def file_changed(fname):
+    if fname.endswith(".bzl"):
+        _indexes.file_changed(fname)
+
+
+def find_symbols(query, workspace_root, limit=DEFAULT_LIMIT, wait=True):
+    """
+    Returns the Symbols matching 'query'. Without 'wait' None is returned while the index is built in the background.
+    """
+    index = get_index(workspace_root, wait)
+    if index is None:
+        return None
+    return index.search(query, limit, wait)
@@ -1,6 +1,13 @@
-import os.path
+import os
 import subprocess
-import vim
+
+BUILD_FILES = ["BUILD", "BUILD.bazel"]
+WORKSPACE_FILES = ["WORKSPACE", "WORKSPACE.bazel", "MODULE.bazel"]
+
+# executable name or function returning it, see set_bazel_cmd
+_bazel_cmd = None
+# workspace root -> output base
+_output_bases = {}
 
 
 def _find_file(fname, markers):
@@ -20,7 +27,7 @@ def _find_file(fname, markers):
 
 
 def find_build_file(fname):
-    return _find_file(fname, ["BUILD", "BUILD.bazel"])
+    return _find_file(fname, BUILD_FILES)
 
 
 def find_package_root(fname):
@@ -32,15 +39,38 @@ def find_build_name(fname):
 
 
 def find_workspace_root(fname):
-    return os.path.dirname(_find_file(fname, ["WORKSPACE", "WORKSPACE.bazel"]))
+    return os.path.dirname(_find_file(fname, WORKSPACE_FILES))
+
+
+def is_starlark_file(fname):
+    return fname in BUILD_FILES or fname.endswith(".bzl")
+
+
+def set_bazel_cmd(bazel_cmd):
+    """
+    'bazel_cmd': name of the bazel executable or a function returning it (e.g. reading g:bazel_cmd in the editor).
+    """
+    global _bazel_cmd
+    _bazel_cmd = bazel_cmd
+
+
+def get_bazel_cmd():
+    """
+    Returns the executable set with set_bazel_cmd, $BAZEL_CMD or "bazel".
+    """
+    bazel_cmd = _bazel_cmd() if callable(_bazel_cmd) else _bazel_cmd
+    return bazel_cmd or os.environ.get("BAZEL_CMD") or "bazel"
 
 
 def output_base(workspace_root):
-    bazel_cmd = vim.eval("g:bazel_cmd") or "bazel"
+    # the output base of a workspace doesn't change, don't run bazel for every external file
+    if workspace_root in _output_bases:
+        return _output_bases[workspace_root]
     with open(os.devnull, "w") as devnull:
         result = subprocess.check_output(
-            [bazel_cmd, "info", "output_base"], cwd=workspace_root, stderr=devnull
+            [get_bazel_cmd(), "info", "output_base"], cwd=workspace_root, stderr=devnull
         )[:-1].decode("utf-8")
+    _output_bases[workspace_root] = result
     return result
 
 
@@ -0,0 +1,44 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local bep = require("bazel.bep")
+
+local fixtures = vim.fn.fnamemodify(debug.getinfo(1, "S").source:sub(2), ":p:h") .. "/fixtures/bep"
+
+local function read_events()
+	local f = assert(io.open(fixtures .. "/build_events.json", "r"))
+	local content = f:read("*a"):gsub("file://FIXTURES/", "file://" .. fixtures .. "/")
+	f:close()
+	return content
+end
+
+local function texts(result)
+	local result_texts = {}
+	for _, diagnostic in ipairs(result.diagnostics) do
+		table.insert(result_texts, ("%s:%d:%d:%s"):format(diagnostic.filename, diagnostic.lnum, diagnostic.col, diagnostic.type))
+	end
+	return result_texts
+end
+
+describe("bep", function()
+	it("reads the stderr of every failed action once", function()
+		local result = bep.new_result("/work")
+		bep.feed(result, read_events())
+		assert.are.same({
+			"/work/app/lib.cc:3:10:E",
+			"/work/app/lib.cc:7:5:W",
+			"/work/app/util.cc:12:3:E",
+		}, texts(result))
+	end)
+
+	it("handles events split across chunks", function()
+		local result = bep.new_result("/work")
+		local content = read_events()
+		for i = 1, #content, 97 do
+			bep.feed(result, content:sub(i, i + 96))
+		end
+		assert.are.same(3, #result.diagnostics)
+		assert.are.same({ ["//app:lib"] = true, ["//app:util"] = true }, result.failed_targets)
+		assert.is_true(result.finished)
+		assert.is_false(result.success)
+		assert.are.same(1, result.exit_code)
+	end)
+end)
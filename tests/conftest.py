@@ -0,0 +1,39 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plugin")
+)
+
+
+@pytest.fixture(autouse=True)
+def no_bazel(monkeypatch):
+    # the tests don't need bazel, external repositories are not found
+    monkeypatch.setenv("BAZEL_CMD", "false")
+
+
+@pytest.fixture(autouse=True)
+def cache_home(monkeypatch, tmp_path):
+    # the starlark cache is written to a temporary directory
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    """
+    Returns a function writing {workspace relative path: content} into a temporary workspace, it returns the root.
+    """
+    root = tmp_path / "workspace"
+    root.mkdir()
+    (root / "WORKSPACE").write_text("")
+
+    def write(files):
+        for path, content in files.items():
+            target = root / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(content)
+        return str(root)
+
+    return write
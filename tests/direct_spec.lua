@@ -0,0 +1,84 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local direct = require("bazel.direct")
+
+local uv = vim.loop
+
+-- Writes files (path -> mtime in seconds) below a new directory and returns it.
+local function write_workspace(files)
+	local root = vim.fn.tempname()
+	for path, mtime in pairs(files) do
+		local fname = root .. "/" .. path
+		vim.fn.mkdir(vim.fn.fnamemodify(fname, ":h"), "p")
+		vim.fn.writefile({}, fname)
+		uv.fs_utime(fname, mtime, mtime)
+	end
+	return root
+end
+
+describe("direct", function()
+	it("runs executables newer than the files of their package", function()
+		local workspace = write_workspace({
+			["app/BUILD"] = 100,
+			["app/main.cc"] = 100,
+			["app/data/input.txt"] = 100,
+			-- a subpackage and hidden files are not part of the package
+			["app/sub/BUILD"] = 300,
+			["app/sub/sub.cc"] = 300,
+			["app/.hidden"] = 300,
+			["bin/app"] = 200,
+		})
+		local executable = workspace .. "/bin/app"
+		assert.is_true(direct.is_up_to_date(workspace, "//app:app", executable))
+		uv.fs_utime(workspace .. "/app/data/input.txt", 300, 300)
+		assert.is_false(direct.is_up_to_date(workspace, "//app:app", executable))
+		vim.fn.delete(workspace, "rf")
+	end)
+
+	it("doesn't run executables that are missing or not in a package", function()
+		local workspace = write_workspace({ ["app/BUILD"] = 100, ["lib/lib.cc"] = 100, ["bin/app"] = 200 })
+		assert.is_false(direct.is_up_to_date(workspace, "//app:app", workspace .. "/bin/missing"))
+		assert.is_false(direct.is_up_to_date(workspace, "//app:app", workspace .. "/bin"))
+		assert.is_false(direct.is_up_to_date(workspace, "//lib:lib", workspace .. "/bin/app"))
+		assert.is_false(direct.is_up_to_date(workspace, "app", workspace .. "/bin/app"))
+		vim.fn.delete(workspace, "rf")
+	end)
+
+	it("translates test args and drops output flags", function()
+		local args, env = direct.get_args("test", "--test_output=all --test_arg=--verbose --test_arg='a b' --color=yes")
+		assert.are.same({ "--verbose", "a b" }, args)
+		assert.are.same({}, env)
+		args, env = direct.get_args("test", "--test_filter=Suite.*")
+		assert.are.same({}, args)
+		assert.are.same({ TESTBRIDGE_TEST_ONLY = "Suite.*" }, env)
+		assert.are.same({}, (direct.get_args("run", "")))
+	end)
+
+	it("uses bazel for args it can't translate", function()
+		for _, args in ipairs({
+			"--config=debug",
+			"-c opt",
+			"--test_arg=\"quoted\"",
+			"--test_arg='unterminated",
+			"--test_arg=$HOME",
+		}) do
+			assert.is_nil(direct.get_args("test", args), args)
+		end
+		-- test flags of bazel run are passed on by bazel
+		assert.is_nil(direct.get_args("run", "--test_arg=x"))
+	end)
+
+	it("sets up the runfiles environment", function()
+		local runfiles = vim.fn.tempname()
+		vim.fn.mkdir(runfiles .. "/_main", "p")
+		local bazel_info = { workspace = "/work", workspace_name = "my_workspace", runfiles = runfiles }
+		local env = direct.get_env(bazel_info)
+		assert.are.same(runfiles, env.RUNFILES_DIR)
+		assert.are.same(runfiles, env.TEST_SRCDIR)
+		assert.are.same("_main", env.TEST_WORKSPACE)
+		assert.are.same("/work", env.BUILD_WORKSPACE_DIRECTORY)
+		assert.are.same(runfiles .. "/_main", direct.get_cwd(bazel_info))
+		vim.fn.mkdir(runfiles .. "/my_workspace", "p")
+		assert.are.same("my_workspace", direct.get_test_workspace(bazel_info))
+		vim.fn.delete(runfiles, "rf")
+	end)
+end)
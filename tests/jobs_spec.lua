@@ -0,0 +1,67 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local jobs = require("bazel.jobs")
+
+local function with_jobstart(job_id, f)
+	local jobstart = vim.fn.jobstart
+	local notify = vim.notify
+	vim.fn.jobstart = function()
+		return job_id
+	end
+	vim.notify = function() end
+	local ok, err = pcall(f)
+	vim.fn.jobstart = jobstart
+	vim.notify = notify
+	assert(ok, err)
+end
+
+local function submit(workspace, calls, name)
+	return jobs.submit({
+		cmd = "bazel build //:" .. name,
+		command = "build",
+		workspace = workspace,
+		key = workspace .. name,
+		background = true,
+		options = {
+			on_exit = function()
+				table.insert(calls, name .. " exit")
+			end,
+			on_finish = function(job)
+				table.insert(calls, name .. " " .. job.state)
+			end,
+		},
+	})
+end
+
+describe("jobs", function()
+	it("finishes jobs that fail to start", function()
+		local calls = {}
+		with_jobstart(0, function()
+			local job = submit("/failing", calls, "a")
+			assert.are.same("failed", job.state)
+		end)
+		assert.are.same({ "a failed" }, calls)
+	end)
+
+	it("finishes jobs that are cancelled in the queue", function()
+		local calls = {}
+		with_jobstart(1000000, function()
+			local running = submit("/queued", calls, "a")
+			local queued = submit("/queued", calls, "b")
+			assert.are.same("running", running.state)
+			assert.are.same("queued", queued.state)
+			assert.is_true(jobs.cancel(queued.id))
+		end)
+		assert.are.same({ "b cancelled" }, calls)
+	end)
+
+	it("calls on_finish of de-duplicated subscribers", function()
+		local calls = {}
+		with_jobstart(1000001, function()
+			submit("/dedup", calls, "a")
+			local queued = submit("/dedup", calls, "b")
+			assert.are.same(queued, submit("/dedup", calls, "b"))
+			jobs.cancel(queued.id)
+		end)
+		assert.are.same({ "b cancelled", "b cancelled" }, calls)
+	end)
+end)
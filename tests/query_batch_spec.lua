@@ -0,0 +1,86 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local query_batch = require("bazel.query_batch")
+
+local function matches(expression, label, kind)
+	return query_batch.matcher(expression)(label, kind)
+end
+
+describe("query_batch", function()
+	it("matches target patterns locally", function()
+		assert.is_true(matches("//app:lib", "//app:lib", "cc_library rule"))
+		assert.is_false(matches("//app:lib", "//app:lib2", "cc_library rule"))
+		assert.is_true(matches("//app", "//app:app", "cc_binary rule"))
+		assert.is_true(matches("//app:*", "//app:main.cc", "source file"))
+		-- :all only matches rules
+		assert.is_true(matches("//app:all", "//app:lib", "cc_library rule"))
+		assert.is_false(matches("//app:all", "//app:main.cc", "source file"))
+		assert.is_true(matches("//app/...", "@//app/sub:lib", "cc_library rule"))
+		assert.is_false(matches("//app/...", "//application:lib", "cc_library rule"))
+		assert.is_true(matches("//...", "//any/pkg:lib", "cc_library rule"))
+	end)
+
+	it("matches kind expressions with plain words", function()
+		assert.is_true(matches("kind(cc_library, //app:*)", "//app:lib", "cc_library rule"))
+		assert.is_false(matches("kind('cc_library', //app:*)", "//app:test", "cc_test rule"))
+		assert.is_true(matches('kind("^cc_", //app:*)', "//app:test", "cc_test rule"))
+		assert.is_false(matches('kind("^cc_", //app:*)', "//app:lib", "objc_library rule"))
+	end)
+
+	it("doesn't match expressions it can't decide locally", function()
+		for _, expression in ipairs({
+			"deps(//app:lib)",
+			"@repo//app:lib",
+			"//app/...:lib",
+			"//app:lib union //lib:lib",
+			"kind('cc_.*', //app:*)",
+			"kind(cc_library, deps(//app:lib))",
+		}) do
+			assert.is_nil(query_batch.matcher(expression), expression)
+		end
+	end)
+
+	it("splits queries into one union query and single ones", function()
+		local queries = {
+			{ expression = "kind('cc_test', //app:*)" },
+			{ expression = "deps(//app:lib)" },
+			{ expression = "//lib:all" },
+		}
+		local plan = query_batch.plan(queries)
+		assert.are.same('\'kind("cc_test", //app:*) union //lib:all\' --output=label_kind', plan.union)
+		assert.are.same({ queries[2] }, plan.single)
+		assert.are.same(queries[1], plan.batched[1].query)
+		assert.are.same(queries[3], plan.batched[2].query)
+		assert.is_nil(query_batch.plan({ queries[2] }).union)
+	end)
+
+	it("merges the lines of the union query into the results of each query", function()
+		local results = {}
+		local function query(name, expression)
+			return {
+				expression = expression,
+				on_success = function(targets)
+					results[name] = targets
+				end,
+			}
+		end
+		local plan = query_batch.plan({
+			query("tests", "kind(cc_test, //app:*)"),
+			query("app", "//app:*"),
+			query("lib", "//lib:all"),
+			query("nothing", "//other:all"),
+		})
+		query_batch.demultiplex({
+			"cc_test rule //app:test",
+			"cc_library rule //app:lib",
+			"source file //app:main.cc",
+			"cc_library rule //lib:lib",
+			"not a label_kind line",
+		}, plan.batched)
+		assert.are.same({
+			tests = { "//app:test" },
+			app = { "//app:test", "//app:lib", "//app:main.cc" },
+			lib = { "//lib:lib" },
+			nothing = {},
+		}, results)
+	end)
+end)
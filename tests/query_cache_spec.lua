@@ -0,0 +1,96 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local query_cache = require("bazel.query_cache")
+
+local function write_workspace(files)
+	local root = vim.fn.tempname()
+	for path, content in pairs(files) do
+		local fname = root .. "/" .. path
+		vim.fn.mkdir(vim.fn.fnamemodify(fname, ":h"), "p")
+		vim.fn.writefile(vim.split(content, "\n"), fname)
+	end
+	return root
+end
+
+local function fingerprinted_files(workspace, fingerprint)
+	local files = {}
+	for line in fingerprint:gmatch("[^\n]+") do
+		local path = line:match("^(.-):")
+		if path:sub(-1) ~= "/" then
+			table.insert(files, path:sub(#workspace + 2))
+		end
+	end
+	table.sort(files)
+	return files
+end
+
+describe("query_cache", function()
+	it("splits set expressions into their operands", function()
+		assert.are.same({ " //a:x ", " (//b:y ", " //c:z) " }, query_cache.operands("//a:x union (//b:y intersect //c:z)"))
+		assert.are.same({ " //a:* ", " //a:x ", " //a:y " }, query_cache.operands("//a:* - //a:x + //a:y"))
+		-- part of target names
+		assert.are.same({ " //a:x-y+z ", " //a:union " }, query_cache.operands("//a:x-y+z except //a:union"))
+	end)
+
+	it("caches set expressions of package local operands", function()
+		for _, args in ipairs({
+			"app/a.cc",
+			"'attr(srcs,//app:a.cc,//app:*) union attr(hdrs,//app:a.cc,//app:*)'",
+			"'kind(cc_library, //app:*) except //app:foo'",
+			"//app:all intersect //lib:all",
+			"//app:x-y",
+		}) do
+			assert.is_true(query_cache.is_cacheable("query", args), args)
+		end
+	end)
+
+	it("doesn't cache queries that depend on other packages", function()
+		assert.is_false(query_cache.is_cacheable("cquery", "//app:foo"))
+		for _, args in ipairs({
+			"'deps(//app:foo)'",
+			"'//app:* union rdeps(//app:*, //lib:foo)'",
+			"'kind(rule, //app:*) except tests(//lib:all)'",
+			"//app/...",
+			"@repo//:x",
+			"'let x = //app:* in $x'",
+		}) do
+			assert.is_false(query_cache.is_cacheable("query", args), args)
+		end
+	end)
+
+	it("fingerprints the packages of all operands and the files they load", function()
+		local workspace = write_workspace({
+			["app/BUILD"] = 'load("//tools:defs.bzl", "macro")',
+			["app/a.cc"] = "",
+			["lib/BUILD"] = "",
+			["tools/BUILD"] = "",
+			["tools/defs.bzl"] = "",
+		})
+		local fingerprint = query_cache.fingerprint(workspace, "query", "'//app:* union //lib:*'")
+		assert.are.same({ ".bazelrc", "app/BUILD", "lib/BUILD", "tools/defs.bzl" }, fingerprinted_files(workspace, fingerprint))
+		assert.is_nil(query_cache.fingerprint(workspace, "query", "'deps(//app:*)'"))
+		assert.is_nil(query_cache.fingerprint(workspace, "query", "'//nowhere:x'"))
+		vim.fn.delete(workspace, "rf")
+	end)
+
+	it("changes when a subdirectory becomes a package", function()
+		local workspace = write_workspace({ ["app/BUILD"] = "", ["app/sub/a.cc"] = "" })
+		local args = "'attr(srcs, //app:sub/a.cc, //app:*)'"
+		local before = query_cache.fingerprint(workspace, "query", args)
+		assert.are.same(before, query_cache.fingerprint(workspace, "query", args))
+		vim.fn.writefile({}, workspace .. "/app/sub/BUILD")
+		assert.are_not.same(before, query_cache.fingerprint(workspace, "query", args))
+		vim.fn.delete(workspace, "rf")
+	end)
+
+	it("returns cached results until the fingerprint changes", function()
+		local workspace = write_workspace({ ["app/BUILD"] = "" })
+		local args = "//app:*"
+		local key = query_cache.key("query", args, workspace)
+		query_cache.set(key, query_cache.fingerprint(workspace, "query", args), { "//app:a" })
+		assert.are.same({ "//app:a" }, query_cache.get(key, workspace, "query", args))
+		vim.fn.writefile({ 'filegroup(name = "b")' }, workspace .. "/app/BUILD")
+		assert.is_nil(query_cache.get(key, workspace, "query", args))
+		query_cache.clear()
+		vim.fn.delete(workspace, "rf")
+	end)
+end)
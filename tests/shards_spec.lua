@@ -0,0 +1,115 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local shards = require("bazel.shards")
+
+local bazel_info = { workspace = "/work", runfiles = "/nonexistent.runfiles", executable = "/bin/app_test" }
+
+local function testcase(name, failure)
+	if failure == nil then
+		return ('<testcase name="%s" classname="Suite"/>'):format(name)
+	end
+	return ('<testcase name="%s" classname="Suite"><failure message="%s">details</failure></testcase>'):format(
+		name,
+		failure
+	)
+end
+
+-- Runs the shards with a jobstart that writes the test cases of each shard into its test.xml and exits with 1 if
+-- one of them failed. Returns the envs of the shards, the lines of the report and the quickfix items.
+local function run(total, cases_of_shard)
+	local saved = {
+		jobstart = vim.fn.jobstart,
+		setqflist = vim.fn.setqflist,
+		set_lines = vim.api.nvim_buf_set_lines,
+	}
+	local envs = {}
+	local exits = {}
+	local lines = {}
+	local items = nil
+	local success = nil
+	vim.fn.jobstart = function(cmd, opts)
+		local index = tonumber(opts.env.GTEST_SHARD_INDEX)
+		envs[index + 1] = opts.env
+		local cases = cases_of_shard(index)
+		local xml = "<testsuites><testsuite>" .. table.concat(cases, "") .. "</testsuite></testsuites>"
+		vim.fn.writefile({ xml }, opts.env.XML_OUTPUT_FILE)
+		-- jobs exit after all of them started
+		table.insert(exits, function()
+			opts.on_exit(index + 1, table.concat(cases, ""):find("<failure") and 1 or 0)
+		end)
+		return index + 1
+	end
+	vim.fn.setqflist = function(_, _, what)
+		items = what.items
+	end
+	vim.api.nvim_buf_set_lines = function(_, _, _, _, appended)
+		vim.list_extend(lines, appended)
+	end
+	local ok, err = pcall(function()
+		shards.run(bazel_info, {
+			shards = total,
+			on_exit = function(result)
+				success = result
+			end,
+		})
+		for _, exit in ipairs(exits) do
+			exit()
+		end
+	end)
+	vim.fn.jobstart = saved.jobstart
+	vim.fn.setqflist = saved.setqflist
+	vim.api.nvim_buf_set_lines = saved.set_lines
+	pcall(vim.cmd, "bwipeout")
+	assert(ok, err)
+	return envs, lines, items, success
+end
+
+describe("shards", function()
+	it("uses vim.g.bazel_shards as the number of shards", function()
+		vim.g.bazel_shards = 3
+		assert.are.same(3, shards.get_shard_count())
+		vim.g.bazel_shards = nil
+		assert.is_true(shards.get_shard_count() >= 1)
+	end)
+
+	it("assigns every shard its index and output file", function()
+		local envs, lines, items, success = run(3, function(index)
+			return { testcase("Case" .. index) }
+		end)
+		assert.are.same(3, #envs)
+		local files = {}
+		for index, env in ipairs(envs) do
+			assert.are.same(tostring(index - 1), env.GTEST_SHARD_INDEX)
+			assert.are.same(env.GTEST_SHARD_INDEX, env.TEST_SHARD_INDEX)
+			assert.are.same("3", env.GTEST_TOTAL_SHARDS)
+			assert.are.same("3", env.TEST_TOTAL_SHARDS)
+			assert.are.same("xml:" .. env.XML_OUTPUT_FILE, env.GTEST_OUTPUT)
+			assert.are.same(bazel_info.runfiles, env.RUNFILES_DIR)
+			assert.is_nil(files[env.XML_OUTPUT_FILE])
+			files[env.XML_OUTPUT_FILE] = true
+		end
+		assert.are.same({ "", "3 tests in 3 shards, 0 failed" }, lines)
+		assert.are.same({}, items)
+		assert.is_true(success)
+	end)
+
+	it("merges the failures of all shards", function()
+		local envs, lines, items, success = run(2, function(index)
+			if index == 0 then
+				return { testcase("Passes"), testcase("Fails", "app/test.cc:12: expected 1") }
+			end
+			return { testcase("AlsoFails", "wrong") }
+		end)
+		assert.are.same(2, #envs)
+		assert.are.same({
+			"",
+			"3 tests in 2 shards, 2 failed",
+			"shard 1/2 exited with 1",
+			"shard 2/2 exited with 1",
+		}, lines)
+		assert.are.same({
+			{ text = "Suite.Fails: app/test.cc:12: expected 1", type = "E", filename = "/work/app/test.cc", lnum = 12 },
+			{ text = "Suite.AlsoFails: wrong", type = "E" },
+		}, items)
+		assert.is_false(success)
+	end)
+end)
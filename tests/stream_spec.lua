@@ -0,0 +1,54 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local stream = require("bazel.stream")
+
+local function read_lines(chunks)
+	local lines = {}
+	local read = stream.line_reader(function(line)
+		table.insert(lines, line)
+	end)
+	for _, data in ipairs(chunks) do
+		read(data)
+	end
+	return lines
+end
+
+describe("stream", function()
+	it("joins lines split across chunks", function()
+		-- on_stdout gets the lines of a chunk, the first continues the last one of the previous chunk
+		assert.are.same(
+			{ "//app:lib", "//app:test", "//lib:lib" },
+			read_lines({ { "//app:l" }, { "ib", "//app:te" }, { "st", "//lib:lib", "" }, { "" } })
+		)
+	end)
+
+	it("passes on the last line without a newline at the end", function()
+		assert.are.same({ "//a:b", "//c:d" }, read_lines({ { "//a:b", "//c" }, { ":d" }, { "" } }))
+		assert.are.same({}, read_lines({ { "" } }))
+	end)
+
+	it("stops after limit results", function()
+		local bazel_info = {}
+		local results = {}
+		local read = stream.result_reader(bazel_info, function(line)
+			table.insert(results, line)
+		end, 2)
+		read({ "//a:a\r", "", "//a:b" })
+		assert.is_nil(bazel_info.truncated)
+		read({ "", "//a:c", "//a:d" })
+		assert.is_true(bazel_info.truncated)
+		read({ "" })
+		assert.are.same({ "//a:a", "//a:b" }, results)
+	end)
+
+	it("passes on all results without a limit", function()
+		local bazel_info = {}
+		local results = {}
+		local read = stream.result_reader(bazel_info, function(line)
+			table.insert(results, line)
+		end)
+		read({ "//a:a", "//a:b", "" })
+		read({ "" })
+		assert.are.same({ "//a:a", "//a:b" }, results)
+		assert.is_nil(bazel_info.truncated)
+	end)
+end)
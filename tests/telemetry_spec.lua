@@ -0,0 +1,51 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local telemetry = require("bazel.telemetry")
+
+-- Runs f with the records (JSON lines) in a new telemetry file.
+local function with_records(records, f)
+	local path = vim.fn.tempname()
+	vim.fn.writefile(records, path)
+	local get_path = telemetry.get_path
+	telemetry.get_path = function()
+		return path
+	end
+	local ok, err = pcall(f)
+	telemetry.get_path = get_path
+	vim.fn.delete(path)
+	assert(ok, err)
+end
+
+describe("telemetry", function()
+	it("summarizes direct runs apart from bazel invocations", function()
+		with_records({
+			'{"kind":"test","target":"//app:test","exit_ms":3000,"exit_code":0}',
+			'{"kind":"test","target":"//app:test","exit_ms":100,"exit_code":0,"direct":true}',
+			'{"kind":"test","target":"//app:test","exit_ms":4000,"exit_code":1}',
+			'{"kind":"test","target":"//app:test","exit_ms":200,"exit_code":1,"direct":true}',
+			'{"kind":"test","target":"//app:test","state":"cancelled"}',
+			'{"kind":"build","target":"//app:test","exit_ms":1000,"exit_code":0}',
+		}, function()
+			local summary = {}
+			for _, group in ipairs(telemetry.stats()) do
+				table.insert(summary, {
+					group.kind,
+					group.direct,
+					group.count,
+					group.failed,
+					group.cancelled,
+					group.exit.p50,
+					group.exit.p99,
+				})
+			end
+			assert.are.same({
+				{ "build", false, 1, 0, 0, 1000, 1000 },
+				{ "test", false, 3, 1, 1, 3000, 4000 },
+				{ "test", true, 2, 1, 0, 100, 200 },
+			}, summary)
+			local lines = telemetry.get_lines()
+			assert.are.same(4, #lines)
+			assert.is_true(lines[3]:find("^test +bazel ") ~= nil)
+			assert.is_true(lines[4]:find("^test +direct ") ~= nil)
+		end)
+	end)
+end)
@@ -0,0 +1,138 @@
+import io
+import json
+import os
+import pytest
+import bazel_cli
+
+FILES = {
+    "tools/BUILD": "",
+    "tools/defs.bzl": """def my_macro(name):
+    native.filegroup(name = name)
+""",
+    "app/BUILD": """load("//tools:defs.bzl", "my_macro")
+
+my_macro(name = "app")
+
+filegroup(name = "data", srcs = ["//missing:file"])
+""",
+}
+
+
+def run(request):
+    response = bazel_cli.handle(request)
+    # every response can be written as JSON
+    assert json.loads(json.dumps(response)) == response
+    return response
+
+
+def test_definition_and_label(workspace):
+    root = workspace(FILES)
+    fname = os.path.join(root, "app/BUILD")
+    assert run(
+        {"id": 1, "command": "definition", "file": fname, "row": 3, "col": 0}
+    ) == {"id": 1, "result": {"file": os.path.join(root, "tools/defs.bzl"), "line": 1}}
+    assert run({"command": "label", "file": fname, "row": 3, "col": 16}) == {
+        "result": "@//app:app"
+    }
+    # the text of the request instead of the file
+    text = 'filegroup(name = "other")\n'
+    assert run(
+        {"command": "label", "file": fname, "text": text, "row": 1, "col": 17}
+    ) == {"result": "@//app:other"}
+
+
+def test_index(workspace):
+    root = workspace(FILES)
+    result = run({"command": "index", "workspace": root})["result"]
+    assert result["files"] == 3
+    assert set(result) == {"files", "labels", "symbols", "seconds"}
+
+
+def test_lint(workspace):
+    root = workspace(FILES)
+    assert run({"command": "lint", "workspace": root, "jobs": 1}) == {
+        "result": [
+            {
+                "file": os.path.join(root, "app/BUILD"),
+                "line": 5,
+                "col": 33,
+                "message": "package //missing of //missing:file does not exist",
+            }
+        ]
+    }
+
+
+def test_symbols_and_complete(workspace):
+    root = workspace(FILES)
+    assert run({"command": "symbols", "workspace": root, "query": "macro"}) == {
+        "result": [
+            {
+                "name": "my_macro",
+                "kind": "macro",
+                "label": "@//tools:defs.bzl",
+                "file": os.path.join(root, "tools/defs.bzl"),
+                "line": 1,
+            }
+        ]
+    }
+    assert run({"command": "complete", "workspace": root, "prefix": "//app:"}) == {
+        "result": ["//app:app", "//app:data"]
+    }
+    assert run(
+        {
+            "command": "complete",
+            "workspace": root,
+            "prefix": ":d",
+            "file": os.path.join(root, "app/BUILD"),
+        }
+    ) == {"result": [":data"]}
+
+
+@pytest.mark.parametrize(
+    "request_, error",
+    [
+        ({"id": 3, "command": "unknown"}, "Exception: unknown command 'unknown'"),
+        ({"command": "definition", "row": 1, "col": 0}, "KeyError: 'file'"),
+        ({"command": "symbols"}, "KeyError: 'workspace'"),
+    ],
+)
+def test_errors(request_, error):
+    response = run(request_)
+    assert response["error"] == error
+    assert "result" not in response
+    assert response.get("id") == request_.get("id")
+
+
+def test_batch(workspace):
+    root = workspace(FILES)
+    lines = [
+        json.dumps(
+            {"id": 1, "command": "complete", "workspace": root, "prefix": "//t"}
+        ),
+        "",
+        "not json",
+        "[1]",
+        json.dumps({"id": 2, "command": "nothing"}),
+    ]
+    out = io.StringIO()
+    bazel_cli.run_batch(lines, out)
+    responses = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert responses[0] == {"id": 1, "result": ["//tools"]}
+    assert responses[1]["error"].startswith("invalid request: ")
+    assert responses[2] == {"error": "invalid request: request must be a JSON object"}
+    assert responses[3] == {"id": 2, "error": "Exception: unknown command 'nothing'"}
+    assert len(responses) == 4
+
+
+def test_exit_code(workspace, capsys):
+    root = workspace(FILES)
+    assert bazel_cli.main(["complete", root, "//a"]) == 0
+    assert json.loads(capsys.readouterr().out) == {"result": ["//app"]}
+    assert (
+        bazel_cli.main(["definition", os.path.join(root, "nothing/BUILD"), "1", "0"])
+        == 1
+    )
+    assert json.loads(capsys.readouterr().out)["error"].startswith("FileNotFoundError")
+    with pytest.raises(SystemExit) as e:
+        bazel_cli.main(["definition", "BUILD", "row", "0"])
+    assert e.value.code == 2
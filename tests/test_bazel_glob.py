@@ -0,0 +1,52 @@
+import os
+import pytest
+from bazel_glob import glob
+
+
+@pytest.fixture
+def package(workspace):
+    root = workspace(
+        {
+            "pkg/BUILD": "",
+            "pkg/a.cc": "",
+            "pkg/a.h": "",
+            "pkg/dir/b.cc": "",
+            "pkg/dir/deeper/c.cc": "",
+            "pkg/sub/BUILD": "",
+            "pkg/sub/d.cc": "",
+        }
+    )
+    return os.path.join(root, "pkg")
+
+
+def test_star_matches_within_a_segment(package):
+    assert glob(package, ["*.cc"]) == ["a.cc"]
+    assert glob(package, ["*/*.cc"]) == ["dir/b.cc"]
+
+
+def test_double_star_does_not_enter_subpackages(package):
+    assert glob(package, ["**/*.cc"]) == ["a.cc", "dir/b.cc", "dir/deeper/c.cc"]
+
+
+def test_exclude(package):
+    assert glob(package, ["**/*.cc"], exclude=["dir/**"]) == ["a.cc"]
+    assert glob(package, ["**"], exclude=["**/*.cc", "BUILD"]) == ["a.h"]
+
+
+def test_exclude_directories(package):
+    assert glob(package, ["*"]) == ["BUILD", "a.cc", "a.h"]
+    assert glob(package, ["*"], exclude_directories=False) == [
+        "BUILD",
+        "a.cc",
+        "a.h",
+        "dir",
+    ]
+
+
+def test_new_files_are_found(package):
+    visited = set()
+    assert glob(package, ["dir/*.cc"], visited=visited) == ["dir/b.cc"]
+    assert os.path.join(package, "dir") in visited
+    with open(os.path.join(package, "dir", "e.cc"), "w"):
+        pass
+    assert glob(package, ["dir/*.cc"]) == ["dir/b.cc", "dir/e.cc"]
@@ -0,0 +1,67 @@
+import ast
+import contextlib
+import io
+import pytest
+import starlark
+from label import Label
+from starlark import Children, Cursor
+
+
+class Node:
+    def __init__(self, start, end):
+        self.start = start and Cursor(*start)
+        self.end = end and Cursor(*end)
+
+    def covers(self, cursor):
+        if self.start is None:
+            return False
+        return self.start <= cursor and cursor < self.end
+
+
+def linear_find(children, cursor):
+    for child in children:
+        if child.covers(cursor):
+            return child
+    return None
+
+
+def cursors(rows, cols):
+    return [Cursor(row, col) for row in range(rows) for col in range(cols)]
+
+
+@pytest.mark.parametrize(
+    "spans",
+    [
+        [],
+        [((1, 0), (1, 5))],
+        # adjacent, with gaps on a row and between rows
+        [((1, 0), (1, 3)), ((1, 3), (1, 5)), ((1, 7), (2, 2)), ((4, 1), (4, 2))],
+        # without a start, unsorted
+        [((3, 0), (3, 4)), (None, None), ((1, 2), (2, 0)), (None, None)],
+        # empty
+        [((1, 0), (1, 0)), ((1, 1), (1, 4))],
+    ],
+)
+def test_same_child_as_a_linear_scan(spans):
+    children = [Node(start, end) for start, end in spans]
+    found = Children(children)
+    for cursor in cursors(6, 8):
+        assert found.find(cursor) is linear_find(children, cursor), (
+            cursor.row,
+            cursor.col,
+        )
+
+
+def test_elements_of_a_list():
+    text = "x = [\n" + "".join(f'    "e{i}", "f{i}",\n' for i in range(20)) + "]\n"
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, _ = starlark.parse_module(
+            ast.parse(text), Label(package="pkg", target="BUILD"), "/nonexistent"
+        )
+    [stmt] = model.stmts
+    elements = stmt.value.elements
+    children = Children(elements)
+    for cursor in cursors(24, 16):
+        assert children.find(cursor) is linear_find(elements, cursor)
+    assert children.find(Cursor(2, 4)) is elements[0]
+    assert children.find(Cursor(2, 8)) is None
@@ -0,0 +1,157 @@
+import os
+import threading
+import pytest
+import completion
+from completion import LabelIndex
+
+FILES = {
+    "BUILD": 'filegroup(name = "root")\n',
+    "foo/BUILD": 'cc_library(name = "foo")\ncc_library(name = "foo_util")\ncc_test(name = "a_test")\n',
+    "foo/bar/BUILD": 'cc_library(name = "lib")\ncc_test(name = "lib_test")\n',
+    "foo/baz/BUILD": "",
+    "foo/baz/qux/BUILD": "",
+    "food/BUILD": "",
+    "foo/not_a_package/file.txt": "",
+}
+
+
+@pytest.fixture
+def index(workspace):
+    index = LabelIndex(workspace(FILES))
+    index.build()
+    return index
+
+
+def test_packages_shallow_ones_first(index):
+    assert index.complete("//fo") == [
+        "//foo",
+        "//food",
+        "//foo/bar",
+        "//foo/baz",
+        "//foo/baz/qux",
+    ]
+    assert index.complete("//foo/b") == ["//foo/bar", "//foo/baz", "//foo/baz/qux"]
+    assert index.complete("//fo", limit=2) == ["//foo", "//food"]
+    assert index.complete("//foo/n") == []
+
+
+def test_targets(index):
+    # the default target first, then shorter names
+    assert index.complete("//foo:") == ["//foo:foo", "//foo:a_test", "//foo:foo_util"]
+    assert index.complete("//foo/bar:l") == ["//foo/bar:lib", "//foo/bar:lib_test"]
+    assert index.complete(":lib_", "foo/bar") == [":lib_test"]
+    assert index.complete(":r", "") == [":root"]
+    assert index.complete("//nowhere:") == []
+    assert index.complete("@repo//foo") == []
+
+
+def test_targets_of_macros_and_loops(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": """def lib(name):
+    native.cc_library(name = name)
+    native.cc_test(name = name + "_test")
+""",
+            "app/BUILD": """load("//tools:defs.bzl", "lib")
+
+lib(name = "app")
+
+[filegroup(name = "data_%d" % i) for i in range(2)]
+""",
+        }
+    )
+    index = LabelIndex(root)
+    index.build()
+    assert index.complete("//app:") == [
+        "//app:app",
+        "//app:data_0",
+        "//app:data_1",
+        "//app:app_test",
+    ]
+
+
+def test_literal_names_if_the_evaluation_fails(index, monkeypatch):
+    def fail(self):
+        raise RuntimeError("evaluation failed")
+
+    monkeypatch.setattr(completion.Evaluator, "evaluate", fail)
+    path = os.path.join(index.workspace_root, "foo/bar/BUILD")
+    with open(path, "w") as f:
+        f.write('cc_library(name = "lib2")\n')
+    os.utime(path, (0, 0))
+    index.update_file(path)
+    assert index.complete("//foo/bar:") == ["//foo/bar:lib2"]
+
+
+def test_update_file(index):
+    root = index.workspace_root
+    os.makedirs(os.path.join(root, "new/pkg"))
+    with open(os.path.join(root, "new/pkg/BUILD"), "w") as f:
+        f.write('filegroup(name = "n")\n')
+    index.update_file(os.path.join(root, "new/pkg/BUILD"))
+    assert index.complete("//ne") == ["//new/pkg"]
+    assert index.complete("//new/pkg:") == ["//new/pkg:n"]
+
+    os.remove(os.path.join(root, "new/pkg/BUILD"))
+    index.update_file(os.path.join(root, "new/pkg/BUILD"))
+    assert index.complete("//ne") == []
+    assert index.find_node("new") is None
+
+
+def test_targets_of_a_file_that_does_not_parse_are_kept(index):
+    path = os.path.join(index.workspace_root, "foo/bar/BUILD")
+    with open(path, "w") as f:
+        f.write("cc_library(name = \n")
+    os.utime(path, (0, 0))
+    index.update_file(path)
+    assert index.complete("//foo/bar:") == ["//foo/bar:lib", "//foo/bar:lib_test"]
+
+
+def test_ignored_files_are_not_added(workspace):
+    root = workspace(
+        dict(
+            FILES,
+            **{
+                ".bazelignore": "ignored\n",
+                ".bazelrc": "build --deleted_packages=//deleted\n",
+            },
+        )
+    )
+    completion.get_index(root)
+    for package in ["ignored/pkg", "deleted", "node_modules/dep", "added"]:
+        root = workspace({f"{package}/BUILD": 'filegroup(name = "x")\n'})
+        completion.file_changed(os.path.join(root, package, "BUILD"))
+    assert completion.complete_label("//", root, root) == [
+        "//added",
+        "//foo",
+        "//food",
+        "//foo/bar",
+        "//foo/baz",
+        "//foo/baz/qux",
+    ]
+
+
+def test_nothing_is_completed_until_the_index_is_built(workspace, monkeypatch):
+    root = workspace(FILES)
+    fname = os.path.join(root, "foo/BUILD")
+    built = threading.Event()
+    released = threading.Event()
+    create = completion._indexes.create
+
+    def slow_create(workspace_root):
+        index = create(workspace_root)
+        built.set()
+        released.wait()
+        return index
+
+    monkeypatch.setattr(completion._indexes, "create", slow_create)
+    assert completion.complete_label(":", fname, root, wait=False) == []
+    # written after the build read it, applied once the index is done
+    built.wait()
+    root = workspace({"foo/BUILD": 'cc_library(name = "written")\n'})
+    os.utime(fname, (0, 0))
+    completion.file_changed(fname)
+    released.set()
+    completion.get_index(root)
+    assert completion.complete_label(":", fname, root, wait=False) == [":written"]
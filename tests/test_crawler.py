@@ -0,0 +1,88 @@
+import os
+import pytest
+from crawler import find_packages, find_starlark_files, is_ignored
+
+
+@pytest.fixture
+def root(workspace, tmp_path):
+    root = workspace(
+        {
+            "BUILD": "",
+            "a/BUILD": "",
+            "a/defs.bzl": "",
+            "a/b/c/BUILD.bazel": "",
+            "a/not_a_package/file.txt": "",
+            "ignored/pkg/BUILD": "",
+            "deleted/BUILD": "",
+            "deleted/defs.bzl": "",
+            "deleted/sub/BUILD": "",
+            "node_modules/dep/BUILD": "",
+            ".hidden/BUILD": "",
+            ".bazelignore": "# comment\nignored/\n",
+            ".bazelrc": "build --deleted_packages=//deleted,other\n",
+        }
+    )
+    # output base with the convenience symlinks, also with another --symlink_prefix
+    execroot = tmp_path / "output_base" / "execroot" / "_main"
+    (execroot / "pkg").mkdir(parents=True)
+    (execroot / "DO_NOT_BUILD_HERE").write_text(root)
+    (execroot / "pkg" / "BUILD").write_text("")
+    os.symlink(execroot, os.path.join(root, "bazel-workspace"))
+    os.symlink(execroot, os.path.join(root, "out-workspace"))
+    # cycle
+    os.symlink("..", os.path.join(root, "a", "up"))
+    # symlinks to source directories are followed
+    os.symlink(os.path.join(root, "a", "b"), os.path.join(root, "linked"))
+    return root
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_find_packages(root, jobs):
+    assert sorted(find_packages(root, jobs)) == [
+        "",
+        "a",
+        "a/b/c",
+        "deleted/sub",
+        "linked/c",
+    ]
+
+
+def test_find_starlark_files(root):
+    assert sorted(
+        os.path.relpath(path, root) for path in find_starlark_files(root)
+    ) == [
+        "BUILD",
+        "a/BUILD",
+        "a/b/c/BUILD.bazel",
+        "a/defs.bzl",
+        "deleted/defs.bzl",
+        "deleted/sub/BUILD",
+        "linked/c/BUILD.bazel",
+    ]
+
+
+def test_stopping_early(root):
+    packages = find_packages(root)
+    assert next(packages) is not None
+    packages.close()
+
+
+@pytest.mark.parametrize(
+    "path, ignored",
+    [
+        ("BUILD", False),
+        ("a/new/BUILD", False),
+        ("deleted/defs.bzl", False),
+        ("deleted/sub/BUILD", False),
+        ("deleted/BUILD", True),
+        ("ignored/pkg/BUILD", True),
+        ("node_modules/dep/BUILD", True),
+        (".hidden/BUILD", True),
+        ("bazel-workspace/pkg/BUILD", True),
+        ("out-workspace/pkg/BUILD", True),
+        ("a/up/a/BUILD", True),
+        ("../outside/BUILD", True),
+    ],
+)
+def test_is_ignored(root, path, ignored):
+    assert is_ignored(root, os.path.normpath(os.path.join(root, path))) == ignored
@@ -0,0 +1,208 @@
+import pytest
+import evaluator
+from evaluator import MAX_INT_BITS, evaluate
+
+DEFS = """
+def _impl(ctx):
+    pass
+
+my_rule = rule(implementation = _impl)
+
+NAMES = ["x", "y"]
+
+def my_macro(name, srcs = []):
+    native.filegroup(name = name + "_files", srcs = srcs)
+    my_rule(name = name)
+"""
+
+
+def test_targets_of_macros_loops_and_comprehensions(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": DEFS,
+            "pkg/BUILD": """
+load("//tools:defs.bzl", "NAMES", "my_macro")
+
+my_macro(name = "lib", srcs = ["a.cc"])
+
+[filegroup(name = "group_" + n) for n in NAMES]
+""",
+        }
+    )
+    targets, errors = evaluate(f"{root}/pkg/BUILD", root)
+    assert errors == []
+    assert sorted(targets) == ["group_x", "group_y", "lib", "lib_files"]
+    assert targets["lib_files"].kind == "filegroup"
+    assert targets["lib_files"].macros == ["my_macro"]
+    assert targets["lib_files"].attributes["srcs"] == ["a.cc"]
+    assert targets["lib_files"].lineno == 4
+
+
+def test_rule_kind_is_the_bound_name(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": DEFS,
+            "pkg/BUILD": 'load("//tools:defs.bzl", "my_rule")\nmy_rule(name = "a")\n',
+        }
+    )
+    targets, _ = evaluate(f"{root}/pkg/BUILD", root)
+    assert targets["a"].kind == "my_rule"
+
+
+def test_loaded_values_are_frozen(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": DEFS,
+            "pkg/BUILD": """
+load("//tools:defs.bzl", "NAMES")
+NAMES.append("z")
+filegroup(name = "count_%d" % len(NAMES))
+""",
+        }
+    )
+    targets, errors = evaluate(f"{root}/pkg/BUILD", root)
+    assert [lineno for lineno, _ in errors] == [3]
+    assert list(targets) == ["count_2"]
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        '"-".join([S] * 2000)',
+        'S.replace("x", S + "x")',
+        '"{}{}".format(S, S * 999)',
+        '"%s" % (S * 1001)',
+        "S * 1001",
+        "[S] * 1000001",
+        "range(10000000)",
+    ],
+)
+def test_values_are_bounded(workspace, expression):
+    root = workspace({"pkg/BUILD": f"""
+S = "x" * 1000
+big = {expression}
+filegroup(name = "after")
+"""})
+    targets, errors = evaluate(f"{root}/pkg/BUILD", root)
+    assert [lineno for lineno, _ in errors] == [3]
+    assert list(targets) == ["after"]
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "for i in range(26):\n    l.extend(l)",
+        "for i in range(2000):\n    l.append(str(i))",
+        "for i in range(2000):\n    l.insert(0, str(i))",
+        "for i in range(26):\n    l[:0] = l",
+        "for i in range(2000):\n    d[str(i)] = i",
+        "for i in range(2000):\n    d.setdefault(str(i), i)",
+        'for i in range(26):\n    d.update({k + str(i): v for k, v in d.items()})',
+    ],
+)
+def test_mutated_values_are_bounded(workspace, monkeypatch, statement):
+    monkeypatch.setattr(evaluator, "MAX_LENGTH", 1000)
+    root = workspace({"pkg/BUILD": f"""
+l = ["x"]
+d = {{"x": 0}}
+{statement}
+filegroup(name = "after", srcs = l + list(d))
+"""})
+    targets, errors = evaluate(f"{root}/pkg/BUILD", root)
+    assert [lineno for lineno, _ in errors] == [4]
+    assert len(targets["after"].attributes["srcs"]) <= 2000
+
+
+def test_values_stay_bounded_after_errors(workspace, monkeypatch):
+    monkeypatch.setattr(evaluator, "MAX_LENGTH", 1000)
+    root = workspace(
+        {
+            "pkg/BUILD": 'l = ["x"]\n'
+            + "l.extend(l)\n" * 26
+            + 'filegroup(name = "after", srcs = l)\n'
+        }
+    )
+    targets, errors = evaluate(f"{root}/pkg/BUILD", root)
+    # 2 ** 9 elements fit, the statements that would grow the list beyond the limit fail without changing it
+    assert [lineno for lineno, _ in errors] == list(range(11, 28))
+    assert len(targets["after"].attributes["srcs"]) == 512
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "for i in range(30):\n    x = x * x",
+        "for i in range(30):\n    x *= x",
+        "for i in range(2000):\n    x = x << 1",
+        "x = x << 100000000",
+        "x = x ** 100000000",
+        "x = x << -1",
+    ],
+)
+def test_integers_are_bounded(workspace, statement):
+    root = workspace({"pkg/BUILD": f"""
+x = 3
+{statement}
+filegroup(name = "after", tags = [str(x)])
+"""})
+    targets, errors = evaluate(f"{root}/pkg/BUILD", root)
+    assert [lineno for lineno, _ in errors] == [3]
+    assert int(targets["after"].attributes["tags"][0]).bit_length() <= MAX_INT_BITS
+
+
+def test_shifts(workspace):
+    root = workspace(
+        {"pkg/BUILD": 'filegroup(name = "x", tags = [str(1 << 10), str(1024 >> 3)])\n'}
+    )
+    targets, errors = evaluate(f"{root}/pkg/BUILD", root)
+    assert errors == []
+    assert targets["x"].attributes["tags"] == ["1024", "128"]
+
+
+def test_steps_are_bounded(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": """
+def spin(name):
+    native.filegroup(name = name)
+    for i in range(1000):
+        for j in range(1000):
+            for k in range(10):
+                pass
+""",
+            "pkg/BUILD": 'load("//tools:defs.bzl", "spin")\nspin(name = "a")\n',
+        }
+    )
+    targets, errors = evaluate(f"{root}/pkg/BUILD", root)
+    # the targets found before the limit are kept
+    assert list(targets) == ["a"]
+    assert errors
+
+
+def test_glob_in_build_file(workspace):
+    root = workspace(
+        {
+            "pkg/BUILD": 'filegroup(name = "g", srcs = glob(["*.txt"], exclude = ["b.txt"]))\n',
+            "pkg/a.txt": "",
+            "pkg/b.txt": "",
+            "pkg/c.cc": "",
+        }
+    )
+    targets, _ = evaluate(f"{root}/pkg/BUILD", root)
+    assert targets["g"].attributes["srcs"] == ["a.txt"]
+
+
+def test_result_is_recomputed_when_a_loaded_file_changes(workspace):
+    files = {
+        "tools/BUILD": "",
+        "tools/defs.bzl": 'NAME = "old"\n',
+        "pkg/BUILD": 'load("//tools:defs.bzl", "NAME")\nfilegroup(name = NAME)\n',
+    }
+    root = workspace(files)
+    assert list(evaluate(f"{root}/pkg/BUILD", root)[0]) == ["old"]
+    root = workspace({"tools/defs.bzl": 'NAME = "new_name"\n'})
+    assert list(evaluate(f"{root}/pkg/BUILD", root)[0]) == ["new_name"]
@@ -0,0 +1,97 @@
+import ast
+import pytest
+from bazel import find_node, find_token_at, statement_starts
+
+BUILD = '''load("//tools:defs.bzl", "my_macro")
+
+# comment
+genrule(
+    name = "gen",
+    srcs = ["in.txt"],
+    cmd = """
+def not_a_statement():
+    cat $< > $@
+""",
+)
+
+my_macro(name = "last", deps = [":gen"])
+'''
+
+
+def node_token(text, row, col):
+    node = find_node(ast.parse(text), row, col)
+    if isinstance(node, ast.Constant):
+        return ("string", node.value)
+    if isinstance(node, ast.Name):
+        return ("name", node.id)
+    return None
+
+
+def test_statement_starts():
+    assert statement_starts(BUILD) == [1, 4, 13]
+    assert statement_starts("x = 1 + \\\n    2\ny = '''\na\n'''\n") == [1, 3]
+    assert statement_starts("") == []
+
+
+def test_unterminated_strings_and_brackets():
+    # an unterminated single-quoted string ends with its line
+    assert statement_starts('a = "abc\nb = 1\n') == [1, 2]
+    # an unterminated bracket or triple-quoted string continues to the end
+    assert statement_starts("a = [1,\nb = 1\n") == [1]
+    assert statement_starts('a = """\nb = 1\n') == [1]
+    text = 'x = f(\n    "a",\ny = "value"\n'
+    assert find_token_at(text, 2, 6) == ("string", "a")
+    assert find_token_at(text, 3, 0) is None
+    text = 'a = "abc\nb = "value"\n'
+    assert find_token_at(text, 2, 6) == ("string", "value")
+
+
+def test_triple_quoted_strings():
+    # 'def' and newlines inside the string neither start statements nor signatures
+    assert find_token_at(BUILD, 13, 0) == ("name", "my_macro")
+    assert find_token_at(BUILD, 6, 13) == ("string", "in.txt")
+    assert find_token_at(BUILD, 8, 4) is None
+    # the string belongs to the row where it starts
+    assert find_token_at(BUILD, 7, 10) == (
+        "string",
+        "\ndef not_a_statement():\n    cat $< > $@\n",
+    )
+    assert find_token_at(BUILD, 10, 3) is None
+    text = '''def macro(name):
+    """
+    def other(x):
+    """
+    native.filegroup(name = name)
+'''
+    assert statement_starts(text) == [1]
+    assert find_token_at(text, 1, 10) is None
+    assert find_token_at(text, 3, 14) is None
+    assert find_token_at(text, 5, 28) == ("name", "name")
+
+
+@pytest.mark.parametrize(
+    "row, col",
+    [
+        # first token of statements
+        (1, 0),
+        (4, 0),
+        (13, 0),
+        # last token of statements
+        (1, 30),
+        (11, 0),
+        (13, 33),
+        (13, 38),
+        # in the middle
+        (5, 11),
+        (6, 12),
+        (7, 10),
+        (10, 3),
+    ],
+)
+def test_same_as_find_node(row, col):
+    assert find_token_at(BUILD, row, col) == node_token(BUILD, row, col)
+
+
+def test_rows_outside_of_the_text():
+    assert find_token_at(BUILD, 0, 0) is None
+    assert find_token_at(BUILD, 100, 0) is None
@@ -0,0 +1,113 @@
+import pytest
+from lint import lint_workspace
+
+DEFS = """
+def _impl(ctx):
+    pass
+
+my_rule = rule(implementation = _impl)
+_helper = 1
+"""
+
+
+def messages(root, jobs=1):
+    return sorted(
+        (path[len(root) + 1 :], lineno, message)
+        for path, lineno, _, message in lint_workspace(root, jobs)
+    )
+
+
+def test_valid_labels_are_accepted(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": DEFS,
+            "lib/BUILD": 'filegroup(name = "lib", srcs = ["lib.cc"])\n',
+            "lib/lib.cc": "",
+            "app/BUILD": """
+load("//tools:defs.bzl", "my_rule")
+
+genrule(name = "gen", outs = ["gen.h"], cmd = "touch $@")
+
+my_rule(
+    name = "app",
+    srcs = ["main.cc", ":gen.h", "//lib", "//lib:lib.cc", "@external//:x"],
+    copts = ["-Wall", "not_a_file"],
+    tags = ["manual"],
+    visibility = ["//visibility:public", "//lib:__pkg__"],
+)
+""",
+            "app/main.cc": "",
+        }
+    )
+    assert messages(root) == []
+
+
+def test_dangling_labels(workspace):
+    root = workspace({"app/BUILD": """
+filegroup(
+    name = "app",
+    srcs = ["missing.cc", "//nowhere:x", ":gone"],
+)
+"""})
+    assert messages(root) == [
+        ("app/BUILD", 4, "package //nowhere of //nowhere:x does not exist"),
+        ("app/BUILD", 4, "target //app:gone of :gone does not exist"),
+        ("app/BUILD", 4, "target //app:missing.cc of missing.cc does not exist"),
+    ]
+
+
+def test_loaded_symbols(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": DEFS,
+            "app/BUILD": """
+load("//tools:defs.bzl", "my_rule", "nope", "_helper")
+load("//tools:missing.bzl", "x")
+""",
+        }
+    )
+    assert messages(root) == [
+        ("app/BUILD", 2, "_helper is private to //tools:defs.bzl"),
+        ("app/BUILD", 2, "nope not found in //tools:defs.bzl"),
+        ("app/BUILD", 3, "//tools:missing.bzl not found"),
+    ]
+
+
+def test_files_of_subpackages_are_rejected(workspace):
+    root = workspace(
+        {
+            "a/BUILD": """
+load("//a:b/defs.bzl", "X")
+filegroup(name = "f", srcs = ["b/c.cc", "//a:b/c.cc", "d/e.cc"])
+""",
+            "a/b/BUILD": "",
+            "a/b/c.cc": "",
+            "a/b/defs.bzl": "X = 1\n",
+            "a/d/e.cc": "",
+        }
+    )
+    assert messages(root) == [
+        ("a/BUILD", 2, "//a:b/defs.bzl crosses the boundary of package //a/b"),
+        ("a/BUILD", 3, "//a:b/c.cc crosses the boundary of package //a/b"),
+        ("a/BUILD", 3, "b/c.cc crosses the boundary of package //a/b"),
+    ]
+
+
+def test_syntax_errors_are_reported(workspace):
+    root = workspace({"app/BUILD": "filegroup(name = \n"})
+    [(path, _, message)] = messages(root)
+    assert path == "app/BUILD"
+    assert message.startswith("syntax error")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_parallel_result_is_the_same(workspace, jobs):
+    files = {"tools/BUILD": "", "tools/defs.bzl": DEFS}
+    for i in range(100):
+        files[f"p{i}/BUILD"] = f'filegroup(name = "p{i}", srcs = ["//p{i + 1}"])\n'
+    root = workspace(files)
+    assert messages(root, jobs) == [
+        ("p99/BUILD", 1, "package //p100 of //p100 does not exist")
+    ]
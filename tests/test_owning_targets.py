@@ -0,0 +1,74 @@
+import pytest
+from bazel import find_owning_targets
+
+FILES = {
+    "tools/BUILD": "",
+    "tools/defs.bzl": """
+def my_library(name, srcs = [], hdrs = []):
+    native.cc_library(name = name + "_lib", srcs = srcs, hdrs = hdrs)
+    native.cc_test(name = name + "_test", srcs = [name + "_test.cc"], deps = [name + "_lib"])
+""",
+    "app/BUILD": """
+load("//tools:defs.bzl", "my_library")
+
+my_library(name = "foo", srcs = ["a.cc"], hdrs = ["a.h"])
+
+cc_binary(name = "bar", srcs = glob(["*.cc"], exclude = ["a.cc", "*_test.cc"]))
+
+filegroup(name = "all_headers", srcs = glob(["*.h"]))
+""",
+    "app/a.cc": "",
+    "app/a.h": "",
+    "app/b.cc": "",
+    "app/foo_test.cc": "",
+    "app/README.md": "",
+}
+
+
+@pytest.fixture
+def root(workspace):
+    return workspace(FILES)
+
+
+@pytest.mark.parametrize(
+    "path, owners",
+    [
+        # created by a macro
+        ("app/a.cc", ["//app:foo_lib"]),
+        ("app/foo_test.cc", ["//app:foo_test"]),
+        ("app/a.h", ["//app:all_headers", "//app:foo_lib"]),
+        # matched by glob, not excluded
+        ("app/b.cc", ["//app:bar"]),
+        ("app/README.md", []),
+    ],
+)
+def test_owners(root, path, owners):
+    assert find_owning_targets(f"{root}/{path}", root) == owners
+
+
+def test_statements_that_cant_be_evaluated_are_left_to_bazel(workspace):
+    root = workspace(
+        dict(
+            FILES,
+            **{"app/BUILD": FILES["app/BUILD"] + "x = 1 // 0\n"},
+        )
+    )
+    assert find_owning_targets(f"{root}/app/b.cc", root) is None
+
+
+def test_macros_of_external_repositories_are_left_to_bazel(workspace):
+    root = workspace(
+        {
+            "app/BUILD": """
+load("@other//:defs.bzl", "some_macro")
+load("@rules_cc//cc:defs.bzl", "cc_library")
+
+some_macro(name = "m", srcs = ["a.cc"])
+cc_library(name = "l", srcs = ["b.cc"])
+""",
+            "app/a.cc": "",
+            "app/b.cc": "",
+        }
+    )
+    assert find_owning_targets(f"{root}/app/a.cc", root) is None
+    assert find_owning_targets(f"{root}/app/b.cc", root) == ["//app:l"]
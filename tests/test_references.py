@@ -0,0 +1,128 @@
+import os
+import threading
+import pytest
+import references
+from background import BackgroundIndexes
+from label import parse_label, resolve_filename
+from references import ReferenceIndex, find_references_at
+
+FILES = {
+    "tools/BUILD": "",
+    "tools/defs.bzl": """def my_macro(name, srcs = []):
+    native.filegroup(name = name, srcs = srcs)
+
+def other(name):
+    my_macro(name = name)
+
+DEFAULT_SRCS = ["main.cc"]
+""",
+    "app/BUILD": """load("//tools:defs.bzl", "my_macro")
+
+my_macro(
+    name = "app",
+    srcs = ["main.cc", "//lib"],
+    tags = ["main.cc"],
+)
+""",
+    "lib/BUILD": """load("//tools:defs.bzl", macro = "my_macro")
+
+macro(name = "lib", srcs = ["//app:main.cc"])
+""",
+}
+
+
+def references_at(root, path, row, col):
+    with open(os.path.join(root, path)) as f:
+        text = f.read()
+    return [
+        (os.path.relpath(fname, root), lineno, col_offset)
+        for fname, lineno, col_offset in find_references_at(
+            os.path.join(root, path), text, row, col, root
+        )
+    ]
+
+
+def test_macro_references_across_build_and_bzl_files(workspace):
+    root = workspace(FILES)
+    calls = [("app/BUILD", 3, 0), ("lib/BUILD", 3, 0), ("tools/defs.bzl", 5, 4)]
+    # definition, call of an alias and loaded symbol
+    assert references_at(root, "tools/defs.bzl", 1, 5) == calls
+    assert references_at(root, "lib/BUILD", 3, 0) == calls
+    assert references_at(root, "app/BUILD", 1, 27) == calls
+
+
+def test_label_references(workspace):
+    root = workspace(FILES)
+    main = [("app/BUILD", 5, 12), ("lib/BUILD", 3, 28)]
+    assert references_at(root, "app/BUILD", 5, 14) == main
+    assert references_at(root, "lib/BUILD", 3, 30) == main
+    assert references_at(root, "app/BUILD", 5, 25) == [("app/BUILD", 5, 23)]
+
+
+def test_bare_strings_are_only_labels_in_label_attributes_of_build_files(workspace):
+    root = workspace(FILES)
+    index = ReferenceIndex(root)
+    index.build()
+    location = resolve_filename(os.path.join(root, "tools/defs.bzl"), root)
+    # neither tags of the BUILD file nor lists of the .bzl file
+    assert index.find_label_references(parse_label("//app:main.cc", location)) == [
+        (os.path.join(root, "app/BUILD"), 5, 12),
+        (os.path.join(root, "lib/BUILD"), 3, 28),
+    ]
+    assert index.find_label_references(parse_label("main.cc", location)) == []
+
+
+def test_changed_files_update_the_index(workspace):
+    root = workspace(FILES)
+    references.get_index(root)
+    root = workspace({"new/BUILD": 'filegroup(name = "n", srcs = ["//lib"])\n'})
+    references.file_changed(os.path.join(root, "new/BUILD"))
+    assert references_at(root, "app/BUILD", 5, 25) == [
+        ("app/BUILD", 5, 23),
+        ("new/BUILD", 1, 30),
+    ]
+    os.remove(os.path.join(root, "app/BUILD"))
+    references.file_changed(os.path.join(root, "app/BUILD"))
+    assert references_at(root, "lib/BUILD", 3, 30) == [("lib/BUILD", 3, 28)]
+
+
+def test_nothing_is_returned_until_the_index_is_built(workspace, monkeypatch):
+    root = workspace(FILES)
+    released = threading.Event()
+    create = references._indexes.create
+
+    def slow_create(workspace_root):
+        released.wait()
+        return create(workspace_root)
+
+    monkeypatch.setattr(references._indexes, "create", slow_create)
+    with open(os.path.join(root, "app/BUILD")) as f:
+        text = f.read()
+    fname = os.path.join(root, "app/BUILD")
+    assert find_references_at(fname, text, 5, 14, root, wait=False) is None
+    released.set()
+    assert len(find_references_at(fname, text, 5, 14, root)) == 2
+
+
+def test_failed_builds_are_retried_after_a_change(workspace):
+    root = workspace({})
+    calls = []
+
+    def create(workspace_root):
+        calls.append(workspace_root)
+        if len(calls) == 1:
+            raise OSError("failed")
+        return "index"
+
+    indexes = BackgroundIndexes(create)
+    with pytest.raises(OSError):
+        indexes.get(root)
+    assert indexes.get(root, wait=False) is None
+    assert indexes.get(root, wait=False) is None
+    assert len(calls) == 1
+    # changes outside of the workspace don't retry it
+    indexes.file_changed(root + "_other/BUILD")
+    assert indexes.get(root, wait=False) is None
+    indexes.file_changed(os.path.join(root, "BUILD"))
+    assert indexes.get(root) == "index"
+    assert len(calls) == 2
@@ -0,0 +1,110 @@
+-- Run with: nvim --headless -c "PlenaryBustedDirectory tests"
+local test_parser = require("bazel.test_parser")
+local gtest = require("bazel.gtest")
+local pytest = require("bazel.pytest")
+
+-- Rows are 0-based like the definitions of test_parser.get_test_definitions.
+local definitions = {
+	[1] = {
+		{ type = "TEST", suite = "Suite", name = "Plain", start_row = 0, end_row = 3 },
+		{ type = "TEST_P", suite = "Param", name = "Case", start_row = 5, end_row = 8 },
+		{ type = "TYPED_TEST", suite = "Typed", name = "Case", start_row = 10, end_row = 12 },
+		-- the same filter twice
+		{ type = "TEST", suite = "Suite", name = "Plain", start_row = 14, end_row = 15 },
+	},
+	[2] = {
+		{ namespace = "TestClass", name = "test_method", start_row = 2, end_row = 4 },
+		{ name = "test_function", start_row = 6, end_row = 7 },
+	},
+}
+
+-- Runs f with the test definitions above instead of the ones parsed from buffer bufnr.
+local function with_definitions(bufnr, f)
+	local saved = {
+		bufnr = vim.fn.bufnr,
+		getqflist = vim.fn.getqflist,
+		bufload = vim.fn.bufload,
+		bo = vim.bo,
+		get_query = vim.treesitter.query.get,
+		get_test_definitions = test_parser.get_test_definitions,
+	}
+	vim.fn.bufnr = function()
+		return bufnr
+	end
+	vim.fn.bufload = function() end
+	vim.bo = { [1] = { filetype = "cpp" }, [2] = { filetype = "python" } }
+	vim.treesitter.query.get = function(lang)
+		return lang
+	end
+	test_parser.get_test_definitions = function(buffer)
+		return definitions[buffer]
+	end
+	local ok, err = pcall(f)
+	vim.fn.bufnr = saved.bufnr
+	vim.fn.getqflist = saved.getqflist
+	vim.fn.bufload = saved.bufload
+	vim.bo = saved.bo
+	vim.treesitter.query.get = saved.get_query
+	test_parser.get_test_definitions = saved.get_test_definitions
+	assert(ok, err)
+end
+
+describe("test selection", function()
+	it("selects the tests intersecting a range", function()
+		with_definitions(1, function()
+			local rows = function(first, last)
+				local result = {}
+				for _, definition in ipairs(test_parser.get_test_definitions_in_range(1, "cpp", first, last)) do
+					table.insert(result, definition.start_row)
+				end
+				return result
+			end
+			assert.are.same({ 0, 5 }, rows(3, 5))
+			assert.are.same({ 5 }, rows(6, 7))
+			assert.are.same({}, rows(4, 4))
+			assert.are.same({ 0, 5, 10, 14 }, rows(0, 100))
+		end)
+	end)
+
+	it("combines gtest filters with the wildcards of parameterized and typed tests", function()
+		with_definitions(1, function()
+			assert.are.same({ "--gtest_filter=Suite.Plain:*Param.Case*" }, gtest.get_gtest_filter_args_for_range(4, 6))
+			assert.are.same(
+				{ "--gtest_filter=Suite.Plain:*Param.Case*:*Typed*Case" },
+				gtest.get_gtest_filter_args_for_buffer()
+			)
+			local ok, err = pcall(gtest.get_gtest_filter_args_for_range, 5, 5)
+			assert.is_false(ok)
+			assert.is_true(err:find("No tests found") ~= nil)
+		end)
+	end)
+
+	it("combines pytest filters into one -k expression", function()
+		with_definitions(2, function()
+			assert.are.same({ "-k", "TestClass and test_method" }, pytest.get_test_filter_args_for_range(3, 3))
+			assert.are.same(
+				{ "-k", "(TestClass and test_method) or (test_function)" },
+				pytest.get_test_filter_args_for_buffer()
+			)
+		end)
+	end)
+
+	it("selects the tests of the quickfix list entries of a language", function()
+		with_definitions(1, function()
+			vim.fn.getqflist = function()
+				return {
+					{ bufnr = 1, lnum = 2, valid = 1 },
+					{ bufnr = 1, lnum = 3, valid = 1 },
+					{ bufnr = 1, lnum = 12, valid = 1 },
+					-- not valid, not in a test or another language
+					{ bufnr = 1, lnum = 7, valid = 0 },
+					{ bufnr = 1, lnum = 5, valid = 1 },
+					{ bufnr = 2, lnum = 3, valid = 1 },
+					{ bufnr = 0, lnum = 1, valid = 1 },
+				}
+			end
+			assert.are.same({ "--gtest_filter=Suite.Plain:*Typed*Case" }, gtest.get_gtest_filter_args_for_qflist())
+			assert.are.same({ "-k", "TestClass and test_method" }, pytest.get_test_filter_args_for_qflist())
+		end)
+	end)
+end)
@@ -0,0 +1,123 @@
+import os
+import pytest
+import starlark
+import starlark_cache
+from bazel import collect_file_targets, collect_targets, find_symbol, parse_file_by_name
+from label import Label
+
+FILES = {
+    "tools/BUILD": "",
+    "tools/base.bzl": """
+def base_macro(name):
+    pass
+
+BASE = 1
+""",
+    "tools/defs.bzl": """
+load(":base.bzl", "base_macro", "BASE")
+
+def my_macro(name):
+    base_macro(name = name)
+
+VALUE = 2
+""",
+    "app/BUILD": 'load("//tools:defs.bzl", "my_macro")\n',
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    # every lookup goes to the cache directory like in a new session
+    starlark_cache._tables.clear()
+    yield
+    starlark_cache._tables.clear()
+
+
+def entries(cache_home):
+    directory = os.path.join(cache_home, "bazel.nvim", "starlark-v1")
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+def extension_bindings(root):
+    path = os.path.join(root, "tools/defs.bzl")
+    environment = starlark.load_extension_environment(
+        path, Label(package="tools", target="defs.bzl"), root
+    )
+    return list(environment.bindings.table)
+
+
+def test_cold_and_warm_parses_give_the_same_bindings(workspace, monkeypatch):
+    root = workspace(FILES)
+    cold = extension_bindings(root)
+    assert [name for name, *_ in cold] == ["BASE", "VALUE", "base_macro", "my_macro"]
+    starlark_cache._tables.clear()
+
+    def no_parse(*args):
+        raise AssertionError("parsed again")
+
+    monkeypatch.setattr(starlark, "parse_module", no_parse)
+    assert extension_bindings(root) == cold
+
+
+def test_changed_loads_are_parsed_again(workspace):
+    root = workspace(FILES)
+    cold = extension_bindings(root)
+    workspace({"tools/base.bzl": "\n\n" + FILES["tools/base.bzl"]})
+    os.utime(os.path.join(root, "tools/base.bzl"), (0, 0))
+    changed = extension_bindings(root)
+    assert changed != cold
+    assert dict((name, row) for name, _, _, row, _ in changed)["base_macro"] == 4
+
+
+def test_file_targets_come_from_the_cache(workspace, monkeypatch, cache_home):
+    root = workspace(FILES)
+    path = os.path.join(root, "tools/defs.bzl")
+    expected = sorted(collect_targets(parse_file_by_name(path)))
+    assert sorted(collect_file_targets(path)) == expected
+    assert len(entries(cache_home)) == 1
+    starlark_cache._tables.clear()
+    monkeypatch.setattr(starlark_cache, "store", None)
+    assert sorted(collect_file_targets(path)) == expected
+    assert find_symbol("my_macro", os.path.join(root, "app/BUILD"), root) == (path, 4)
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda data: b"",
+        lambda data: b"garbage" * 10,
+        lambda data: data[:-3],
+        lambda data: data[:20],
+        lambda data: data + b"\0",
+        lambda data: data[:6] + b"\xff\xff\xff\x7f" + data[10:],
+    ],
+)
+def test_corrupted_entries_are_ignored(workspace, cache_home, corrupt):
+    root = workspace(FILES)
+    path = os.path.join(root, "tools/defs.bzl")
+    expected = collect_file_targets(path)
+    [key] = entries(cache_home)
+    fname = os.path.join(cache_home, "bazel.nvim", "starlark-v1", key)
+    with open(fname, "rb") as f:
+        data = f.read()
+    with open(fname, "wb") as f:
+        f.write(corrupt(data))
+    starlark_cache._tables.clear()
+    assert starlark_cache.load(key) is None
+    assert collect_file_targets(path) == expected
+    # written again
+    starlark_cache._tables.clear()
+    assert list(starlark_cache.load(key)) == list(starlark_cache.BindingTable(data))
+
+
+def test_least_recently_used_entries_are_removed(workspace, cache_home, monkeypatch):
+    monkeypatch.setattr(starlark_cache, "MAX_FILES", 3)
+    for i in range(5):
+        starlark_cache.store(f"key{i}", [("name", 0, "//:x", i, 0)])
+        path = os.path.join(cache_home, "bazel.nvim", "starlark-v1", f"key{i}")
+        os.utime(path, (i, i))
+    starlark_cache._tables.clear()
+    # used recently
+    assert starlark_cache.load("key0") is not None
+    starlark_cache.prune()
+    assert entries(cache_home) == ["key0", "key3", "key4"]
@@ -0,0 +1,138 @@
+import os
+import threading
+import symbols
+from symbols import SymbolIndex
+
+DEFS = """
+def _impl(ctx):
+    pass
+
+def my_macro(name):
+    native.filegroup(name = name)
+
+my_rule = rule(implementation = _impl)
+MyInfo = provider(fields = ["value"])
+my_aspect = aspect(implementation = _impl)
+MY_CONSTANT = 1
+_private = 2
+"""
+
+
+def search(index, query, limit=10):
+    return [(symbol.name, symbol.kind) for symbol in index.search(query, limit)]
+
+
+def build(root):
+    index = SymbolIndex(root)
+    index.build()
+    return index
+
+
+def test_kinds_and_locations(workspace):
+    root = workspace({"tools/BUILD": "", "tools/defs.bzl": DEFS})
+    [symbol] = build(root).search("my_rule", 1)
+    assert (symbol.kind, symbol.path, symbol.lineno) == (
+        "rule",
+        os.path.join(root, "tools/defs.bzl"),
+        8,
+    )
+    assert symbol.label.endswith("//tools:defs.bzl")
+    assert sorted(search(build(root), "m", 10)) == [
+        ("MY_CONSTANT", "variable"),
+        ("MyInfo", "provider"),
+        ("my_aspect", "aspect"),
+        ("my_macro", "macro"),
+        ("my_rule", "rule"),
+    ]
+
+
+def test_private_symbols_are_not_indexed(workspace):
+    root = workspace({"tools/BUILD": "", "tools/defs.bzl": DEFS})
+    assert search(build(root), "private") == []
+    assert search(build(root), "impl") == []
+
+
+def test_prefix_before_substring_before_fuzzy(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": "proto_rule = 1\ncc_proto = 2\nplain_rotor = 3\n",
+        }
+    )
+    assert [name for name, _ in search(build(root), "proto")] == [
+        "proto_rule",
+        "cc_proto",
+        "plain_rotor",
+    ]
+
+
+def test_search_is_case_insensitive(workspace):
+    root = workspace({"tools/BUILD": "", "tools/defs.bzl": DEFS})
+    assert search(build(root), "myinfo") == [("MyInfo", "provider")]
+
+
+def test_limit(workspace):
+    root = workspace(
+        {
+            "tools/BUILD": "",
+            "tools/defs.bzl": "".join(f"sym_{i} = {i}\n" for i in range(100)),
+        }
+    )
+    index = build(root)
+    assert [name for name, _ in search(index, "sym", 7)] == [
+        f"sym_{i}" for i in range(7)
+    ]
+    assert [name for name, _ in search(index, "sym_9", 3)] == [
+        "sym_9",
+        "sym_90",
+        "sym_91",
+    ]
+
+
+def test_changed_files_update_the_index(workspace):
+    root = workspace({"tools/BUILD": "", "tools/defs.bzl": DEFS})
+    index = symbols.get_index(root)
+    root = workspace(
+        {
+            "tools/more.bzl": "new_macro = 1\n",
+            "node_modules/x/defs.bzl": "ignored = 1\n",
+        }
+    )
+    symbols.file_changed(os.path.join(root, "tools/more.bzl"))
+    symbols.file_changed(os.path.join(root, "node_modules/x/defs.bzl"))
+    assert search(index, "new_macro") == [("new_macro", "variable")]
+    assert search(index, "ignored") == []
+    os.remove(os.path.join(root, "tools/defs.bzl"))
+    symbols.file_changed(os.path.join(root, "tools/defs.bzl"))
+    assert search(index, "my_rule") == []
+
+
+def test_nothing_is_returned_until_the_index_is_built(workspace, monkeypatch):
+    root = workspace({"tools/BUILD": "", "tools/defs.bzl": DEFS})
+    released = threading.Event()
+    create = symbols._indexes.create
+
+    def slow_create(workspace_root):
+        released.wait()
+        return create(workspace_root)
+
+    monkeypatch.setattr(symbols._indexes, "create", slow_create)
+    assert symbols.find_symbols("my_rule", root, wait=False) is None
+    released.set()
+    [symbol] = symbols.find_symbols("my_rule", root)
+    assert symbol.name == "my_rule"
+
+
+def test_changes_are_prepared_in_the_background(workspace):
+    root = workspace({"tools/BUILD": "", "tools/defs.bzl": DEFS})
+    index = build(root)
+    index.prepare()
+    root = workspace({"tools/more.bzl": "my_new_macro = 1\n"})
+    index.update_file(os.path.join(root, "tools/more.bzl"))
+    # the previous search structures are searched until the new ones are prepared
+    assert [s.name for s in index.search("my_new", wait=False)] == []
+    index.preparing.join()
+    assert [s.name for s in index.search("my_new", wait=False)] == ["my_new_macro"]
+    os.remove(os.path.join(root, "tools/more.bzl"))
+    index.update_file(os.path.join(root, "tools/more.bzl"))
+    assert search(index, "my_new") == []